@@ -4,11 +4,11 @@
 """
 豆瓣评分预测系统启动脚本
 这个脚本用于启动豆瓣评分预测系统，可以在任何支持Python的平台上运行。
+应用程序在当前解释器中运行（不再启动第二个Python进程），模块和模型在后台加载。
 """
 
 import os
 import sys
-import subprocess
 
 def main():
     """主函数，启动豆瓣评分预测系统"""
@@ -30,12 +30,19 @@ def main():
         return
     
     try:
-        # 使用Python解释器运行app.py
-        # -u 参数禁用输出缓冲
-        # -X utf8 参数设置UTF-8编码
-        subprocess.run([sys.executable, "-u", "-X", "utf8", app_path], check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"错误：程序运行失败，错误代码 {e.returncode}")
+        # 行缓冲输出并使用UTF-8编码（代替启动子进程时的 -u 和 -X utf8 参数）
+        for stream in (sys.stdout, sys.stderr):
+            if hasattr(stream, "reconfigure"):
+                stream.reconfigure(encoding="utf-8", line_buffering=True)
+        
+        # 在当前解释器中运行app.py
+        if current_dir not in sys.path:
+            sys.path.insert(0, current_dir)
+        from src import app
+        app.main()
+    except SystemExit as e:
+        if e.code:
+            print(f"错误：程序运行失败，错误代码 {e.code}")
     except KeyboardInterrupt:
         print("\n程序被用户中断")
     except Exception as e:
@@ -1,16 +1,15 @@
-import pandas as pd
-import numpy as np
 import os
 import sys
 import datetime
-import json
 import locale
 import io
+import threading
 from colorama import init, Fore, Back, Style
 
 # 添加项目根目录到路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from src.load_models import load_models, predict_with_ensemble
+# numpy、pandas、sklearn和模型都由BackgroundLoader在后台线程中加载，
+# 导入本模块时只导入标准库和colorama，菜单可以立即显示
 
 # 初始化colorama，设置自动重置和转换ANSI颜色
 init(autoreset=True, convert=True)
@@ -42,6 +41,80 @@ else:
         except:
             pass
 
+class BackgroundLoader:
+    """
+    后台加载器：在用户浏览菜单、填写影视作品信息时导入重量级模块并加载模型
+
+    分两个阶段完成，主线程只等待自己需要的阶段：
+    - modules_ready: numpy、pandas和特征相关模块已导入
+    - models_ready: 模型已加载（包括融合模型）
+    """
+
+    def __init__(self, models_dir="models"):
+        """
+        参数:
+        models_dir: 保存模型的目录路径
+        """
+        self.models_dir = models_dir
+        self.modules_ready = threading.Event()
+        self.models_ready = threading.Event()
+        self.error = None
+        self._thread = None
+
+    def start(self):
+        """启动后台线程（重复调用无效）"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="background-loader", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            import numpy
+            import pandas
+            from src.features import get_vectorizer
+            from src.feature_schema import load_feature_schema
+            load_feature_schema()
+            self.modules_ready.set()
+
+            from src.model_registry import get_models
+            # 访问融合模型会加载所有成员并完成融合，第一次预测不需要再等待
+            get_models(self.models_dir).get("fused")
+
+            # 相似作品索引（用于在预测结果中展示看过的相似作品）
+            from src.similarity import get_similarity_index
+            get_similarity_index()
+        except Exception as e:
+            # 记录错误，主线程重新导入或加载时会得到同样的异常并按原有方式处理
+            self.error = e
+        finally:
+            self.modules_ready.set()
+            self.models_ready.set()
+
+    def wait_modules(self):
+        """等待模块导入完成（后台线程未启动时直接返回）"""
+        if self._thread is not None:
+            self.modules_ready.wait()
+
+    def wait_models(self):
+        """等待模型加载完成（后台线程未启动时直接返回）"""
+        if self._thread is not None:
+            self.models_ready.wait()
+
+# 进程内共享的后台加载器，由main()启动
+_loader = BackgroundLoader()
+
+# 预测结果缓存（只使用内存层），重复查询同一部作品时不再调用模型
+_prediction_cache = None
+
+def get_prediction_cache():
+    """获取进程内共享的预测结果缓存"""
+    global _prediction_cache
+    if _prediction_cache is None:
+        from src.prediction_cache import PredictionCache
+        _prediction_cache = PredictionCache(max_size=1000)
+    return _prediction_cache
+
 def clear_screen():
     """清除控制台屏幕"""
     os.system('cls' if os.name == 'nt' else 'clear')
@@ -56,15 +129,14 @@ def print_header():
 
 def load_region_and_genre_options():
     """加载可用的地区和类型选项"""
+    _loader.wait_modules()
+    from src.feature_schema import load_feature_schema
+    
     try:
-        # 读取第一条数据，获取所有可能的地区和类型选项
-        with open("data/onehot_encoded_data.json", "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if data and len(data) > 0:
-                first_item = data[0]
-                regions = [col.replace("region_", "") for col in first_item.keys() if col.startswith("region_")]
-                genres = [col.replace("genre_", "") for col in first_item.keys() if col.startswith("genre_")]
-                return regions, genres
+        # 从特征schema清单中读取所有可能的地区和类型选项
+        schema = load_feature_schema()
+        if schema["regions"] or schema["genres"]:
+            return list(schema["regions"]), list(schema["genres"])
     except Exception as e:
         print(f"{Fore.RED}加载地区和类型选项时出错: {e}{Style.RESET_ALL}")
     
@@ -200,159 +272,53 @@ def get_user_input():
     
     return movie_data
 
-def prepare_features(movie_data):
-    """准备模型所需的特征"""
-    # 创建一行数据
-    df = pd.DataFrame([movie_data])
-    
-    # 处理时间特征
-    df['watch_time'] = pd.to_datetime(df['watch_time'])
-    df['watch_year'] = df['watch_time'].dt.year
-    df['watch_quarter'] = df['watch_time'].dt.quarter
-    
-    # 处理标题长度
-    df['title_length'] = df['title'].str.split().str.len()
-    
-    # 处理导演和演员数量
-    df['director_count'] = df['director'].apply(len)
-    df['cast_count'] = df['cast'].apply(len)
-    
-    # 处理缺失的豆瓣评分
-    if df['douban_score'].iloc[0] is None:
-        # 使用默认值7.5（或者从数据中计算平均值）
-        df['douban_score'] = 7.5
-    
-    # 尝试直接加载特征名称
+def load_feature_names():
+    """获取训练时的特征名称顺序"""
+    _loader.wait_models()
+    from src.model_registry import get_models
+    from src.feature_schema import load_feature_schema
+    from src.features import BASIC_FEATURES
+    
+    # 优先使用模型中保存的特征名称
+    feature_names = get_models().get("feature_names")
+    if feature_names and isinstance(feature_names, list):
+        return feature_names
+    
+    # 如果没有特征名称文件，则从特征schema清单中获取特征顺序
     try:
-        print(f"{Fore.CYAN}尝试加载特征名称文件...{Style.RESET_ALL}")
-        import joblib
-        feature_names = joblib.load("models/feature_names.joblib")
-        
-        if feature_names and isinstance(feature_names, list):
-            print(f"{Fore.GREEN}成功加载特征名称，共{len(feature_names)}个特征{Style.RESET_ALL}")
-            
-            # 确保基本特征存在
-            basic_features = ['douban_score', 'year', 'watch_year', 'watch_quarter', 
-                             'title_length', 'director_count', 'cast_count']
-            for feature in basic_features:
-                if feature not in df.columns:
-                    print(f"{Fore.YELLOW}添加缺失的基本特征: {feature}{Style.RESET_ALL}")
-                    df[feature] = 0
-            
-            # 处理地区和类型特征
-            for col in feature_names:
-                if col.startswith('region_'):
-                    region = col.replace('region_', '')
-                    # 设置默认值为0
-                    df[col] = 0
-                    # 如果该地区在用户选择的地区中，设置为1
-                    if region in movie_data['region']:
-                        df[col] = 1
-                        
-                elif col.startswith('genre_'):
-                    genre = col.replace('genre_', '')
-                    # 设置默认值为0
-                    df[col] = 0
-                    # 如果该类型在用户选择的类型中，设置为1
-                    if genre in movie_data['genre']:
-                        df[col] = 1
-            
-            # 确保所有特征都存在，并按照特征名称文件中的顺序排列
-            for col in feature_names:
-                if col not in df.columns:
-                    df[col] = 0
-            
-            # 打印当前特征列表
-            print(f"{Fore.CYAN}当前特征列表: {list(df.columns)[:10]}...等{len(df.columns)}个{Style.RESET_ALL}")
-            
-            # 返回按照特征名称文件中的顺序排列的特征
-            return df[feature_names]
-    except Exception as e:
-        print(f"{Fore.YELLOW}加载特征名称文件失败: {e}，将使用默认特征处理方式{Style.RESET_ALL}")
-    
-    # 如果无法加载特征名称文件，则尝试从训练数据中获取特征顺序
-    try:
-        print(f"{Fore.CYAN}尝试从训练数据获取特征顺序...{Style.RESET_ALL}")
-        # 加载训练数据的第一行，只是为了获取特征顺序
-        with open("data/onehot_encoded_data.json", "r", encoding="utf-8") as f:
-            train_data = json.load(f)
-            if train_data and len(train_data) > 0:
-                # 获取第一行数据的所有特征名
-                first_item = train_data[0]
-                # 获取所有可能的特征列名（排除非特征列）
-                all_feature_cols = [col for col in first_item.keys() if col not in ['title', 'watch_time', 'director', 'cast', 'user_score']]
-                
-                print(f"{Fore.GREEN}成功从训练数据获取特征顺序，共{len(all_feature_cols)}个特征{Style.RESET_ALL}")
-                
-                # 确保基本特征存在
-                basic_features = ['douban_score', 'year', 'watch_year', 'watch_quarter', 
-                                 'title_length', 'director_count', 'cast_count']
-                for feature in basic_features:
-                    if feature not in df.columns:
-                        print(f"{Fore.YELLOW}添加缺失的基本特征: {feature}{Style.RESET_ALL}")
-                        df[feature] = 0
-                
-                # 处理地区和类型特征
-                for col in all_feature_cols:
-                    if col.startswith('region_'):
-                        region = col.replace('region_', '')
-                        # 设置默认值为0
-                        df[col] = 0
-                        # 如果该地区在用户选择的地区中，设置为1
-                        if region in movie_data['region']:
-                            df[col] = 1
-                            
-                    elif col.startswith('genre_'):
-                        genre = col.replace('genre_', '')
-                        # 设置默认值为0
-                        df[col] = 0
-                        # 如果该类型在用户选择的类型中，设置为1
-                        if genre in movie_data['genre']:
-                            df[col] = 1
-                
-                # 确保所有特征都存在
-                for col in all_feature_cols:
-                    if col not in df.columns:
-                        df[col] = 0
-                
-                # 返回按照训练数据中相同顺序的特征
-                return df[all_feature_cols]
+        feature_names = list(load_feature_schema()["feature_names"])
+        if feature_names:
+            return feature_names
     except Exception as e:
-        print(f"{Fore.YELLOW}无法从训练数据获取特征顺序: {e}，将使用默认特征处理方式{Style.RESET_ALL}")
+        print(f"{Fore.YELLOW}无法从特征schema获取特征顺序: {e}，将使用默认特征处理方式{Style.RESET_ALL}")
     
-    # 如果以上方法都失败，则使用默认的特征处理方式
+    # 如果以上方法都失败，则使用默认的地区和类型选项
     print(f"{Fore.YELLOW}使用默认特征处理方式{Style.RESET_ALL}")
-    
-    # One-hot编码地区和类型
     regions, genres = load_region_and_genre_options()
+    return (BASIC_FEATURES[:2] + [f"region_{r}" for r in regions] +
+            [f"genre_{g}" for g in genres] + BASIC_FEATURES[2:])
+
+def prepare_features(movie_data):
+    """准备模型所需的特征"""
+    from src.features import DEFAULT_DOUBAN_SCORE, get_vectorizer
     
-    # 为每个地区和类型创建特征列，并设置默认值为0
-    for region in regions:
-        df[f'region_{region}'] = 0
-    
-    for genre in genres:
-        df[f'genre_{genre}'] = 0
-    
-    # 设置选中的地区和类型为1
-    for region in movie_data['region']:
-        if f'region_{region}' in df.columns:
-            df[f'region_{region}'] = 1
-    
-    for genre in movie_data['genre']:
-        if f'genre_{genre}' in df.columns:
-            df[f'genre_{genre}'] = 1
-    
-    # 确定特征列
-    feature_columns = [col for col in df.columns if col not in ['title', 'watch_time', 'director', 'cast', 'region', 'genre']]
+    feature_names = load_feature_names()
     
-    return df[feature_columns]
+    # 缺失的豆瓣评分使用默认值
+    vectorizer = get_vectorizer(feature_names, default_douban_score=DEFAULT_DOUBAN_SCORE)
+    return vectorizer.transform_frame([movie_data])
 
 def predict_rating(movie_data):
     """预测评分"""
+    from src.instrumentation import logger
+    
     try:
-        # 加载模型
-        print(f"{Fore.CYAN}加载模型...{Style.RESET_ALL}")
-        models = load_models()
+        # 获取模型（通常已在后台加载完成，同一进程内只从磁盘加载一次）
+        logger.info(f"{Fore.CYAN}加载模型...{Style.RESET_ALL}")
+        _loader.wait_models()
+        import numpy as np
+        from src.model_registry import get_models
+        models = get_models()
         
         # 检查是否成功加载了模型
         if not models:
@@ -360,38 +326,20 @@ def predict_rating(movie_data):
             return None
         
         # 打印加载的模型信息
-        print(f"{Fore.CYAN}已加载的模型:{Style.RESET_ALL}")
-        for model_name in models:
-            print(f"  - {model_name}")
+        logger.info("%s已加载的模型:%s\n%s", Fore.CYAN, Style.RESET_ALL,
+                    "\n".join(f"  - {model_name}" for model_name in models))
         
         # 准备特征
-        print(f"{Fore.CYAN}准备特征...{Style.RESET_ALL}")
+        logger.info(f"{Fore.CYAN}准备特征...{Style.RESET_ALL}")
         features = prepare_features(movie_data)
         
         # 打印特征信息
-        print(f"{Fore.CYAN}特征数量: {len(features.columns)}{Style.RESET_ALL}")
-        print(f"{Fore.CYAN}前10个特征: {list(features.columns)[:10]}{Style.RESET_ALL}")
-        
-        # 如果有feature_names，检查特征是否匹配
-        if "feature_names" in models and isinstance(models["feature_names"], list):
-            feature_names = models["feature_names"]
-            print(f"{Fore.CYAN}模型特征数量: {len(feature_names)}{Style.RESET_ALL}")
-            print(f"{Fore.CYAN}模型前10个特征: {feature_names[:10]}{Style.RESET_ALL}")
-            
-            # 检查特征是否一致
-            missing_features = [f for f in feature_names if f not in features.columns]
-            if missing_features:
-                print(f"{Fore.YELLOW}警告: 缺少以下特征: {missing_features}{Style.RESET_ALL}")
-                # 添加缺失的特征
-                for feature in missing_features:
-                    features[feature] = 0
-            
-            # 重排特征顺序
-            features = features[feature_names]
+        logger.info("%s特征数量: %d%s", Fore.CYAN, len(features.columns), Style.RESET_ALL)
+        logger.debug("%s前10个特征: %s%s", Fore.CYAN, list(features.columns)[:10], Style.RESET_ALL)
         
         # 预测评分
-        print(f"{Fore.CYAN}预测评分中...{Style.RESET_ALL}")
-        prediction = predict_with_ensemble(features, models)
+        logger.info(f"{Fore.CYAN}预测评分中...{Style.RESET_ALL}")
+        prediction = get_prediction_cache().predict(features, models)
         
         # 将numpy数组转换为标量
         if isinstance(prediction, np.ndarray):
@@ -405,7 +353,18 @@ def predict_rating(movie_data):
         traceback.print_exc()
         return None
 
-def display_result(movie_data, predicted_score):
+def find_similar_titles(movie_data, n=3):
+    """查找看过的作品中最相似的n部，作为预测结果的参考"""
+    _loader.wait_models()
+    from src.similarity import get_similarity_index
+    
+    try:
+        return get_similarity_index().query(movie_data, n, exclude_titles={movie_data.get('title')})
+    except Exception as e:
+        print(f"{Fore.YELLOW}查找相似作品时出错: {e}{Style.RESET_ALL}")
+        return []
+
+def display_result(movie_data, predicted_score, similar=None):
     """显示预测结果"""
     print_header()
     print(f"{Fore.GREEN}【预测结果】{Style.RESET_ALL}")
@@ -450,12 +409,27 @@ def display_result(movie_data, predicted_score):
             comment = "可能不太推荐，除非你对这类作品特别感兴趣。"
         
         print(f"{Fore.WHITE}评价: {Style.RESET_ALL}{comment}")
+        
+        # 看过的相似作品及当时的评分
+        if similar:
+            print(f"{Fore.YELLOW}{'-'*60}{Style.RESET_ALL}")
+            print(f"{Fore.WHITE}你看过的相似作品:{Style.RESET_ALL}")
+            for item in similar:
+                shared = "、".join(token for tokens in item['shared'].values() for token in tokens)
+                print(f"  {item['title']}  你的评分: {item['user_score']}  (相同: {shared})")
     else:
         print(f"{Fore.RED}预测失败，请检查输入数据或重试。{Style.RESET_ALL}")
     
     print(f"{Fore.YELLOW}{'='*60}{Style.RESET_ALL}")
 
 def main():
+    # 交互模式下显示预测过程的提示信息（批量预测和HTTP服务默认不显示）
+    from src.instrumentation import configure_logging
+    configure_logging("INFO")
+    
+    # 显示菜单的同时在后台导入模块、加载模型
+    _loader.start()
+    
     while True:
         print_header()
         print(f"{Fore.CYAN}欢迎使用豆瓣评分预测系统！{Style.RESET_ALL}")
@@ -476,7 +450,7 @@ def main():
             predicted_score = predict_rating(movie_data)
             
             # 显示结果
-            display_result(movie_data, predicted_score)
+            display_result(movie_data, predicted_score, find_similar_titles(movie_data))
             
             input(f"\n{Fore.CYAN}按回车键继续...{Style.RESET_ALL}")
         
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+批量预测
+以流的方式读取JSONL、CSV或JSON格式的影视作品记录（与cleaned_data.json格式相同），
+按固定大小分块构建特征并预测，预测结果同样以流的方式写入输出文件，内存占用与输入大小无关
+
+用法:
+python src/batch_predict.py data/cleaned_data.json -o predictions.jsonl --chunk-size 1024
+python src/batch_predict.py data/cleaned_data.json --cache-db models/prediction_cache.sqlite
+python src/batch_predict.py data/cleaned_data.json --metrics metrics.json    输出各阶段耗时（.prom为Prometheus格式）
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import re
+import sys
+import time
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.load_models import predict_with_ensemble
+from src.model_registry import get_models
+from src.features import DEFAULT_DOUBAN_SCORE, get_vectorizer
+from src.parallel_predict import ExecutionConfig
+from src.prediction_cache import PredictionCache
+from src.instrumentation import configure_logging, instrumentation
+
+# CSV中以列表形式保存的字段
+LIST_FIELDS = ['region', 'genre', 'director', 'cast']
+
+def detect_format(path):
+    """根据文件扩展名判断格式：jsonl、csv或json"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    if ext == '.csv':
+        return 'csv'
+    return 'json'
+
+def _iter_jsonl(f):
+    """逐行读取JSONL"""
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+_WHITESPACE = re.compile(r'[\s,]*')
+
+def _iter_json_array(f, buffer_size=1 << 16):
+    """
+    流式读取JSON数组，每次只解析缓冲区中的完整元素，
+    不会把整个文件读入内存
+    """
+    decoder = json.JSONDecoder()
+    buffer = f.read(buffer_size).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError("JSON文件必须是记录数组")
+    pos = 1
+    eof = False
+
+    while True:
+        # 跳过空白和元素之间的逗号
+        pos = _WHITESPACE.match(buffer, pos).end()
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+
+        try:
+            if pos >= len(buffer):
+                raise json.JSONDecodeError("缓冲区为空", buffer, pos)
+            record, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # 元素不完整：丢弃已解析部分并读入更多数据
+            chunk = f.read(buffer_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+
+        yield record
+
+def parse_list_field(value):
+    """
+    解析CSV中的列表字段
+
+    参数:
+    value: JSON数组字符串（如'["美国", "英国"]'）或以/、|、逗号分隔的字符串
+
+    返回:
+    列表
+    """
+    if value is None:
+        return []
+    value = value.strip()
+    if not value:
+        return []
+    if value.startswith('['):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            value = value.strip('[]')
+    return [item.strip().strip('\'"') for item in re.split(r'[/|,，]', value) if item.strip()]
+
+def _iter_csv(f):
+    """逐行读取CSV，并把列表字段解析为列表"""
+    for row in csv.DictReader(f):
+        for field in LIST_FIELDS:
+            if field in row:
+                row[field] = parse_list_field(row[field])
+        for key, value in row.items():
+            if value == '':
+                row[key] = None
+        yield row
+
+def iter_records(path, fmt=None):
+    """
+    以流的方式读取影视作品记录
+
+    参数:
+    path: 输入文件路径
+    fmt: 文件格式（jsonl、csv或json），None表示根据扩展名判断
+
+    返回:
+    记录字典的生成器
+    """
+    fmt = fmt or detect_format(path)
+    newline = '' if fmt == 'csv' else None
+    with open(path, 'r', encoding='utf-8-sig', newline=newline) as f:
+        if fmt == 'jsonl':
+            yield from _iter_jsonl(f)
+        elif fmt == 'csv':
+            yield from _iter_csv(f)
+        elif fmt == 'json':
+            yield from _iter_json_array(f)
+        else:
+            raise ValueError(f"不支持的文件格式: {fmt}")
+
+def iter_chunks(records, chunk_size):
+    """把记录流切分为固定大小的块"""
+    iterator = iter(records)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+class PredictionWriter:
+    """把预测结果以JSONL或CSV格式逐块写入文件"""
+
+    def __init__(self, path, fmt=None):
+        self.fmt = fmt or ('csv' if detect_format(path) == 'csv' else 'jsonl')
+        self.file = open(path, 'w', encoding='utf-8', newline='' if self.fmt == 'csv' else None)
+        self.writer = None
+        if self.fmt == 'csv':
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(['title', 'watch_time', 'predicted_score'])
+
+    def write(self, records, predictions):
+        """写入一块记录及其预测评分"""
+        if self.fmt == 'csv':
+            self.writer.writerows(
+                (record.get('title'), record.get('watch_time'), round(float(score), 4))
+                for record, score in zip(records, predictions)
+            )
+        else:
+            self.file.writelines(
+                json.dumps({'title': record.get('title'),
+                            'watch_time': record.get('watch_time'),
+                            'predicted_score': round(float(score), 4)},
+                           ensure_ascii=False, default=str) + '\n'
+                for record, score in zip(records, predictions)
+            )
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def batch_predict(input_path, output_path, chunk_size=1024, input_format=None,
+                  output_format=None, models_dir="models", execution=None, cache=None):
+    """
+    批量预测并把结果写入文件
+
+    参数:
+    input_path: 输入文件路径（JSONL、CSV或JSON）
+    output_path: 输出文件路径（.csv输出CSV，其余输出JSONL）
+    chunk_size: 每块的记录数
+    input_format: 输入格式，None表示根据扩展名判断
+    output_format: 输出格式（jsonl或csv），None表示根据扩展名判断
+    models_dir: 保存模型的目录路径
+    execution: ExecutionConfig并行配置，None表示串行
+    cache: PredictionCache实例，None表示不缓存
+
+    返回:
+    统计信息字典，包含rows、seconds和rows_per_second
+    """
+    models = get_models(models_dir)
+    feature_names = models.get("feature_names")
+    if not feature_names:
+        raise ValueError("缺少特征名称文件，请先运行 save_feature_names.py")
+    vectorizer = get_vectorizer(feature_names, default_douban_score=DEFAULT_DOUBAN_SCORE)
+    # 模型包的成员在第一次使用时才加载，先加载再开始计时，吞吐量只包含特征构建和预测
+    for name in models:
+        models[name]
+
+    rows = 0
+    start = time.perf_counter()
+    with PredictionWriter(output_path, output_format) as writer:
+        for chunk in iter_chunks(iter_records(input_path, input_format), chunk_size):
+            X = vectorizer.transform(chunk)
+            if cache is not None:
+                predictions = cache.predict(X, models, execution=execution)
+            else:
+                predictions = predict_with_ensemble(X, models, execution)
+            if predictions is None:
+                raise RuntimeError("预测失败")
+            writer.write(chunk, predictions)
+            rows += len(chunk)
+    seconds = time.perf_counter() - start
+
+    return {
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds if seconds > 0 else float('inf'),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="批量预测影视作品评分")
+    parser.add_argument("input", help="输入文件（JSONL、CSV或JSON数组）")
+    parser.add_argument("-o", "--output", default="predictions.jsonl", help="输出文件（.csv或.jsonl）")
+    parser.add_argument("--chunk-size", type=int, default=1024, help="每块的记录数")
+    parser.add_argument("--input-format", choices=['jsonl', 'csv', 'json'], help="输入格式，默认根据扩展名判断")
+    parser.add_argument("--output-format", choices=['jsonl', 'csv'], help="输出格式，默认根据扩展名判断")
+    parser.add_argument("--models-dir", default="models", help="模型目录")
+    parser.add_argument("--threads", type=int, default=1, help="线程数（大块时并行计算各模型和各组树），0表示CPU核心数")
+    parser.add_argument("--processes", type=int, default=1, help="进程数（超大块时按行拆分），0表示CPU核心数")
+    parser.add_argument("--cache-db", default=None, help="预测结果的磁盘缓存文件（SQLite），重复运行时跳过已预测的记录")
+    parser.add_argument("--metrics", default=None, help="开启分阶段计时并保存到该文件（.prom为Prometheus格式，其余为JSON）")
+    parser.add_argument("--log-level", default="WARNING", help="预测过程提示信息的日志级别（如INFO、WARNING）")
+    args = parser.parse_args()
+
+    configure_logging(args.log_level)
+    if args.metrics:
+        instrumentation.enabled = True
+
+    execution = None
+    if args.threads != 1 or args.processes != 1:
+        execution = ExecutionConfig(threads=args.threads or None, processes=args.processes or None,
+                                    models_dir=args.models_dir)
+
+    cache = PredictionCache(db_path=args.cache_db) if args.cache_db else None
+    stats = batch_predict(args.input, args.output, args.chunk_size, args.input_format,
+                          args.output_format, args.models_dir, execution, cache)
+
+    print(f"预测完成: {stats['rows']} 条记录，耗时 {stats['seconds']:.2f} 秒，"
+          f"吞吐量 {stats['rows_per_second']:.0f} 条/秒")
+    print(f"结果已保存到 {args.output}")
+    if args.metrics:
+        with open(args.metrics, "w", encoding="utf-8") as f:
+            f.write(instrumentation.to_prometheus() if args.metrics.endswith(".prom") else instrumentation.to_json())
+        print(f"分阶段计时已保存到 {args.metrics}")
+    if cache is not None:
+        cache_stats = cache.stats()
+        print(f"缓存命中 {cache_stats['hits'] + cache_stats['disk_hits']} 条，未命中 {cache_stats['misses']} 条")
+        cache.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+性能基准测试
+对预测和训练的热点路径计时，结果保存为JSON，并与保存的基准结果对比，变慢超过容差时返回非零退出码:
+- load_models: 打开模型包（只读头部）和加载全部成员
+- prepare_features: 把影视作品转换为特征矩阵（批大小从1到1000000）
+- predict_with_ensemble: 集成预测（批大小从1到1000000）
+- save_models: 完整训练并保存模型（在临时目录中运行，不覆盖models/）
+- JSON加载: cleaned_data.json、onehot_encoded_data.json、列式存储和特征schema
+输入记录从data/cleaned_data.json的词表（地区、类型、导演、演员、年份、评分）中随机抽样生成
+
+用法:
+python src/benchmark.py                                  运行并与benchmarks/baseline.json对比
+python src/benchmark.py --quick                          只测试到10000条，跳过训练
+python src/benchmark.py --save-baseline                  把本次结果保存为新的基准
+python src/benchmark.py --output results.json --tolerance 0.5
+"""
+
+import argparse
+import contextlib
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.features import DEFAULT_DOUBAN_SCORE, get_vectorizer, parse_list
+
+# 项目根目录
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 默认路径
+DEFAULT_CLEANED_PATH = "data/cleaned_data.json"
+DEFAULT_BASELINE_PATH = "benchmarks/baseline.json"
+
+# 默认的批大小
+BATCH_SIZES = (1, 100, 10000, 1000000)
+QUICK_BATCH_SIZES = (1, 100, 10000)
+
+# 默认容差：比基准慢50%以上视为性能回退（同一台机器上多次运行的波动约为±25%）
+DEFAULT_TOLERANCE = 0.5
+
+# 计时的绝对误差下限（秒），耗时很短的用例不会因为计时抖动而失败
+MIN_SLACK_SECONDS = 0.002
+
+def load_vocabulary(path=DEFAULT_CLEANED_PATH):
+    """
+    从清洗后的数据中收集生成合成记录所需的取值
+
+    返回:
+    字典，包含titles、years、douban_scores、watch_times以及region、genre、director、cast的
+    取值列表（按出现次数重复，抽样时保持原有频率）和每条记录的列表长度
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        records = json.load(f)
+
+    vocab = {
+        "titles": [r["title"] for r in records if isinstance(r.get("title"), str)],
+        "years": [r["year"] for r in records if r.get("year") is not None],
+        "douban_scores": [r.get("douban_score") for r in records],
+        "watch_times": [r["watch_time"] for r in records if r.get("watch_time")],
+    }
+    for field in ("region", "genre", "director", "cast"):
+        lists = [parse_list(r.get(field)) for r in records]
+        vocab[field] = [token for values in lists for token in values]
+        vocab[f"{field}_lengths"] = [len(values) for values in lists]
+    return vocab
+
+def synthetic_records(n, vocab, seed=42):
+    """
+    生成合成的影视作品记录（格式与cleaned_data.json相同）
+
+    参数:
+    n: 记录数
+    vocab: load_vocabulary()返回的取值
+    seed: 随机种子
+
+    返回:
+    影视作品字典的列表
+    """
+    rng = random.Random(seed)
+    records = []
+    for i in range(n):
+        record = {
+            "title": f"{rng.choice(vocab['titles'])} {i}",
+            "douban_score": rng.choice(vocab["douban_scores"]),
+            "watch_time": rng.choice(vocab["watch_times"]),
+            "year": rng.choice(vocab["years"]),
+        }
+        for field in ("region", "genre", "director", "cast"):
+            length = rng.choice(vocab[f"{field}_lengths"])
+            record[field] = list(dict.fromkeys(rng.choice(vocab[field]) for _ in range(length))) if vocab[field] else []
+        records.append(record)
+    return records
+
+def time_call(fn, repeat=3):
+    """
+    多次调用并取最快的一次（调用期间的标准输出被丢弃，与timeit一样暂停垃圾回收）
+
+    返回:
+    最快一次的耗时（秒）
+    """
+    best = float("inf")
+    gc_enabled = gc.isenabled()
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                fn()
+                best = min(best, time.perf_counter() - start)
+        finally:
+            if gc_enabled:
+                gc.enable()
+    return best
+
+def _result(name, seconds, size=None):
+    result = {"name": name, "size": size, "seconds": seconds}
+    if size:
+        result["rows_per_second"] = size / seconds if seconds > 0 else float("inf")
+    return result
+
+def bench_load_models(models_dir="models", repeat=10):
+    """打开模型包（只读头部）以及加载全部成员的耗时"""
+    from src.load_models import load_models
+
+    def load_all():
+        models = load_models(models_dir)
+        for name in models:
+            models[name]
+
+    return [
+        _result("load_models", time_call(lambda: load_models(models_dir), repeat)),
+        _result("load_models_all_members", time_call(load_all, repeat)),
+    ]
+
+def bench_prediction(batch_sizes, vocab, models_dir="models"):
+    """特征构建和集成预测在各个批大小下的耗时"""
+    from src.load_models import predict_with_ensemble
+    from src.model_registry import get_models
+
+    models = get_models(models_dir)
+    # 预先加载模型，计时只包含特征构建和预测
+    for name in models:
+        models[name]
+    vectorizer = get_vectorizer(models["feature_names"], default_douban_score=DEFAULT_DOUBAN_SCORE)
+
+    results = []
+    for size in batch_sizes:
+        records = synthetic_records(size, vocab)
+        # 大批量只运行一次，避免基准测试过慢
+        repeat = 10 if size <= 10000 else 1
+        results.append(_result("prepare_features", time_call(lambda: vectorizer.transform_frame(records), repeat),
+                               size))
+        X = vectorizer.transform(records)
+        results.append(_result("predict_with_ensemble", time_call(lambda: predict_with_ensemble(X, models), repeat),
+                               size))
+    return results
+
+def bench_json_loading(repeat=3):
+    """各种数据加载路径的耗时"""
+    import pandas as pd
+    from src.columnar_store import load_encoded_frame
+    from src.feature_schema import load_feature_schema
+
+    def load_cleaned():
+        with open(DEFAULT_CLEANED_PATH, "r", encoding="utf-8") as f:
+            json.load(f)
+
+    def load_schema():
+        load_feature_schema.cache_clear()
+        load_feature_schema()
+
+    return [
+        _result("load_cleaned_json", time_call(load_cleaned, repeat)),
+        _result("read_onehot_json", time_call(lambda: pd.read_json("data/onehot_encoded_data.json"), repeat)),
+        _result("load_encoded_frame", time_call(load_encoded_frame, repeat)),
+        _result("load_feature_schema", time_call(load_schema, repeat)),
+    ]
+
+def bench_save_models():
+    """
+    完整训练的耗时：在临时目录中运行save_models.main()，数据目录通过符号链接共享，
+    models/中只复制best_params.json，不会覆盖已保存的模型
+    """
+    from src import save_models
+    from src.feature_schema import load_feature_schema
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.symlink(os.path.join(PROJECT_ROOT, "data"), os.path.join(tmp, "data"))
+        os.makedirs(os.path.join(tmp, "models"))
+        params_path = os.path.join(PROJECT_ROOT, "models", "best_params.json")
+        if os.path.exists(params_path):
+            shutil.copy(params_path, os.path.join(tmp, "models"))
+        os.chdir(tmp)
+        try:
+            seconds = time_call(save_models.main, repeat=1)
+        finally:
+            os.chdir(cwd)
+            # 临时目录中保存的schema不应留在缓存中
+            load_feature_schema.cache_clear()
+    return [_result("save_models", seconds)]
+
+def run_benchmarks(batch_sizes=BATCH_SIZES, include_training=True, models_dir="models"):
+    """
+    运行所有基准测试
+
+    返回:
+    包含created_at、environment和results的字典
+    """
+    vocab = load_vocabulary()
+    results = []
+    results += bench_load_models(models_dir)
+    results += bench_json_loading()
+    results += bench_prediction(batch_sizes, vocab, models_dir)
+    if include_training:
+        results += bench_save_models()
+
+    import sklearn
+    return {
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "sklearn": sklearn.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+def _case_key(result):
+    return result["name"] if result.get("size") is None else f"{result['name']}[{result['size']}]"
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE, min_slack=MIN_SLACK_SECONDS):
+    """
+    与基准结果对比
+
+    参数:
+    current: 本次的结果
+    baseline: 基准结果
+    tolerance: 允许的相对变慢比例
+    min_slack: 允许的绝对变慢（秒）
+
+    返回:
+    对比列表，每项包含case、baseline、current、ratio和regressed；只包含两边都有的用例
+    """
+    baseline_times = {_case_key(r): r["seconds"] for r in baseline["results"]}
+    comparisons = []
+    for result in current["results"]:
+        key = _case_key(result)
+        if key not in baseline_times:
+            continue
+        base = baseline_times[key]
+        limit = max(base * (1 + tolerance), base + min_slack)
+        comparisons.append({
+            "case": key,
+            "baseline": base,
+            "current": result["seconds"],
+            "ratio": result["seconds"] / base if base > 0 else float("inf"),
+            "regressed": result["seconds"] > limit,
+        })
+    return comparisons
+
+def save_results(results, path):
+    """把结果写入JSON文件"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="预测和训练热点路径的基准测试")
+    parser.add_argument("--sizes", default=None, help="逗号分隔的批大小，默认为1,100,10000,1000000")
+    parser.add_argument("--quick", action="store_true", help="只测试到10000条，并跳过训练")
+    parser.add_argument("--skip-training", action="store_true", help="跳过save_models的训练计时")
+    parser.add_argument("--models-dir", default="models", help="模型目录")
+    parser.add_argument("--output", default=None, help="本次结果的输出文件")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH, help="基准结果文件")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基准")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="允许的相对变慢比例")
+    args = parser.parse_args()
+
+    if args.sizes:
+        batch_sizes = [int(size) for size in args.sizes.split(",")]
+    else:
+        batch_sizes = QUICK_BATCH_SIZES if args.quick else BATCH_SIZES
+
+    current = run_benchmarks(batch_sizes, not (args.quick or args.skip_training), args.models_dir)
+
+    print(f"{'用例':<36}{'耗时(ms)':>14}{'吞吐量(条/秒)':>18}")
+    for result in current["results"]:
+        throughput = f"{result['rows_per_second']:>18.0f}" if "rows_per_second" in result else ""
+        print(f"{_case_key(result):<36}{result['seconds'] * 1000:>14.3f}{throughput}")
+
+    if args.output:
+        save_results(current, args.output)
+        print(f"结果已保存到 {args.output}")
+
+    if args.save_baseline:
+        save_results(current, args.baseline)
+        print(f"基准已保存到 {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"基准文件 {args.baseline} 不存在，使用 --save-baseline 创建")
+        return
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    comparisons = compare(current, baseline, args.tolerance)
+    regressions = [c for c in comparisons if c["regressed"]]
+
+    print(f"\n与基准对比（容差 {args.tolerance:.0%}）:")
+    for c in comparisons:
+        flag = "  变慢" if c["regressed"] else ""
+        print(f"{c['case']:<36}{c['baseline'] * 1000:>12.3f}ms -> {c['current'] * 1000:>10.3f}ms"
+              f"{c['ratio']:>8.2f}x{flag}")
+    if regressions:
+        print(f"\n{len(regressions)} 个用例比基准慢 {args.tolerance:.0%} 以上")
+        sys.exit(1)
+    print("\n没有发现性能回退")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+数据清洗
+从notebooks/01-data_cleaning.ipynb中提取的清洗步骤，供增量导入等脚本复用：
+读取豆瓣导出文件、解析简介（年份 / 地区 / 类型 / 导演 / 演员）、处理非法评分和空字段
+
+用法:
+python src/data_cleaning.py --rows 1000000    对比逐行解析和向量化解析简介的耗时
+"""
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 豆瓣导出文件中使用的列及其对应的字段名
+RAW_COLUMNS = ["标题", "简介", "豆瓣评分", "创建时间", "我的评分"]
+COLUMN_NAMES = ["title", "summary", "douban_score", "watch_time", "user_score"]
+
+# 简介中解析出的字段
+SUMMARY_FIELDS = ["year", "region", "genre", "director", "cast"]
+
+# 多标签字段
+LIST_FIELDS = ["region", "genre", "director", "cast"]
+
+def read_export(file_path="data/raw.xlsx", sheet_name="看过"):
+    """
+    读取豆瓣导出的Excel文件，并统一字段名
+
+    参数:
+    file_path: Excel文件路径
+    sheet_name: 工作表名称
+
+    返回:
+    包含title、summary、douban_score、watch_time、user_score列的DataFrame
+    """
+    df = pd.read_excel(file_path, sheet_name=sheet_name, usecols=RAW_COLUMNS)
+    df = df[RAW_COLUMNS]
+    df.columns = COLUMN_NAMES
+    return df
+
+def parse_summary(summary):
+    """
+    解析一条简介（"年份 / 地区 / 类型 / 导演 / 演员"）
+
+    参数:
+    summary: 简介字符串
+
+    返回:
+    索引为year、region、genre、director、cast的Series
+    """
+    # 如果 summary 不是字符串，直接返回空字段
+    if not isinstance(summary, str):
+        return pd.Series([None, [], [], [], []], index=SUMMARY_FIELDS)
+
+    parts = [p.strip() for p in summary.split("/")]
+
+    # 容错处理：确保长度为5
+    while len(parts) < 5:
+        parts.append("")
+
+    year = parts[0]
+    region = parts[1].split() if parts[1] else []
+    genre = parts[2].split() if parts[2] else []
+    director = parts[3].split() if parts[3] else []
+    cast = parts[4].split() if parts[4] else []
+
+    return pd.Series([year, region, genre, director, cast], index=SUMMARY_FIELDS)
+
+def parse_summaries(summaries):
+    """
+    向量化解析所有简介，结果与逐行调用parse_summary()再对列表字段应用list_or_nan()一致
+
+    参数:
+    summaries: 简介Series
+
+    返回:
+    列为year、region、genre、director、cast的DataFrame（索引与输入相同），
+    空列表记为缺失值
+    """
+    summaries = pd.Series(summaries).astype(object)
+    is_str = summaries.map(type) == str
+    texts = summaries.where(is_str)
+
+    # 只取前5段，多余的部分留在第6列中被忽略
+    parts = texts.str.split("/", n=5, expand=True)
+    for i in range(parts.shape[1], 5):
+        parts[i] = None
+
+    result = pd.DataFrame(index=summaries.index)
+    # 不足5段时补空字符串；非字符串的简介年份为None
+    year = parts[0].str.strip().astype(object).where(is_str, None)
+    # 重新推断类型，与逐行解析得到的列类型一致
+    result["year"] = pd.Series(year.to_numpy(), index=summaries.index)
+    for i, field in enumerate(LIST_FIELDS, start=1):
+        tokens = parts[i].str.split()
+        # 缺少的段、空段或只有空白的段都视为缺失
+        result[field] = tokens.where(tokens.str.len() > 0, np.nan)
+    return result
+
+def list_or_nan(lst):
+    """空列表或只包含空字符串的列表视为缺失"""
+    if not isinstance(lst, list) or len(lst) == 0:
+        return np.nan
+    # 若列表中只有空串或空白
+    if all((not item or str(item).strip() == "") for item in lst):
+        return np.nan
+    return lst
+
+def clean_frame(df):
+    """
+    清洗导出数据（与notebooks/01-data_cleaning.ipynb的步骤一致）
+
+    参数:
+    df: read_export()返回的DataFrame
+
+    返回:
+    清洗后的DataFrame，列为title、douban_score、watch_time、user_score和简介中解析出的字段
+    """
+    parsed_summary = parse_summaries(df["summary"])
+    df_cleaned = pd.concat([df.drop(columns=["summary"]), parsed_summary], axis=1)
+
+    # 处理非法豆瓣评分（小于2或大于10）
+    df_cleaned.loc[
+        (df_cleaned["douban_score"] < 2) | (df_cleaned["douban_score"] > 10),
+        "douban_score"
+    ] = np.nan
+
+    # 处理 title、watch_time、user_score、year 为空的情况
+    columns_to_check = ["title", "watch_time", "user_score", "year"]
+    df_cleaned[columns_to_check] = df_cleaned[columns_to_check].replace("", np.nan)
+
+    # region, genre, director, cast 为空列表或仅包含空字符串时，parse_summaries()已记为缺失
+    return df_cleaned
+
+def clean_frame_rowwise(df):
+    """逐行解析简介的原始实现（与notebook完全相同），用于对比和基准测试"""
+    parsed_summary = df["summary"].apply(parse_summary)
+    df_cleaned = pd.concat([df.drop(columns=["summary"]), parsed_summary], axis=1)
+    df_cleaned.loc[
+        (df_cleaned["douban_score"] < 2) | (df_cleaned["douban_score"] > 10),
+        "douban_score"
+    ] = np.nan
+    columns_to_check = ["title", "watch_time", "user_score", "year"]
+    df_cleaned[columns_to_check] = df_cleaned[columns_to_check].replace("", np.nan)
+    for col in LIST_FIELDS:
+        df_cleaned[col] = df_cleaned[col].apply(list_or_nan)
+    return df_cleaned
+
+# 基准测试中混入的特殊简介：缺失、段数不足、多余的"/"、空段和全角空格
+EDGE_CASE_SUMMARIES = [
+    None, np.nan, "", "2019", "2019 / 美国", " / / / / ", "2020 / 美国 / 剧情 / 导演 / 演员 / 多余",
+    "2021 /  / 剧情  喜剧 / / 演员甲", "2018 / 中国大陆　中国香港 / 剧情 / 导演 / 演员", 2020,
+]
+
+def make_synthetic_export(n_rows, base=None, seed=42):
+    """
+    生成用于基准测试的导出数据
+
+    参数:
+    n_rows: 行数
+    base: 作为样本的导出数据，None表示读取data/raw.xlsx（不存在时只使用特殊简介）
+    seed: 随机种子
+
+    返回:
+    与read_export()格式相同的DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    if base is None and os.path.exists("data/raw.xlsx"):
+        base = read_export()
+    summaries = list(base["summary"]) if base is not None else []
+    summaries += EDGE_CASE_SUMMARIES
+    pool = pd.Series(summaries, dtype=object)
+
+    picks = rng.integers(0, len(pool), n_rows)
+    return pd.DataFrame({
+        "title": [f"影片{i}" for i in range(n_rows)],
+        "summary": pool.iloc[picks].to_numpy(),
+        "douban_score": rng.uniform(0, 11, n_rows).round(1),
+        "watch_time": pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 10 ** 8, n_rows), unit="s"),
+        "user_score": rng.integers(1, 6, n_rows),
+    })
+
+def benchmark(n_rows=1000000):
+    """
+    对比逐行解析与向量化解析的耗时，并检查结果一致
+
+    返回:
+    包含rows、rowwise_seconds、vectorized_seconds和identical的字典
+    """
+    df = make_synthetic_export(n_rows)
+
+    start = time.perf_counter()
+    expected = clean_frame_rowwise(df)
+    rowwise_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = clean_frame(df)
+    vectorized_seconds = time.perf_counter() - start
+
+    return {
+        "rows": n_rows,
+        "rowwise_seconds": rowwise_seconds,
+        "vectorized_seconds": vectorized_seconds,
+        "identical": expected.to_json(orient="records", force_ascii=False, date_format="iso") ==
+                     actual.to_json(orient="records", force_ascii=False, date_format="iso"),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="简介解析基准测试")
+    parser.add_argument("--rows", type=int, default=1000000, help="合成导出数据的行数")
+    args = parser.parse_args()
+
+    result = benchmark(args.rows)
+    print(f"行数: {result['rows']}")
+    print(f"逐行解析: {result['rowwise_seconds']:.2f} 秒")
+    print(f"向量化解析: {result['vectorized_seconds']:.2f} 秒 "
+          f"(加速 {result['rowwise_seconds'] / result['vectorized_seconds']:.1f} 倍)")
+    print(f"结果一致: {'是' if result['identical'] else '否'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+流式评估
+把编码数据集（列式存储data/onehot_encoded/），或任意带user_score的留出文件（JSONL、CSV或JSON数组，
+格式与cleaned_data.json相同）按块送入集成模型，用单遍累加器计算各成员和集成模型的MAE、RMSE、R²，
+以及按类型、地区拆分的误差。每次只有一块数据在内存中，评估百万条记录不需要载入整个数据集
+
+评估编码数据集时默认只评估save_models.py划分的测试集（行号来自折存储，holdout）；
+--split full评估完整数据集，其中约80%是训练数据，结果属于样本内评估，会低估误差
+
+缺失的豆瓣评分按DEFAULT_DOUBAN_SCORE填充（与批量预测、预测服务和交互程序一致），
+其余缺失的特征由模型中的imputer按训练集均值填充
+
+用法:
+python src/evaluate.py                                   评估编码数据集中的测试集
+python src/evaluate.py --split full                      评估完整的编码数据集（样本内）
+python src/evaluate.py holdout.jsonl --chunk-size 50000  评估留出文件
+python src/evaluate.py --output report.json --min-count 5
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import numpy as np
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.batch_predict import iter_chunks, iter_records
+from src.columnar_store import DEFAULT_JSON_PATH, DEFAULT_STORE_PATH, EncodedStore
+from src.features import DEFAULT_DOUBAN_SCORE, get_vectorizer
+from src.fuse import MEMBER_ORDER
+from src.model_registry import get_models
+from src.instrumentation import configure_logging, span
+
+# 默认每块的记录数
+DEFAULT_CHUNK_SIZE = 10000
+
+# 按字段拆分误差的字段
+BREAKDOWN_FIELDS = ("genre", "region")
+
+# 编码数据集的评估范围: holdout为save_models.py划分的测试集，full为完整数据集（样本内）
+SPLITS = ("holdout", "full")
+
+# 评估范围的说明（打印报告时使用）
+SPLIT_LABELS = {
+    "holdout": "留出测试集（save_models.py划分的测试集，未参与训练）",
+    "full": "完整数据集（约80%为训练数据，样本内评估）",
+}
+
+class ErrorStats:
+    """
+    单遍误差累加器：只保存计数和几个和，可以逐块更新，也可以合并
+    """
+
+    __slots__ = ("count", "sum_error", "sum_abs", "sum_sq", "sum_y", "sum_y2")
+
+    def __init__(self):
+        self.count = 0
+        self.sum_error = 0.0
+        self.sum_abs = 0.0
+        self.sum_sq = 0.0
+        self.sum_y = 0.0
+        self.sum_y2 = 0.0
+
+    def update(self, y_true, y_pred):
+        """
+        累加一块数据
+
+        参数:
+        y_true: 真实评分数组
+        y_pred: 预测评分数组
+        """
+        if len(y_true) == 0:
+            return
+        error = y_pred - y_true
+        self.count += len(y_true)
+        self.sum_error += float(error.sum())
+        self.sum_abs += float(np.abs(error).sum())
+        self.sum_sq += float(error @ error)
+        self.sum_y += float(y_true.sum())
+        self.sum_y2 += float(y_true @ y_true)
+
+    def merge(self, other):
+        """合并另一个累加器（如多个进程分别评估的结果）"""
+        for name in self.__slots__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        return self
+
+    def to_dict(self):
+        """
+        返回:
+        字典，包含count、mae、rmse、bias（预测值减真实值的平均）和r2（真实评分没有变化时为None）
+        """
+        if self.count == 0:
+            return {"count": 0, "mae": None, "rmse": None, "bias": None, "r2": None}
+        total_sq = self.sum_y2 - self.sum_y * self.sum_y / self.count
+        return {
+            "count": self.count,
+            "mae": self.sum_abs / self.count,
+            "rmse": math.sqrt(self.sum_sq / self.count),
+            "bias": self.sum_error / self.count,
+            "r2": 1.0 - self.sum_sq / total_sq if total_sq > 1e-12 else None,
+        }
+
+def member_predictions(X, models):
+    """
+    计算各成员的预测值和集成预测值（各成员的平均，与predict_with_ensemble一致）
+
+    参数:
+    X: 按训练特征顺序排列的特征矩阵，可以包含缺失值
+    models: 模型字典
+
+    返回:
+    {成员名称: 预测数组, ..., "ensemble": 预测数组}
+    """
+    if "fused" in models:
+        predictions = models["fused"].predict_members(X)
+    else:
+        if "imputer" in models:
+            with span("impute"):
+                X = models["imputer"].transform(X)
+        predictions = {}
+        for name in MEMBER_ORDER:
+            if name in models:
+                with span(name):
+                    predictions[name] = models[name].predict(X)
+    if not predictions:
+        raise ValueError("没有可用的预测模型")
+    with span("aggregate"):
+        predictions["ensemble"] = np.mean(list(predictions.values()), axis=0)
+    return predictions
+
+class StreamingEvaluator:
+    """
+    流式评估器：逐块接收特征矩阵、真实评分，累加各成员的整体误差和集成模型按类型、地区拆分的误差
+    """
+
+    def __init__(self, feature_names, fields=BREAKDOWN_FIELDS):
+        """
+        参数:
+        feature_names: 特征顺序（按类型、地区拆分时使用对应的One-Hot列）
+        fields: 拆分误差的字段
+        """
+        self.overall = {}
+        self.breakdown = {field: {} for field in fields}
+        # 每个字段: [(标签, 列号), ...]
+        self._group_columns = {
+            field: [(name[len(field) + 1:], i) for i, name in enumerate(feature_names)
+                    if name.startswith(field + "_")]
+            for field in fields
+        }
+        self.rows = 0
+
+    def update(self, X, y, predictions):
+        """
+        累加一块数据
+
+        参数:
+        X: 特征矩阵
+        y: 真实评分数组
+        predictions: member_predictions()的结果
+        """
+        self.rows += len(y)
+        for name, pred in predictions.items():
+            self.overall.setdefault(name, ErrorStats()).update(y, pred)
+
+        ensemble = predictions["ensemble"]
+        for field, columns in self._group_columns.items():
+            groups = self.breakdown[field]
+            for token, col in columns:
+                mask = X[:, col] != 0
+                if mask.any():
+                    groups.setdefault(token, ErrorStats()).update(y[mask], ensemble[mask])
+
+    def report(self):
+        """
+        返回:
+        字典，包含rows、members（各成员和ensemble的整体指标）以及by_<字段>（按标签拆分的集成模型指标，
+        按样本数从多到少排列）
+        """
+        report = {
+            "rows": self.rows,
+            "members": {name: stats.to_dict() for name, stats in self.overall.items()},
+        }
+        for field, groups in self.breakdown.items():
+            ordered = sorted(groups.items(), key=lambda item: (-item[1].count, item[0]))
+            report[f"by_{field}"] = {token: stats.to_dict() for token, stats in ordered}
+        return report
+
+def iter_labeled(records):
+    """只保留有user_score的记录"""
+    for record in records:
+        score = record.get("user_score")
+        if score is not None and score == score:
+            yield record
+
+def holdout_rows(test_size=0.2, random_state=42):
+    """
+    save_models.py划分的测试集在编码数据集中的行号（从折存储读取，训练数据变化时折存储随之重建）
+
+    返回:
+    升序排列的行号数组
+    """
+    from src.fold_store import open_fold_store
+
+    return np.sort(np.asarray(open_fold_store(test_size, random_state).array("test_index"), dtype=np.int64))
+
+def iter_store_batches(store, vectorizer, rows=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    逐块从列式存储构建(特征矩阵, 真实评分)：直接使用数据块中的数值矩阵和CSR矩阵，
+    不还原为逐条记录的字典；没有user_score的行被跳过
+
+    参数:
+    store: EncodedStore实例
+    vectorizer: FeatureVectorizer实例
+    rows: 只评估这些行（升序的行号数组），None表示全部
+    chunk_size: 每块的最大行数（数据块较大时再拆分）
+
+    返回:
+    (特征矩阵, 真实评分数组) 的生成器
+    """
+    numeric_names = store.numeric_columns
+    target = numeric_names.index("user_score")
+    vocabs = {field: store.vocab(field) for field in store.schema["multihot"]}
+    offset = 0
+    for chunk in store.schema["chunks"]:
+        start, offset = offset, offset + chunk["rows"]
+        if rows is None:
+            selected = np.arange(chunk["rows"])
+        else:
+            selected = rows[np.searchsorted(rows, start):np.searchsorted(rows, offset)] - start
+        if selected.size == 0:
+            continue
+
+        data = store._read_chunk(chunk)
+        labels = np.asarray(data["numeric"][:, target], dtype=np.float64)
+        selected = selected[~np.isnan(labels[selected])]
+        for i in range(0, len(selected), chunk_size):
+            block = selected[i:i + chunk_size]
+            X = vectorizer.transform_encoded(
+                np.asarray(data["numeric"][block], dtype=np.float64), numeric_names,
+                np.asarray(data["watch_time"][block]).astype("datetime64[ms]"),
+                [data["title"][j] for j in block],
+                {field: (data[field][block], vocab) for field, vocab in vocabs.items()})
+            yield X, labels[block]
+
+def evaluate_batches(batches, models, feature_names):
+    """
+    累加各块的误差
+
+    参数:
+    batches: (特征矩阵, 真实评分数组) 的可迭代对象
+    models: 模型字典
+    feature_names: 特征顺序
+
+    返回:
+    StreamingEvaluator.report()的结果，另外包含seconds和rows_per_second
+    """
+    evaluator = StreamingEvaluator(feature_names)
+    start = time.perf_counter()
+    for X, y in batches:
+        evaluator.update(X, y, member_predictions(X, models))
+    seconds = time.perf_counter() - start
+
+    report = evaluator.report()
+    report["seconds"] = seconds
+    report["rows_per_second"] = report["rows"] / seconds if seconds > 0 else float("inf")
+    return report
+
+def _feature_names(models):
+    feature_names = models.get("feature_names")
+    if not feature_names:
+        raise ValueError("缺少特征名称文件，请先运行 save_feature_names.py")
+    return feature_names
+
+def evaluate_stream(records, models=None, chunk_size=DEFAULT_CHUNK_SIZE, models_dir="models",
+                    default_douban_score=DEFAULT_DOUBAN_SCORE):
+    """
+    流式评估
+
+    参数:
+    records: 记录字典的可迭代对象（需要包含user_score，没有的记录会被跳过）
+    models: 模型字典，None表示从模型注册表获取
+    chunk_size: 每块的记录数
+    models_dir: 保存模型的目录路径
+    default_douban_score: 豆瓣评分缺失时的填充值（默认与批量预测相同），None表示交给imputer填充
+
+    返回:
+    StreamingEvaluator.report()的结果，另外包含seconds和rows_per_second
+    """
+    if models is None:
+        models = get_models(models_dir)
+    feature_names = _feature_names(models)
+    vectorizer = get_vectorizer(feature_names, default_douban_score=default_douban_score)
+    batches = ((vectorizer.transform(chunk),
+                np.array([float(record["user_score"]) for record in chunk], dtype=np.float64))
+               for chunk in iter_chunks(iter_labeled(records), chunk_size))
+    return evaluate_batches(batches, models, feature_names)
+
+def evaluate_dataset(split="holdout", models=None, chunk_size=DEFAULT_CHUNK_SIZE, models_dir="models",
+                     default_douban_score=DEFAULT_DOUBAN_SCORE):
+    """
+    评估编码数据集：优先直接读取列式存储的数据块，不存在时流式读取One-Hot编码后的JSON
+
+    参数:
+    split: 评估范围，holdout（save_models.py划分的测试集）或full（完整数据集，样本内）
+    models: 模型字典，None表示从模型注册表获取
+    chunk_size: 每块的记录数
+    models_dir: 保存模型的目录路径
+    default_douban_score: 豆瓣评分缺失时的填充值，与evaluate_stream()相同
+
+    返回:
+    evaluate_stream()的结果，另外包含split
+    """
+    if split not in SPLITS:
+        raise ValueError(f"未知的评估范围: {split}")
+    rows = holdout_rows() if split == "holdout" else None
+    if models is None:
+        models = get_models(models_dir)
+
+    if os.path.exists(os.path.join(DEFAULT_STORE_PATH, "schema.json")):
+        feature_names = _feature_names(models)
+        vectorizer = get_vectorizer(feature_names, default_douban_score=default_douban_score)
+        batches = iter_store_batches(EncodedStore(DEFAULT_STORE_PATH), vectorizer, rows, chunk_size)
+        report = evaluate_batches(batches, models, feature_names)
+    else:
+        records = iter_records(DEFAULT_JSON_PATH)
+        if rows is not None:
+            selected = set(rows.tolist())
+            records = (record for i, record in enumerate(records) if i in selected)
+        report = evaluate_stream(records, models, chunk_size, default_douban_score=default_douban_score)
+    report["split"] = split
+    return report
+
+def _format(value, digits=3):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+def print_report(report, min_count=1, top=15):
+    """打印评估结果"""
+    if "split" in report:
+        print(f"评估范围: {SPLIT_LABELS[report['split']]}")
+    elif "input" in report:
+        print(f"评估范围: 留出文件 {report['input']}")
+    print(f"评估 {report['rows']} 条记录，耗时 {report['seconds']:.2f} 秒")
+    print(f"\n{'模型':<12}{'MAE':>8}{'RMSE':>8}{'偏差':>8}{'R²':>8}")
+    for name, stats in report["members"].items():
+        print(f"{name:<12}{_format(stats['mae']):>8}{_format(stats['rmse']):>8}"
+              f"{_format(stats['bias']):>8}{_format(stats['r2']):>8}")
+
+    for field in BREAKDOWN_FIELDS:
+        groups = [(token, stats) for token, stats in report.get(f"by_{field}", {}).items()
+                  if stats["count"] >= min_count]
+        if not groups:
+            continue
+        label = {"genre": "类型", "region": "地区"}.get(field, field)
+        print(f"\n按{label}拆分的集成模型误差（样本数不少于{min_count}，前{top}个）:")
+        print(f"{label:<12}{'样本数':>8}{'MAE':>8}{'RMSE':>8}{'偏差':>8}")
+        for token, stats in groups[:top]:
+            print(f"{token:<12}{stats['count']:>8}{_format(stats['mae']):>8}{_format(stats['rmse']):>8}"
+                  f"{_format(stats['bias']):>8}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="流式评估集成模型")
+    parser.add_argument("input", nargs="?", default=None,
+                        help="带user_score的留出文件（JSONL、CSV或JSON数组），默认评估编码数据集")
+    parser.add_argument("--split", choices=SPLITS, default="holdout",
+                        help="评估编码数据集时的范围：holdout为save_models.py划分的测试集，full为完整数据集（样本内）")
+    parser.add_argument("--input-format", choices=['jsonl', 'csv', 'json'], help="输入格式，默认根据扩展名判断")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="每块的记录数")
+    parser.add_argument("--models-dir", default="models", help="模型目录")
+    parser.add_argument("--min-count", type=int, default=1, help="拆分误差时只显示样本数不少于该值的标签")
+    parser.add_argument("--output", default=None, help="把完整的评估结果保存为JSON")
+    args = parser.parse_args(argv)
+
+    configure_logging("WARNING")
+    if args.input:
+        report = evaluate_stream(iter_records(args.input, args.input_format), chunk_size=args.chunk_size,
+                                 models_dir=args.models_dir)
+        report["input"] = args.input
+    else:
+        report = evaluate_dataset(args.split, chunk_size=args.chunk_size, models_dir=args.models_dir)
+    print_report(report, args.min_count)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n评估结果已保存到 {args.output}")
+
+if __name__ == "__main__":
+    main()
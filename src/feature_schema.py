@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+特征schema清单
+训练时把地区、类型选项、数值特征、特征顺序、数据类型和训练集统计量写入
+models/feature_schema.json，交互程序和特征构建只读取这个小文件（进程内缓存），
+不再为了获取列名而解析整个数据集
+
+用法:
+python src/feature_schema.py    根据列式存储（或JSON）中的训练数据重新生成清单
+"""
+
+import argparse
+import datetime
+import functools
+import json
+import os
+import sys
+import numpy as np
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.features import BASIC_FEATURES, NON_FEATURE_COLUMNS
+
+SCHEMA_VERSION = 1
+
+# 默认路径
+DEFAULT_SCHEMA_PATH = "models/feature_schema.json"
+
+def build_feature_schema(X_train, feature_names=None):
+    """
+    根据训练集特征矩阵生成schema清单
+
+    参数:
+    X_train: 训练集特征DataFrame（填充缺失值之前）
+    feature_names: 特征顺序，None表示使用X_train的列顺序
+
+    返回:
+    schema字典
+    """
+    feature_names = list(feature_names if feature_names is not None else X_train.columns)
+    regions = [col[len("region_"):] for col in feature_names if col.startswith("region_")]
+    genres = [col[len("genre_"):] for col in feature_names if col.startswith("genre_")]
+    numeric_features = [col for col in feature_names
+                        if not col.startswith("region_") and not col.startswith("genre_")]
+
+    statistics = {}
+    for col in feature_names:
+        if col not in X_train.columns:
+            continue
+        values = X_train[col].to_numpy(dtype=np.float64)
+        present = values[~np.isnan(values)]
+        statistics[col] = {
+            "mean": float(present.mean()) if present.size else None,
+            "std": float(present.std()) if present.size else None,
+            "min": float(present.min()) if present.size else None,
+            "max": float(present.max()) if present.size else None,
+            "missing": int(values.size - present.size),
+        }
+
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "n_train_rows": int(len(X_train)),
+        "feature_names": feature_names,
+        "numeric_features": numeric_features,
+        "regions": regions,
+        "genres": genres,
+        "dtypes": {col: str(X_train[col].dtype) for col in feature_names if col in X_train.columns},
+        "statistics": statistics,
+    }
+
+def save_feature_schema(schema, path=DEFAULT_SCHEMA_PATH):
+    """
+    保存schema清单（先写临时文件再替换，避免读到写了一半的文件）
+
+    参数:
+    schema: build_feature_schema()生成的字典
+    path: 输出文件路径
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(schema, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    load_feature_schema.cache_clear()
+
+def _schema_from_columns(columns):
+    """没有清单时，根据编码后数据的列名生成不含统计量的schema"""
+    feature_names = [col for col in columns if col not in NON_FEATURE_COLUMNS]
+    feature_names += [f for f in BASIC_FEATURES if f not in feature_names]
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "feature_names": feature_names,
+        "numeric_features": [col for col in feature_names
+                             if not col.startswith("region_") and not col.startswith("genre_")],
+        "regions": [col[len("region_"):] for col in feature_names if col.startswith("region_")],
+        "genres": [col[len("genre_"):] for col in feature_names if col.startswith("genre_")],
+        "dtypes": {},
+        "statistics": {},
+    }
+
+@functools.lru_cache(maxsize=None)
+def load_feature_schema(path=DEFAULT_SCHEMA_PATH):
+    """
+    加载schema清单，结果在进程内缓存
+
+    清单不存在时（如旧版本训练的模型），根据列式存储的列名生成一份不含统计量的schema
+
+    参数:
+    path: 清单文件路径
+
+    返回:
+    schema字典（调用方不应修改）
+    """
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            schema = json.load(f)
+        if schema.get("schema_version") != SCHEMA_VERSION:
+            raise ValueError(f"不支持的schema版本: {schema.get('schema_version')}")
+        return schema
+
+    from src.columnar_store import load_encoded_columns
+    return _schema_from_columns(load_encoded_columns())
+
+def main():
+    parser = argparse.ArgumentParser(description="生成特征schema清单")
+    parser.add_argument("--output", default=DEFAULT_SCHEMA_PATH, help="输出文件路径")
+    args = parser.parse_args()
+
+    from sklearn.model_selection import train_test_split
+    from src.columnar_store import load_encoded_frame
+    from src.features import add_engineered_features
+
+    # 与save_models.py相同的特征和训练集划分
+    encoded_df = add_engineered_features(load_encoded_frame())
+    feature_columns = [col for col in encoded_df.columns if col not in NON_FEATURE_COLUMNS]
+    X_train, _ = train_test_split(encoded_df[feature_columns], test_size=0.2, random_state=42)
+
+    schema = build_feature_schema(X_train)
+    save_feature_schema(schema, args.output)
+    print(f"已保存到 {args.output}")
+    print(f"- 特征: {len(schema['feature_names'])} 个")
+    print(f"- 地区: {len(schema['regions'])} 个，类型: {len(schema['genres'])} 个")
+
+if __name__ == "__main__":
+    main()
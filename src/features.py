@@ -0,0 +1,406 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+特征构建
+根据训练时的特征名称顺序，把影视作品字典（单条或批量）直接转换为NumPy特征矩阵
+"""
+
+import ast
+import datetime
+import functools
+import numpy as np
+import pandas as pd
+from src.instrumentation import span
+
+# 基本数值特征（地区、类型之外的特征）
+BASIC_FEATURES = ['douban_score', 'year', 'watch_year', 'watch_quarter',
+                  'title_length', 'director_count', 'cast_count']
+
+# 不参与训练的列
+NON_FEATURE_COLUMNS = ['title', 'watch_time', 'director', 'cast', 'user_score']
+
+# 交互程序、预测服务、批量预测和推荐中豆瓣评分缺失时的默认值（各入口使用同一个值，预测结果保持一致）
+DEFAULT_DOUBAN_SCORE = 7.5
+
+def parse_list(value):
+    """
+    把地区、类型、导演、演员字段统一转换为列表
+
+    参数:
+    value: 列表、字符串形式的列表（如"['a', 'b']"）或缺失值
+
+    返回:
+    列表，无法解析时返回空列表
+    """
+    if isinstance(value, list):
+        return value
+    if isinstance(value, (tuple, set, np.ndarray)):
+        return list(value)
+    if isinstance(value, str):
+        try:
+            parsed = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return []
+        return parsed if isinstance(parsed, list) else []
+    return []
+
+def parse_watch_time(value):
+    """
+    解析观看时间
+
+    参数:
+    value: "YYYY-MM-DD HH:MM:SS"字符串、毫秒时间戳或datetime对象
+
+    返回:
+    (观看年份, 观看季度) 元组，无法解析时为(nan, nan)
+    """
+    if isinstance(value, str):
+        # 快速路径：符合"YYYY-MM"开头的格式时直接截取年份和月份，其他格式（如"20240101"）交给pd.to_datetime
+        if value[:4].isdigit() and value[4:5] == "-" and value[5:7].isdigit() and "01" <= value[5:7] <= "12":
+            return int(value[:4]), (int(value[5:7]) - 1) // 3 + 1
+        value = pd.to_datetime(value, errors="coerce")
+    elif isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool):
+        if value != value:
+            return np.nan, np.nan
+        # pd.read_json会把毫秒时间戳按UTC解析，这里保持一致
+        value = datetime.datetime.fromtimestamp(value / 1000, tz=datetime.timezone.utc)
+
+    if value is None or value is pd.NaT:
+        return np.nan, np.nan
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.year, (value.month - 1) // 3 + 1
+    return np.nan, np.nan
+
+def _to_float(value):
+    """把数值字段转换为浮点数，缺失或无法解析时返回nan"""
+    if value is None or value == "":
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def add_engineered_features(df):
+    """
+    在编码后的训练数据上添加衍生特征（与训练脚本保持一致）
+
+    参数:
+    df: One-Hot编码后的DataFrame（来自columnar_store.load_encoded_frame()）
+
+    返回:
+    添加了特征列的DataFrame（原地修改）
+    """
+    df['director_count'] = df['director'].apply(lambda x: len(parse_list(x)))
+    df['cast_count'] = df['cast'].apply(lambda x: len(parse_list(x)))
+    df['douban_score'] = df['douban_score'].fillna(df['douban_score'].mean())
+    df['watch_time'] = pd.to_datetime(df['watch_time'])
+    df['watch_year'] = df['watch_time'].dt.year
+    df['watch_quarter'] = df['watch_time'].dt.quarter
+    df['title_length'] = df['title'].str.split().str.len()
+    return df
+
+class FeatureVectorizer:
+    """
+    特征构建器：根据特征名称顺序预先计算每一列的位置，
+    之后每次转换只需填充一个NumPy矩阵
+    """
+
+    def __init__(self, feature_names, default_douban_score=None):
+        """
+        参数:
+        feature_names: 训练时的特征名称列表（决定输出矩阵的列顺序）
+        default_douban_score: 豆瓣评分缺失时的填充值，None表示保留为nan交给imputer处理
+        """
+        self.feature_names = list(feature_names)
+        self.default_douban_score = default_douban_score
+        self.column_index = {name: i for i, name in enumerate(self.feature_names)}
+
+        # 预先计算地区和类型对应的列号
+        self.region_index = {name[len("region_"):]: i for i, name in enumerate(self.feature_names)
+                             if name.startswith("region_")}
+        self.genre_index = {name[len("genre_"):]: i for i, name in enumerate(self.feature_names)
+                            if name.startswith("genre_")}
+
+        # 其余列为数值列
+        self.numeric_columns = [(i, name) for i, name in enumerate(self.feature_names)
+                                if not name.startswith("region_") and not name.startswith("genre_")]
+
+        # 地区和类型的标志位列（按特征顺序），以及每个特征列在标志位中的序号
+        self.flag_columns = np.array(sorted(list(self.region_index.values()) + list(self.genre_index.values())),
+                                     dtype=np.intp)
+        self.flag_slot = np.full(self.n_features, -1, dtype=np.intp)
+        self.flag_slot[self.flag_columns] = np.arange(len(self.flag_columns))
+
+    @property
+    def n_features(self):
+        """特征数量"""
+        return len(self.feature_names)
+
+    def _numeric_column(self, name, records, watch_times):
+        """计算一个数值列在所有记录上的取值"""
+        if name == "douban_score":
+            default = np.nan if self.default_douban_score is None else self.default_douban_score
+            values = [_to_float(r.get("douban_score")) for r in records]
+            return [default if v != v else v for v in values]
+        if name == "year":
+            return [_to_float(r.get("year")) for r in records]
+        if name == "watch_year":
+            return [w[0] for w in watch_times]
+        if name == "watch_quarter":
+            return [w[1] for w in watch_times]
+        if name == "title_length":
+            return [len(r["title"].split()) if isinstance(r.get("title"), str) else np.nan for r in records]
+        if name in ("director_count", "cast_count"):
+            field = name[:-len("_count")]
+            values = [r.get(field) for r in records]
+            return [len(v) if type(v) is list else len(parse_list(v)) for v in values]
+        # 未知的数值列：直接取记录中的同名字段，不存在时为0
+        return [_to_float(r.get(name, 0)) for r in records]
+
+    @staticmethod
+    def _tokens(record, field):
+        """获取记录的地区或类型列表，兼容已经One-Hot编码的记录"""
+        value = record.get(field)
+        if value is None:
+            prefix = field + "_"
+            return [key[len(prefix):] for key, flag in record.items()
+                    if key.startswith(prefix) and flag]
+        return parse_list(value)
+
+    def transform(self, records):
+        """
+        把一批影视作品转换为特征矩阵
+
+        参数:
+        records: 影视作品字典的列表（格式与get_user_input()或cleaned_data.json相同）
+
+        返回:
+        形状为(记录数, 特征数)的float64矩阵，列顺序与feature_names一致
+        """
+        if isinstance(records, dict):
+            records = [records]
+        elif not isinstance(records, list):
+            records = list(records)
+
+        with span("feature_build"):
+            return self._transform(records)
+
+    def _numeric_values(self, records):
+        """逐列计算数值列，返回 [(列号, 取值列表), ...]"""
+        watch_times = None
+        if "watch_year" in self.column_index or "watch_quarter" in self.column_index:
+            watch_times = [parse_watch_time(r.get("watch_time")) for r in records]
+        return [(col, self._numeric_column(name, records, watch_times)) for col, name in self.numeric_columns]
+
+    def _flag_positions(self, records):
+        """收集所有地区、类型标志位的(行, 列)位置"""
+        rows = []
+        cols = []
+        for field, index in (("region", self.region_index), ("genre", self.genre_index)):
+            if not index:
+                continue
+            for row, record in enumerate(records):
+                tokens = record.get(field)
+                if type(tokens) is not list:
+                    tokens = self._tokens(record, field)
+                hits = [index[token] for token in tokens if token in index]
+                if hits:
+                    cols.extend(hits)
+                    rows.extend([row] * len(hits))
+        return rows, cols
+
+    def _transform(self, records):
+        X = np.zeros((len(records), self.n_features), dtype=np.float64)
+        if not records:
+            return X
+
+        # 数值列
+        for col, values in self._numeric_values(records):
+            X[:, col] = values
+
+        # 地区和类型：收集所有(行, 列)位置后一次性赋值
+        rows, cols = self._flag_positions(records)
+        if rows:
+            X[rows, cols] = 1.0
+
+        return X
+
+    def transform_encoded(self, numeric, numeric_names, watch_time, titles, multihot):
+        """
+        直接用列式存储数据块中的数组构建特征矩阵，不需要先还原为逐条记录的字典
+        （结果与transform(EncodedStore.iter_records())一致）
+
+        参数:
+        numeric: 形状为(行数, 数值列数)的矩阵
+        numeric_names: numeric各列的名称
+        watch_time: 观看时间（datetime64[ms]，缺失为NaT）
+        titles: 片名列表
+        multihot: {字段: (CSR矩阵, 词表)}，包含地区、类型、导演和演员
+
+        返回:
+        形状为(行数, 特征数)的float64矩阵，列顺序与feature_names一致
+        """
+        n_rows = len(titles)
+        X = np.zeros((n_rows, self.n_features), dtype=np.float64)
+        if n_rows == 0:
+            return X
+
+        with span("feature_build"):
+            numeric_index = {name: j for j, name in enumerate(numeric_names)}
+            missing_time = np.isnat(watch_time)
+            for col, name in self.numeric_columns:
+                if name == "watch_year":
+                    values = watch_time.astype("datetime64[Y]").astype(np.int64) + 1970.0
+                elif name == "watch_quarter":
+                    values = watch_time.astype("datetime64[M]").astype(np.int64) % 12 // 3 + 1.0
+                elif name == "title_length":
+                    values = [len(title.split()) if isinstance(title, str) else np.nan for title in titles]
+                elif name in ("director_count", "cast_count"):
+                    values = np.diff(multihot[name[:-len("_count")]][0].indptr)
+                elif name in numeric_index:
+                    values = numeric[:, numeric_index[name]]
+                    if name == "douban_score" and self.default_douban_score is not None:
+                        values = np.where(np.isnan(values), self.default_douban_score, values)
+                else:
+                    # 未知的数值列为0（与transform()中记录没有该字段时一致）
+                    continue
+                X[:, col] = values
+                if name in ("watch_year", "watch_quarter"):
+                    X[missing_time, col] = np.nan
+
+            # 地区和类型：词表中的序号映射为特征列，不在训练特征中的标签忽略
+            for field, index in (("region", self.region_index), ("genre", self.genre_index)):
+                if not index or field not in multihot:
+                    continue
+                matrix, vocab = multihot[field]
+                columns = np.array([index.get(token, -1) for token in vocab], dtype=np.intp)
+                rows = np.repeat(np.arange(n_rows), np.diff(matrix.indptr))
+                cols = columns[matrix.indices]
+                known = cols >= 0
+                X[rows[known], cols[known]] = 1.0
+        return X
+
+    def transform_packed(self, records):
+        """
+        把一批影视作品转换为按位压缩的特征（地区、类型每个标志只占1位），
+        适合对大量候选作品打分：只在模型需要时用PackedFeatures.iter_dense()逐块展开为float64矩阵
+
+        参数:
+        records: 影视作品字典的列表
+
+        返回:
+        PackedFeatures实例
+        """
+        if isinstance(records, dict):
+            records = [records]
+        elif not isinstance(records, list):
+            records = list(records)
+
+        with span("feature_build"):
+            numeric = np.zeros((len(records), len(self.numeric_columns)), dtype=np.float64)
+            bits = np.zeros((len(records), (len(self.flag_columns) + 7) // 8), dtype=np.uint8)
+            if records:
+                for j, (_, values) in enumerate(self._numeric_values(records)):
+                    numeric[:, j] = values
+                rows, cols = self._flag_positions(records)
+                if rows:
+                    # 标志位k在第k//8个字节中，与np.packbits一致按高位在前排列
+                    slots = self.flag_slot[cols]
+                    masks = (0x80 >> (slots & 7)).astype(np.uint8)
+                    np.bitwise_or.at(bits, (np.asarray(rows, dtype=np.intp), slots >> 3), masks)
+            return PackedFeatures(numeric, bits, [col for col, _ in self.numeric_columns], self.flag_columns,
+                                  self.n_features)
+
+    def transform_one(self, record):
+        """
+        转换单个影视作品
+
+        返回:
+        形状为(1, 特征数)的特征矩阵
+        """
+        return self.transform([record])
+
+    def to_frame(self, X):
+        """把特征矩阵包装为带列名的DataFrame（不复制数据）"""
+        return pd.DataFrame(X, columns=self.feature_names, copy=False)
+
+    def transform_frame(self, records):
+        """转换并返回带列名的DataFrame，便于兼容使用DataFrame的旧代码"""
+        return self.to_frame(self.transform(records))
+
+class PackedFeatures:
+    """
+    按位压缩的特征矩阵：数值列保存为float64矩阵，地区、类型的标志位用np.packbits的格式
+    保存为uint8位图（每个标志1位，而不是float64的8字节）
+    """
+
+    def __init__(self, numeric, bits, numeric_columns, flag_columns, n_features):
+        """
+        参数:
+        numeric: 形状为(行数, 数值列数)的float64矩阵
+        bits: 形状为(行数, ceil(标志数/8))的uint8位图
+        numeric_columns: 数值列在完整特征矩阵中的列号
+        flag_columns: 标志位在完整特征矩阵中的列号
+        n_features: 完整特征矩阵的列数
+        """
+        self.numeric = numeric
+        self.bits = bits
+        self.numeric_columns = np.asarray(numeric_columns, dtype=np.intp)
+        self.flag_columns = np.asarray(flag_columns, dtype=np.intp)
+        self.n_features = n_features
+
+    def __len__(self):
+        return self.numeric.shape[0]
+
+    @property
+    def nbytes(self):
+        """数据占用的字节数"""
+        return self.numeric.nbytes + self.bits.nbytes
+
+    def to_dense(self, start=0, stop=None, out=None):
+        """
+        把[start, stop)行展开为float64特征矩阵（列顺序与feature_names一致）
+
+        参数:
+        start, stop: 行范围
+        out: 形状为(stop - start, 特征数)的float64矩阵，提供时直接写入，不再分配新的内存
+
+        返回:
+        展开后的特征矩阵
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        if out is None:
+            out = np.empty((stop - start, self.n_features), dtype=np.float64)
+        out[:, self.numeric_columns] = self.numeric[start:stop]
+        out[:, self.flag_columns] = np.unpackbits(self.bits[start:stop], axis=1, count=len(self.flag_columns))
+        return out
+
+    def iter_dense(self, block_size=16384):
+        """
+        逐块展开为float64特征矩阵，所有块共用同一块缓冲区（使用方应在取下一块之前用完当前块）
+
+        返回:
+        (起始行, 特征矩阵) 的生成器
+        """
+        buffer = np.empty((min(block_size, len(self)), self.n_features), dtype=np.float64)
+        for start in range(0, len(self), block_size):
+            stop = min(start + block_size, len(self))
+            yield start, self.to_dense(start, stop, buffer[:stop - start])
+
+@functools.lru_cache(maxsize=16)
+def _cached_vectorizer(feature_names, default_douban_score):
+    return FeatureVectorizer(feature_names, default_douban_score)
+
+def get_vectorizer(feature_names, default_douban_score=None):
+    """
+    获取特征构建器，相同的特征名称列表在进程内只构建一次
+
+    参数:
+    feature_names: 训练时的特征名称列表
+    default_douban_score: 豆瓣评分缺失时的填充值
+
+    返回:
+    FeatureVectorizer实例
+    """
+    return _cached_vectorizer(tuple(feature_names), default_douban_score)
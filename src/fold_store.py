@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+交叉验证折存储
+把特征工程后的训练/测试划分（与save_models.py相同）、填充后的训练矩阵以及交叉验证各折的下标和矩阵
+只构建一次，保存为.npy文件，训练脚本和工作进程以内存映射方式读取，不再复制:
+- models/fold_store/<键>/meta.json: 特征顺序、数据类型、划分参数和来源数据的哈希
+- X_train.npy、X_test.npy（填充前）、y_train.npy、y_test.npy、train_index.npy、test_index.npy
+- imputer.joblib: 在训练集上拟合的imputer（save_models.py直接保存到模型包中）
+- X_train_imputed.npy: 用该imputer填充后的训练矩阵
+- folds_<折数>/fold_<i>/: 该折的下标（train_idx、valid_idx）和填充后的矩阵（X_train、y_train、X_valid、y_valid）
+
+键由输入数据文件（列式存储或One-Hot编码后的JSON）的内容哈希、特征定义（包括特征工程代码的源代码哈希）
+和划分参数决定，数据和特征工程都没有变化时直接复用，完全跳过加载和特征工程
+
+用法:
+python src/fold_store.py                 构建（或复用）折存储并显示信息
+python src/fold_store.py --cv 5 --prune  同时构建5折矩阵，并删除其他版本的折存储
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import joblib
+import numpy as np
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.columnar_store import DEFAULT_JSON_PATH, DEFAULT_STORE_PATH
+from src.features import BASIC_FEATURES, NON_FEATURE_COLUMNS
+
+FORMAT_VERSION = 2
+
+# 默认目录
+DEFAULT_FOLD_STORE_DIR = "models/fold_store"
+
+def content_digest(*arrays):
+    """数组内容（包括数据类型和形状）的哈希，用作折的键"""
+    h = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        h.update(str(array.dtype).encode())
+        h.update(str(array.shape).encode())
+        h.update(array.tobytes())
+    return h.hexdigest()[:16]
+
+def _hash_file(h, path):
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+
+def source_digest(json_path=DEFAULT_JSON_PATH, store_path=DEFAULT_STORE_PATH):
+    """
+    训练数据文件的内容哈希（与load_encoded_frame()的读取顺序一致：优先列式存储，其次JSON）
+
+    返回:
+    十六进制字符串
+    """
+    h = hashlib.sha256()
+    if os.path.exists(os.path.join(store_path, "schema.json")):
+        for directory, dirnames, filenames in os.walk(store_path):
+            dirnames.sort()
+            for name in sorted(filenames):
+                path = os.path.join(directory, name)
+                h.update(os.path.relpath(path, store_path).replace(os.sep, "/").encode("utf-8"))
+                _hash_file(h, path)
+    else:
+        _hash_file(h, json_path)
+    return h.hexdigest()
+
+def feature_code_digest():
+    """
+    特征工程代码的源代码哈希（add_engineered_features()、它使用的parse_list()和compute_training_split()），
+    修改特征定义后自动使用新的折存储
+
+    返回:
+    十六进制字符串
+    """
+    import inspect
+    from src import features
+
+    h = hashlib.sha256()
+    for function in (features.parse_list, features.add_engineered_features, compute_training_split):
+        h.update(inspect.getsource(function).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+def store_key(test_size=0.2, random_state=42, source=None):
+    """
+    折存储的键：来源数据的哈希 + 特征定义 + 特征工程代码的哈希 + 划分参数
+
+    参数:
+    test_size: 测试集比例
+    random_state: 划分的随机种子
+    source: source_digest()的结果，None表示重新计算
+    """
+    spec = {
+        "format_version": FORMAT_VERSION,
+        "source": source or source_digest(),
+        "basic_features": BASIC_FEATURES,
+        "non_feature_columns": NON_FEATURE_COLUMNS,
+        "feature_code": feature_code_digest(),
+        "test_size": test_size,
+        "random_state": random_state,
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def compute_training_split(test_size=0.2, random_state=42):
+    """
+    加载训练数据、添加衍生特征，并按save_models.py的方式划分训练集和测试集
+
+    返回:
+    (X_train, X_test, y_train, y_test) 元组，X为DataFrame
+    """
+    from sklearn.model_selection import train_test_split
+    from src.columnar_store import load_encoded_frame
+    from src.features import add_engineered_features
+
+    encoded_df = add_engineered_features(load_encoded_frame())
+    feature_columns = [col for col in encoded_df.columns if col not in NON_FEATURE_COLUMNS]
+    return train_test_split(encoded_df[feature_columns], encoded_df["user_score"],
+                            test_size=test_size, random_state=random_state)
+
+def _save_array(path, array):
+    """先写临时文件再替换，中断时不会留下不完整的文件（保留数组的内存布局，按列存储的矩阵仍按列存储）"""
+    tmp_path = path + ".tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+class FoldStore:
+    """
+    一个版本的折存储（只读，数组以内存映射方式打开）
+    """
+
+    def __init__(self, path):
+        """
+        参数:
+        path: 折存储目录（models/fold_store/<键>）
+        """
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"不支持的折存储格式版本: {self.meta.get('format_version')}")
+
+    @property
+    def key(self):
+        return self.meta["key"]
+
+    @property
+    def feature_names(self):
+        """特征顺序"""
+        return list(self.meta["feature_names"])
+
+    def array(self, name):
+        """以内存映射方式打开一个数组（如X_train、y_test）"""
+        return np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+
+    def split(self):
+        """
+        还原为与compute_training_split()相同的划分（列的数据类型和行索引保持一致）
+
+        返回:
+        (X_train, X_test, y_train, y_test) 元组，X为DataFrame，y为Series
+        """
+        import pandas as pd
+
+        dtypes = self.meta["dtypes"]
+        parts = []
+        for part in ("train", "test"):
+            X = self.array(f"X_{part}")
+            index = pd.Index(np.asarray(self.array(f"{part}_index")))
+            columns = {}
+            for i, name in enumerate(self.feature_names):
+                values = X[:, i]
+                dtype = dtypes[name]
+                # 整数列在float64矩阵中保存，没有缺失值时还原为原来的类型
+                columns[name] = values.astype(dtype) if dtype != "float64" and not np.isnan(values).any() \
+                    else np.array(values)
+            parts.append((pd.DataFrame(columns, index=index),
+                          pd.Series(np.asarray(self.array(f"y_{part}")).astype(self.meta["target_dtype"]),
+                                    index=index, name=self.meta["target"])))
+        (X_train, y_train), (X_test, y_test) = parts
+        return X_train, X_test, y_train, y_test
+
+    def imputer(self):
+        """在训练集上拟合的imputer（均值填充）"""
+        return joblib.load(os.path.join(self.path, "imputer.joblib"))
+
+    def imputed_train(self):
+        """用imputer()填充后的训练矩阵（内存映射）"""
+        return self.array("X_train_imputed")
+
+    def folds(self, n_splits=5):
+        """
+        交叉验证各折（与GridSearchCV默认的KFold一致，不打乱顺序），第一次使用时构建
+
+        每一折的imputer只在该折的训练部分上拟合，避免验证部分的信息泄露到填充值中
+
+        参数:
+        n_splits: 折数
+
+        返回:
+        折信息列表，每项包含key（该折数据的内容哈希，用于得分缓存）、X_train、y_train、X_valid、y_valid、
+        train_idx、valid_idx的.npy文件路径
+        """
+        folds_dir = os.path.join(self.path, f"folds_{n_splits}")
+        meta_path = os.path.join(folds_dir, "folds.json")
+        if not os.path.exists(meta_path):
+            self._build_folds(folds_dir, n_splits)
+        with open(meta_path, "r", encoding="utf-8") as f:
+            keys = json.load(f)["keys"]
+
+        folds = []
+        for i, key in enumerate(keys):
+            fold_dir = os.path.join(folds_dir, f"fold_{i}")
+            folds.append({"key": key, **{name: os.path.join(fold_dir, f"{name}.npy") for name in
+                                         ("X_train", "y_train", "X_valid", "y_valid", "train_idx", "valid_idx")}})
+        return folds
+
+    def _build_folds(self, folds_dir, n_splits):
+        from sklearn.impute import SimpleImputer
+        from sklearn.model_selection import KFold
+
+        X = self.array("X_train")
+        y = self.array("y_train").astype(np.float64)
+        keys = []
+        for i, (train_idx, valid_idx) in enumerate(KFold(n_splits=n_splits).split(X)):
+            fold_dir = os.path.join(folds_dir, f"fold_{i}")
+            os.makedirs(fold_dir, exist_ok=True)
+            imputer = SimpleImputer(strategy="mean")
+            arrays = {
+                "train_idx": train_idx,
+                "valid_idx": valid_idx,
+                "X_train": imputer.fit_transform(X[train_idx]),
+                "y_train": y[train_idx],
+                "X_valid": imputer.transform(X[valid_idx]),
+                "y_valid": y[valid_idx],
+            }
+            for name, array in arrays.items():
+                _save_array(os.path.join(fold_dir, f"{name}.npy"), array)
+            # 与填充前的数据内容对应，数据不变时得分缓存继续有效
+            keys.append(content_digest(X[train_idx], y[train_idx], X[valid_idx], y[valid_idx]))
+
+        tmp_path = os.path.join(folds_dir, "folds.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"n_splits": n_splits, "keys": keys}, f, indent=2)
+        os.replace(tmp_path, os.path.join(folds_dir, "folds.json"))
+
+def build_fold_store(path, test_size=0.2, random_state=42, source=None):
+    """
+    构建折存储（先写入临时目录再改名）
+
+    参数:
+    path: 目标目录
+    test_size: 测试集比例
+    random_state: 划分的随机种子
+    source: source_digest()的结果（只记录在meta.json中）
+
+    返回:
+    FoldStore实例
+    """
+    from sklearn.impute import SimpleImputer
+
+    X_train, X_test, y_train, y_test = compute_training_split(test_size, random_state)
+    parent = os.path.dirname(path) or "."
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".building-", dir=parent)
+    try:
+        arrays = {
+            "X_train": X_train.to_numpy(dtype=np.float64),
+            "X_test": X_test.to_numpy(dtype=np.float64),
+            "y_train": y_train.to_numpy(dtype=np.float64),
+            "y_test": y_test.to_numpy(dtype=np.float64),
+            "train_index": X_train.index.to_numpy(),
+            "test_index": X_test.index.to_numpy(),
+        }
+        imputer = SimpleImputer(strategy="mean").fit(X_train)
+        arrays["X_train_imputed"] = imputer.transform(X_train)
+        for name, array in arrays.items():
+            _save_array(os.path.join(tmp_dir, f"{name}.npy"), array)
+        joblib.dump(imputer, os.path.join(tmp_dir, "imputer.joblib"))
+
+        meta = {
+            "format_version": FORMAT_VERSION,
+            "key": os.path.basename(path),
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "source": source,
+            "test_size": test_size,
+            "random_state": random_state,
+            "feature_names": list(X_train.columns),
+            "dtypes": {col: str(X_train[col].dtype) for col in X_train.columns},
+            "target": y_train.name,
+            "target_dtype": str(y_train.dtype),
+            "n_train": len(X_train),
+            "n_test": len(X_test),
+        }
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        try:
+            os.rename(tmp_dir, path)
+        except OSError:
+            # 其他进程已经构建了同一个版本
+            if not os.path.exists(os.path.join(path, "meta.json")):
+                raise
+    finally:
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return FoldStore(path)
+
+def open_fold_store(test_size=0.2, random_state=42, root=DEFAULT_FOLD_STORE_DIR, rebuild=False):
+    """
+    打开与当前训练数据对应的折存储，不存在时构建
+
+    参数:
+    test_size: 测试集比例
+    random_state: 划分的随机种子
+    root: 折存储的根目录
+    rebuild: 是否丢弃已有的同版本折存储并重新构建
+
+    返回:
+    FoldStore实例
+    """
+    source = source_digest()
+    path = os.path.join(root, store_key(test_size, random_state, source))
+    if os.path.exists(os.path.join(path, "meta.json")):
+        if not rebuild:
+            return FoldStore(path)
+        shutil.rmtree(path)
+    return build_fold_store(path, test_size, random_state, source)
+
+def prune(root=DEFAULT_FOLD_STORE_DIR, keep=()):
+    """删除keep以外的折存储版本，返回删除的数量"""
+    if not os.path.isdir(root):
+        return 0
+    removed = 0
+    for name in os.listdir(root):
+        if name not in keep:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+            removed += 1
+    return removed
+
+def main():
+    parser = argparse.ArgumentParser(description="构建交叉验证折存储")
+    parser.add_argument("--root", default=DEFAULT_FOLD_STORE_DIR, help="折存储的根目录")
+    parser.add_argument("--cv", type=int, default=None, help="同时构建该折数的交叉验证矩阵")
+    parser.add_argument("--rebuild", action="store_true", help="重新构建当前版本")
+    parser.add_argument("--prune", action="store_true", help="删除其他版本的折存储")
+    args = parser.parse_args()
+
+    start = datetime.datetime.now()
+    store = open_fold_store(root=args.root, rebuild=args.rebuild)
+    if args.cv:
+        store.folds(args.cv)
+    seconds = (datetime.datetime.now() - start).total_seconds()
+    print(f"折存储: {store.path}（训练集 {store.meta['n_train']} 行，测试集 {store.meta['n_test']} 行，"
+          f"{len(store.feature_names)} 个特征），耗时 {seconds:.2f} 秒")
+    if args.prune:
+        print(f"已删除 {prune(args.root, keep=(store.key,))} 个旧版本")
+
+if __name__ == "__main__":
+    main()
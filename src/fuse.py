@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+融合集成模型
+把imputer的均值填充合并进Ridge和树模型中，得到一个直接接受含缺失值特征矩阵的预测器，
+预测时不再对整个矩阵做一次填充复制
+
+对Ridge: ridge(填充(x)) = b + Σ w_j·x_j (x_j不缺失) + Σ w_j·μ_j (x_j缺失)，
+即对不含缺失值的行直接计算 X·w + b，只对含缺失值的行加上预先计算好的 w_j·μ_j。
+对树模型: 缺失值填充为μ_j后在节点上的走向是固定的（float32(μ_j) <= 阈值），
+直接写入扁平化树的缺失值走向即可。
+
+用法:
+python src/fuse.py    生成models/fused_ensemble.joblib并检查与原始流程的一致性
+"""
+
+import argparse
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.tree_export import FLAT_TREE_MAX_ROWS, FlatTreeEnsemble
+from src.instrumentation import span
+
+# 集成成员的顺序与predict_with_ensemble保持一致
+MEMBER_ORDER = ("ridge", "dt", "rf")
+
+class FusedEnsemble:
+    """
+    融合后的集成预测器：线性成员 + 树成员，imputer的统计量已经合并在内
+    """
+
+    def __init__(self, feature_names, fill_values, ridge=None, trees=None):
+        """
+        参数:
+        feature_names: 特征名称列表（输入矩阵的列顺序）
+        fill_values: 每个特征的缺失值填充值（imputer.statistics_）
+        ridge: (系数, 截距) 元组，没有线性成员时为None
+        trees: [(名称, sklearn模型, 已写入缺失值走向的FlatTreeEnsemble), ...]
+        """
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        self.fill_values = np.asarray(fill_values, dtype=np.float64)
+        self.n_features_in_ = len(self.fill_values)
+        self.trees = list(trees or [])
+
+        self.coef = None
+        self.intercept = 0.0
+        self.nan_offset = None
+        if ridge is not None:
+            self.coef = np.asarray(ridge[0], dtype=np.float64).ravel()
+            self.intercept = float(np.ravel(ridge[1])[0]) if np.ndim(ridge[1]) else float(ridge[1])
+            # 缺失值对线性项的贡献 w_j·μ_j
+            self.nan_offset = self.coef * self.fill_values
+
+    @property
+    def member_names(self):
+        """成员名称（按集成顺序）"""
+        names = ["ridge"] if self.coef is not None else []
+        return names + [name for name, _, _ in self.trees]
+
+    def _linear(self, X, nan_mask, nan_rows):
+        """计算线性成员，只对含缺失值的行单独处理"""
+        pred = X @ self.coef + self.intercept
+        if nan_rows.size:
+            X_nan = X[nan_rows]
+            mask = nan_mask[nan_rows]
+            X_nan[mask] = 0.0
+            pred[nan_rows] = X_nan @ self.coef + mask @ self.nan_offset + self.intercept
+        return pred
+
+    def _tree(self, model, flat, X, X_filled):
+        """
+        计算树成员：小批量走扁平化遍历（缺失值走向已写入树中），
+        大批量走sklearn，输入为填充后的矩阵（只预测一次，不依赖sklearn对缺失值的支持）
+        """
+        if model is None or X.shape[0] <= FLAT_TREE_MAX_ROWS:
+            return flat.predict(X)
+        return model.predict(X_filled)
+
+    def predict_members(self, X):
+        """
+        计算每个成员的预测值
+
+        参数:
+        X: 形状为(行数, 特征数)的特征矩阵，可以包含缺失值(nan)
+
+        返回:
+        {成员名称: 预测值数组} 字典，顺序与集成顺序一致
+        """
+        if isinstance(X, pd.DataFrame):
+            X = X.to_numpy(dtype=np.float64)
+        X = np.asarray(X, dtype=np.float64)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"特征数量不匹配: 输入为{X.shape[1]}个，模型需要{self.n_features_in_}个")
+
+        # 融合模型不单独填充缺失值，impute阶段只包括定位缺失值
+        with span("impute"):
+            nan_mask = np.isnan(X)
+            nan_rows = np.flatnonzero(nan_mask.any(axis=1))
+
+        predictions = {}
+        if self.coef is not None:
+            with span("ridge"):
+                predictions["ridge"] = self._linear(X, nan_mask, nan_rows)
+        # 大批量的树成员需要填充后的矩阵，只在有缺失值时生成一次，所有树成员共用
+        X_filled = X
+        if nan_rows.size and X.shape[0] > FLAT_TREE_MAX_ROWS and any(model is not None for _, model, _ in self.trees):
+            with span("impute"):
+                X_filled = np.where(nan_mask, self.fill_values, X)
+        for name, model, flat in self.trees:
+            with span(name):
+                predictions[name] = self._tree(model, flat, X, X_filled)
+        return predictions
+
+    def predict(self, X):
+        """
+        集成预测（各成员的平均值），与“imputer填充后分别预测再取平均”一致
+
+        参数:
+        X: 形状为(行数, 特征数)的特征矩阵，可以包含缺失值(nan)
+
+        返回:
+        预测值数组
+        """
+        predictions = list(self.predict_members(X).values())
+        if not predictions:
+            raise ValueError("融合模型中没有可用的成员")
+        with span("aggregate"):
+            total = predictions[0].copy()
+            for pred in predictions[1:]:
+                total += pred
+            total /= len(predictions)
+        return total
+
+def fuse_models(models):
+    """
+    把imputer、Ridge、决策树和随机森林融合为一个预测器
+
+    参数:
+    models: 从load_models()加载的模型字典
+
+    返回:
+    FusedEnsemble实例
+    """
+    imputer = models.get("imputer")
+    feature_names = models.get("feature_names")
+
+    # 确定特征数量和填充值；没有imputer时不做填充
+    n_features = None
+    for name in MEMBER_ORDER:
+        if name in models:
+            n_features = models[name].n_features_in_
+            break
+    if n_features is None:
+        raise ValueError("没有可融合的模型")
+
+    if imputer is not None:
+        fill_values = np.asarray(imputer.statistics_, dtype=np.float64)
+        if len(fill_values) != n_features or np.isnan(fill_values).any():
+            raise ValueError("imputer会删除或改变特征列，无法融合")
+        if getattr(imputer, "add_indicator", False):
+            raise ValueError("imputer带有缺失指示列，无法融合")
+    else:
+        fill_values = np.full(n_features, np.nan)
+
+    ridge = None
+    if "ridge" in models:
+        ridge = (models["ridge"].coef_, models["ridge"].intercept_)
+
+    trees = []
+    for name in ("dt", "rf"):
+        if name not in models:
+            continue
+        model = models[name]
+        flat = FlatTreeEnsemble.from_model(model)
+        if imputer is not None:
+            # 缺失值填充为μ后的走向：与sklearn一致，比较前转换为float32
+            fill32 = fill_values.astype(np.float32)[flat.feature]
+            flat = FlatTreeEnsemble(flat.feature, flat.threshold, flat.left, flat.right, flat.value,
+                                    fill32 <= flat.threshold, flat.roots, flat.max_depth, flat.n_features)
+        trees.append((name, model, flat))
+
+    return FusedEnsemble(feature_names, fill_values, ridge, trees)
+
+def check_parity(models, fused, n_rows=20000, nan_rate=0.1, seed=42):
+    """
+    用随机输入检查融合模型与原始流程（imputer + 分别预测 + 平均）的差异
+
+    返回:
+    {批大小: 最大绝对误差} 字典
+    """
+    rng = np.random.default_rng(seed)
+    center = fused.fill_values
+    X = rng.normal(np.nan_to_num(center), np.abs(np.nan_to_num(center)) * 0.1 + 0.5,
+                   size=(n_rows, fused.n_features_in_))
+    X[rng.random(X.shape) < nan_rate] = np.nan
+
+    imputer = models.get("imputer")
+    results = {}
+    for batch_size in (1, 100, n_rows):
+        X_batch = X[:batch_size]
+        X_imputed = X_batch
+        if imputer is not None:
+            X_imputed = imputer.transform(pd.DataFrame(X_batch, columns=imputer.feature_names_in_)
+                                          if hasattr(imputer, "feature_names_in_") else X_batch)
+        expected = np.mean([models[name].predict(X_imputed) for name in MEMBER_ORDER if name in models], axis=0)
+        results[batch_size] = float(np.max(np.abs(expected - fused.predict(X_batch))))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="生成融合集成模型")
+    parser.add_argument("--models-dir", default="models", help="模型目录")
+    parser.add_argument("--output", default=None, help="输出文件，默认为<models-dir>/fused_ensemble.joblib")
+    args = parser.parse_args()
+
+    import joblib
+    from src.load_models import load_models
+    # 以脚本方式运行时从模块路径导入，保存的模型才能在其他模块中加载
+    from src.fuse import fuse_models as fuse
+
+    models = load_models(args.models_dir)
+    fused = fuse(models)
+
+    print(f"融合成员: {', '.join(fused.member_names)}")
+    for batch_size, diff in check_parity(models, fused).items():
+        print(f"批大小 {batch_size:>6}: 与原始流程的最大绝对误差 {diff:.2e}")
+
+    output = args.output or os.path.join(args.models_dir, "fused_ensemble.joblib")
+    joblib.dump(fused, output)
+    print(f"已保存到 {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+增量训练
+有新的评分记录时不从头训练集成模型：
+- Ridge: 保存训练数据的充分统计量（XᵀX、Xᵀy、列和、标签和），加入新数据后直接求解闭式解，
+  结果与在全部数据上重新训练一致
+- 随机森林: 用warm_start在新数据（加上最近的一小部分历史数据）上添加新树，同时淘汰同样数量的最旧的树
+- 决策树、imputer和稀疏Ridge（save_models.py --sparse训练的sparse_ridge）在增量更新中保持不变
+更新后的成员写回模型包ensemble.bundle（生成新的模型包版本）
+新数据上的预测误差或特征分布漂移超过阈值时，回退为完整的重新训练（save_models.py）
+增量状态记录已处理记录的最晚观看时间（高水位），每次只读取不早于高水位的记录
+
+用法:
+python src/incremental.py --init     根据当前模型和训练数据初始化增量状态
+python src/incremental.py            把新的评分记录增量加入模型
+python src/incremental.py --full     强制完整重新训练
+"""
+
+import argparse
+import os
+import sys
+import time
+import joblib
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.features import NON_FEATURE_COLUMNS
+from src.model_bundle import ModelBundle, find_bundle, write_bundle
+
+# 默认路径
+DEFAULT_STATE_PATH = "models/incremental_state.joblib"
+
+# 不参与漂移检查的特征
+DRIFT_EXCLUDED = ("watch_year", "watch_quarter")
+
+def _row_keys(frame):
+    """每条记录的键：片名 + 观看时间"""
+    watch_time = frame["watch_time"].astype(str)
+    return [f"{title}\t{time}" for title, time in zip(frame["title"], watch_time)]
+
+def _boundary_keys(frame, high_water_mark):
+    """
+    观看时间等于高水位或缺失的记录的键：下次按高水位读取时只有这些已处理的记录会被再次读到
+    """
+    watch_time = frame["watch_time"]
+    mask = watch_time.isna()
+    if high_water_mark is not None:
+        mask |= watch_time == high_water_mark
+    return set(_row_keys(frame[mask]))
+
+def _latest_watch_time(frame, high_water_mark=None):
+    """记录中最晚的观看时间与原高水位中较晚的一个（都缺失时为None）"""
+    latest = frame["watch_time"].max()
+    if pd.isna(latest):
+        return high_water_mark
+    return latest if high_water_mark is None else max(latest, high_water_mark)
+
+def load_encoded_training_frame(min_watch_time=None, douban_score_fill=None):
+    """
+    加载训练数据并添加衍生特征
+
+    参数:
+    min_watch_time: 只加载观看时间不早于该时间或观看时间缺失的记录，None表示加载全部
+    douban_score_fill: 豆瓣评分缺失时的填充值，None表示使用所加载记录的均值
+                       （只加载部分记录时应传入训练集的均值，与完整训练保持一致）
+
+    返回:
+    (DataFrame, 特征列列表) 元组
+    """
+    from src.columnar_store import load_encoded_frame
+    from src.features import add_engineered_features
+
+    encoded_df = load_encoded_frame(min_watch_time=min_watch_time)
+    if douban_score_fill is not None:
+        encoded_df["douban_score"] = encoded_df["douban_score"].fillna(douban_score_fill)
+    encoded_df = add_engineered_features(encoded_df)
+    feature_columns = [col for col in encoded_df.columns if col not in NON_FEATURE_COLUMNS]
+    return encoded_df, feature_columns
+
+def solve_ridge(stats, alpha):
+    """
+    根据充分统计量求解带截距的Ridge回归（与sklearn.linear_model.Ridge的结果一致）
+
+    参数:
+    stats: 包含n、sum_x、sum_y、xtx、xty的字典
+    alpha: 正则化系数
+
+    返回:
+    (系数, 截距) 元组
+    """
+    n = stats["n"]
+    mean_x = stats["sum_x"] / n
+    mean_y = stats["sum_y"] / n
+    # 中心化后的 XᵀX 和 Xᵀy
+    sxx = stats["xtx"] - n * np.outer(mean_x, mean_x)
+    sxy = stats["xty"] - n * mean_x * mean_y
+    coef = np.linalg.solve(sxx + alpha * np.eye(len(mean_x)), sxy)
+    return coef, float(mean_y - mean_x @ coef)
+
+def _ridge_stats(X, y):
+    return {
+        "n": len(y),
+        "sum_x": X.sum(axis=0),
+        "sum_y": float(y.sum()),
+        "xtx": X.T @ X,
+        "xty": X.T @ y,
+    }
+
+class IncrementalTrainer:
+    """
+    集成模型的增量训练器
+    """
+
+    def __init__(self, models_dir="models", state_path=DEFAULT_STATE_PATH, error_tolerance=0.25,
+                 drift_threshold=4.0, min_drift_rows=20, min_error_rows=20, max_new_tree_fraction=0.25,
+                 replay_size=256):
+        """
+        参数:
+        models_dir: 模型目录
+        state_path: 增量状态文件
+        error_tolerance: 新数据上的平均绝对误差超过基准误差的(1 + error_tolerance)倍时完整重新训练
+        drift_threshold: 新数据的特征均值偏离训练集均值超过该倍数的标准误差（std / sqrt(新记录数)）时完整重新训练
+        min_drift_rows: 新记录少于该数量时不检查特征漂移
+        min_error_rows: 新记录少于该数量时不检查误差（少量记录的平均绝对误差波动太大）
+        max_new_tree_fraction: 每次最多替换的随机森林树的比例
+        replay_size: 训练新树时一起使用的最近历史记录数量
+        """
+        self.models_dir = models_dir
+        self.state_path = state_path
+        self.error_tolerance = error_tolerance
+        self.drift_threshold = drift_threshold
+        self.min_drift_rows = min_drift_rows
+        self.min_error_rows = min_error_rows
+        self.max_new_tree_fraction = max_new_tree_fraction
+        self.replay_size = replay_size
+        self.state = None
+
+    def _model_path(self, name):
+        return os.path.join(self.models_dir, f"best_{name}.joblib")
+
+    def _load_members(self):
+        """加载imputer、Ridge、决策树和随机森林（优先从模型包加载）"""
+        path = find_bundle(self.models_dir)
+        if path is not None:
+            bundle = ModelBundle(path)
+            return {name: bundle.load(name) for name in ("imputer", "ridge", "dt", "rf")}
+        members = {name: joblib.load(self._model_path(name)) for name in ("ridge", "dt", "rf")}
+        members["imputer"] = joblib.load(os.path.join(self.models_dir, "imputer.joblib"))
+        return members
+
+    def _save_members(self, members, n_new):
+        """保存增量更新后的成员：写入新的模型包版本，没有模型包时覆盖分散的模型文件"""
+        path = find_bundle(self.models_dir)
+        if path is None:
+            for name in ("ridge", "rf"):
+                joblib.dump(members[name], self._model_path(name))
+            return None
+        bundle = ModelBundle(path)
+        # 其他成员（如sparse_ridge）原样保留
+        members = dict(members)
+        for name in bundle.member_names:
+            if name not in members:
+                members[name] = bundle.load(name)
+        metrics = dict(bundle.metrics)
+        metrics["n_train"] = self.state["n_train"]
+        metrics["incremental_rows"] = metrics.get("incremental_rows", 0) + n_new
+        return write_bundle(path, members, bundle.feature_names, bundle.feature_schema, metrics, bundle.params)
+
+    def load_state(self):
+        """加载增量状态，不存在时返回None"""
+        if self.state is None and os.path.exists(self.state_path):
+            self.state = joblib.load(self.state_path)
+        return self.state
+
+    def save_state(self):
+        joblib.dump(self.state, self.state_path)
+
+    def initialize(self):
+        """
+        根据当前保存的模型和训练集（与save_models.py相同的划分）建立增量状态
+
+        测试集的记录也标记为已处理，之后只有新增的记录参与增量训练
+        """
+        from src.train import load_training_split
+
+        encoded_df, feature_columns = load_encoded_training_frame()
+        X_train, X_test, y_train, y_test = load_training_split()
+        members = self._load_members()
+        imputer = members["imputer"]
+        X_train_imputed = imputer.transform(X_train)
+        X_test_imputed = imputer.transform(X_test)
+        y_train = y_train.to_numpy(dtype=np.float64)
+
+        # 基准误差：当前集成模型在测试集上的平均绝对误差
+        pred = np.mean([members[name].predict(X_test_imputed) for name in ("ridge", "dt", "rf")], axis=0)
+        baseline_mae = float(np.mean(np.abs(pred - y_test.to_numpy(dtype=np.float64))))
+
+        # 最近的训练记录作为训练新树时的回放数据
+        order = np.argsort(encoded_df.loc[X_train.index, "watch_time"].to_numpy(), kind="stable")
+        recent = order[-self.replay_size:]
+
+        # 所有记录（包括测试集）都已处理，只需记住高水位上的记录
+        high_water_mark = _latest_watch_time(encoded_df)
+        self.state = {
+            "feature_columns": feature_columns,
+            "ridge_stats": _ridge_stats(X_train_imputed, y_train),
+            "high_water_mark": high_water_mark,
+            "seen_keys": _boundary_keys(encoded_df, high_water_mark),
+            "douban_score_fill": float(encoded_df["douban_score"].mean()),
+            "n_train": len(y_train),
+            "baseline_mae": baseline_mae,
+            "feature_mean": np.nanmean(X_train.to_numpy(dtype=np.float64), axis=0),
+            "feature_std": np.nanstd(X_train.to_numpy(dtype=np.float64), axis=0),
+            "replay_X": X_train_imputed[recent],
+            "replay_y": y_train[recent],
+        }
+        self.save_state()
+        return self.state
+
+    def _drift(self, X_new):
+        """
+        新数据的数值特征均值偏离训练集均值的最大倍数（以均值的标准误差std / sqrt(n)为单位，
+        n为该列非缺失的新记录数），即各列均值z检验统计量的最大值
+
+        地区和类型列很稀疏，少量新记录就会造成很大的偏移；观看年份和季度随时间单调变化，
+        这些列都不参与漂移检查
+        """
+        with np.errstate(invalid="ignore"):
+            mean_new = np.nanmean(X_new, axis=0)
+        n = np.sum(~np.isnan(X_new), axis=0)
+        std = self.state["feature_std"]
+        numeric = np.array([not col.startswith(("region_", "genre_")) and col not in DRIFT_EXCLUDED
+                            for col in self.state["feature_columns"]])
+        valid = numeric & (std > 0) & ~np.isnan(mean_new)
+        if not valid.any():
+            return 0.0
+        standard_error = std[valid] / np.sqrt(n[valid])
+        return float(np.max(np.abs(mean_new[valid] - self.state["feature_mean"][valid]) / standard_error))
+
+    def update(self, force_full=False):
+        """
+        把尚未处理的记录加入模型
+
+        参数:
+        force_full: 是否强制完整重新训练
+
+        返回:
+        报告字典，mode为noop（没有新记录）、incremental或full
+        """
+        start = time.perf_counter()
+        if self.load_state() is None:
+            self.initialize()
+
+        # 只读取不早于高水位的记录（旧版本的状态没有高水位，读取全部记录）
+        encoded_df, feature_columns = load_encoded_training_frame(self.state.get("high_water_mark"),
+                                                                  self.state.get("douban_score_fill"))
+        if feature_columns != self.state["feature_columns"]:
+            # 出现了新的地区或类型列，特征维度变化，只能完整重新训练
+            force_full = True
+
+        keys = _row_keys(encoded_df)
+        new_mask = np.array([key not in self.state["seen_keys"] for key in keys], dtype=bool)
+        n_new = int(new_mask.sum())
+        if n_new == 0 and not force_full:
+            if "high_water_mark" not in self.state:
+                self._advance(encoded_df)
+                self.save_state()
+            return {"mode": "noop", "new_rows": 0, "seconds": time.perf_counter() - start}
+
+        report = {"new_rows": n_new}
+        if not force_full:
+            new_df = encoded_df[new_mask]
+            X_raw = new_df[feature_columns].to_numpy(dtype=np.float64)
+            y_new = new_df["user_score"].to_numpy(dtype=np.float64)
+
+            members = self._load_members()
+            X_new = members["imputer"].transform(new_df[feature_columns])
+
+            # 先用现有模型预测新数据，检查误差和特征漂移
+            pred = np.mean([members[name].predict(X_new) for name in ("ridge", "dt", "rf")], axis=0)
+            report["new_mae"] = float(np.mean(np.abs(pred - y_new)))
+            report["baseline_mae"] = self.state["baseline_mae"]
+            report["drift"] = self._drift(X_raw) if n_new >= self.min_drift_rows else 0.0
+            error_limit = self.state["baseline_mae"] * (1 + self.error_tolerance)
+            if n_new >= self.min_error_rows and report["new_mae"] > error_limit:
+                report["reason"] = "新数据上的误差超过阈值"
+                force_full = True
+            elif report["drift"] > self.drift_threshold:
+                report["reason"] = "特征分布漂移超过阈值"
+                force_full = True
+
+        if force_full:
+            from src import save_models
+            # 原模型包包含稀疏Ridge时，完整重新训练同样训练稀疏Ridge
+            path = find_bundle(self.models_dir)
+            sparse = path is not None and "sparse_ridge" in ModelBundle(path).member_names
+            save_models.main(self.models_dir, sparse=sparse)
+            self.initialize()
+            report.update({"mode": "full", "seconds": time.perf_counter() - start})
+            return report
+
+        self._update_ridge(members["ridge"], X_new, y_new)
+        report["trees_replaced"] = self._update_forest(members["rf"], X_new, y_new)
+
+        state = self.state
+        self._advance(encoded_df)
+        state["n_train"] += n_new
+        state["replay_X"] = np.vstack([state["replay_X"], X_new])[-self.replay_size:]
+        state["replay_y"] = np.concatenate([state["replay_y"], y_new])[-self.replay_size:]
+        report["version"] = self._save_members(members, n_new)
+        self.save_state()
+
+        report.update({"mode": "incremental", "seconds": time.perf_counter() - start})
+        return report
+
+    def _advance(self, encoded_df):
+        """
+        本次读取的记录都已处理：推进高水位，只保留新高水位上的记录的键
+
+        encoded_df包含所有不早于原高水位的记录，也就包含了所有不早于新高水位的记录
+        """
+        high_water_mark = _latest_watch_time(encoded_df, self.state.get("high_water_mark"))
+        self.state["high_water_mark"] = high_water_mark
+        self.state["seen_keys"] = _boundary_keys(encoded_df, high_water_mark)
+
+    def _update_ridge(self, ridge, X_new, y_new):
+        """把新数据加入充分统计量并重新求解Ridge"""
+        stats = self.state["ridge_stats"]
+        new_stats = _ridge_stats(X_new, y_new)
+        for key in ("n", "sum_x", "sum_y", "xtx", "xty"):
+            stats[key] = stats[key] + new_stats[key]
+        coef, intercept = solve_ridge(stats, ridge.alpha)
+        ridge.coef_ = coef
+        ridge.intercept_ = intercept
+
+    def _update_forest(self, rf, X_new, y_new):
+        """
+        用warm_start添加新树并淘汰最旧的树，树的总数保持不变
+
+        新树的数量与新数据占全部训练数据的比例成正比
+        """
+        n_trees = len(rf.estimators_)
+        share = len(y_new) / (self.state["n_train"] + len(y_new))
+        n_replace = int(np.clip(round(n_trees * share), 1, max(1, int(n_trees * self.max_new_tree_fraction))))
+
+        # 新树在新数据和最近的历史数据上训练
+        X_fit = np.vstack([self.state["replay_X"], X_new])
+        y_fit = np.concatenate([self.state["replay_y"], y_new])
+        rf.set_params(warm_start=True, n_estimators=n_trees + n_replace)
+        rf.fit(X_fit, y_fit)
+
+        # 淘汰最旧的树
+        rf.estimators_ = rf.estimators_[n_replace:]
+        rf.set_params(warm_start=False, n_estimators=len(rf.estimators_))
+        return n_replace
+
+def main():
+    parser = argparse.ArgumentParser(description="集成模型的增量训练")
+    parser.add_argument("--init", action="store_true", help="根据当前模型和训练数据初始化增量状态")
+    parser.add_argument("--full", action="store_true", help="强制完整重新训练")
+    parser.add_argument("--models-dir", default="models", help="模型目录")
+    parser.add_argument("--error-tolerance", type=float, default=0.25, help="允许的误差增长比例")
+    parser.add_argument("--drift-threshold", type=float, default=4.0, help="允许的特征均值偏移（标准误差倍数）")
+    parser.add_argument("--min-drift-rows", type=int, default=20, help="检查特征漂移所需的最少新记录数")
+    parser.add_argument("--min-error-rows", type=int, default=20, help="检查新数据误差所需的最少新记录数")
+    args = parser.parse_args()
+
+    trainer = IncrementalTrainer(args.models_dir, os.path.join(args.models_dir, "incremental_state.joblib"),
+                                 args.error_tolerance, args.drift_threshold, args.min_drift_rows,
+                                 args.min_error_rows)
+    if args.init:
+        state = trainer.initialize()
+        print(f"已初始化增量状态: {state['n_train']} 条训练记录，基准误差 {state['baseline_mae']:.3f}")
+        return
+
+    report = trainer.update(force_full=args.full)
+    if report["mode"] == "noop":
+        print("没有新的评分记录")
+    elif report["mode"] == "incremental":
+        print(f"增量更新完成: 新增 {report['new_rows']} 条记录，替换 {report['trees_replaced']} 棵树，"
+              f"耗时 {report['seconds']:.2f} 秒")
+        print(f"新数据误差 {report['new_mae']:.3f}（基准 {report['baseline_mae']:.3f}），特征漂移 {report['drift']:.2f}")
+    else:
+        print(f"完整重新训练完成{'：' + report['reason'] if 'reason' in report else ''}，"
+              f"耗时 {report['seconds']:.2f} 秒")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+增量导入豆瓣导出数据
+记录已导入数据的观看时间高水位，以及观看时间等于高水位（或缺失）的记录的(片名, 观看时间)键，
+每次只清洗新增的行，把它们插入到data/cleaned_data.json的开头（文件按观看时间从新到旧排列），
+并追加到列式存储data/onehot_encoded/中，已有数据不会重新解析或重新编码
+
+用法:
+python src/ingest.py                    导入data/raw.xlsx中新增的记录
+python src/ingest.py --input export.xlsx
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import shutil
+import time
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.data_cleaning import clean_frame, read_export
+from src.columnar_store import DEFAULT_STORE_PATH, append_store
+
+# 默认路径
+DEFAULT_RAW_PATH = "data/raw.xlsx"
+DEFAULT_CLEANED_PATH = "data/cleaned_data.json"
+DEFAULT_STATE_PATH = "data/ingest_state.json"
+
+def _key(title, watch_time):
+    return f"{title}\t{watch_time}"
+
+def _key_time(key):
+    """键中的观看时间，缺失时为None"""
+    watch_time = key.rsplit("\t", 1)[1]
+    return None if watch_time == "None" else watch_time
+
+class IngestState:
+    """
+    导入状态：观看时间的高水位，以及可能再次被选为候选的已导入记录的键
+    （观看时间等于高水位或缺失的记录；更早的记录由高水位排除，不需要保存键），
+    状态大小与历史记录数无关
+    """
+
+    def __init__(self, high_water_mark=None, keys=None):
+        """
+        参数:
+        high_water_mark: 已导入记录中最晚的观看时间（"YYYY-MM-DD HH:MM:SS"字符串）
+        keys: 已导入记录的键集合
+        """
+        self.high_water_mark = high_water_mark
+        self.keys = set(keys or ())
+        self._prune()
+
+    def _prune(self):
+        """丢弃观看时间早于高水位的键"""
+        if self.high_water_mark is not None:
+            self.keys = {key for key in self.keys
+                         if _key_time(key) is None or _key_time(key) >= self.high_water_mark}
+
+    @classmethod
+    def load(cls, path=DEFAULT_STATE_PATH, cleaned_path=DEFAULT_CLEANED_PATH):
+        """
+        加载导入状态；状态文件不存在时根据已有的清洗数据初始化
+
+        参数:
+        path: 状态文件路径
+        cleaned_path: 清洗后的数据文件
+        """
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return cls(data.get("high_water_mark"), data.get("keys"))
+
+        state = cls()
+        if os.path.exists(cleaned_path):
+            with open(cleaned_path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+            state.add(records)
+        return state
+
+    def save(self, path=DEFAULT_STATE_PATH):
+        """保存导入状态（先写临时文件再替换）"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"high_water_mark": self.high_water_mark, "keys": sorted(self.keys)},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def add(self, records):
+        """把已导入的记录加入状态"""
+        for record in records:
+            watch_time = record.get("watch_time")
+            if not isinstance(watch_time, str):
+                watch_time = None
+            if self.high_water_mark is not None and watch_time is not None and watch_time < self.high_water_mark:
+                continue
+            self.keys.add(_key(record.get("title"), watch_time))
+            if watch_time is not None and (self.high_water_mark is None or watch_time > self.high_water_mark):
+                self.high_water_mark = watch_time
+        self._prune()
+
+    def select_new(self, df):
+        """
+        找出尚未导入的行：观看时间不早于高水位，且键不在已导入集合中
+
+        参数:
+        df: read_export()返回的DataFrame
+
+        返回:
+        新增行组成的DataFrame（保持原顺序）
+        """
+        if self.high_water_mark is None:
+            candidates = df
+        else:
+            # 观看时间为"YYYY-MM-DD HH:MM:SS"格式，字符串比较即时间比较；缺失时间的行也作为候选
+            watch_time = df["watch_time"].astype(object)
+            candidates = df[watch_time.isna() | (watch_time.astype(str) >= self.high_water_mark)]
+        keys = [_key(t, w if isinstance(w, str) else None)
+                for t, w in zip(candidates["title"], candidates["watch_time"])]
+        return candidates[[key not in self.keys for key in keys]]
+
+def prepend_cleaned(df_cleaned, path=DEFAULT_CLEANED_PATH):
+    """
+    把新清洗的记录按观看时间从新到旧插入到JSON数组文件的开头（新增记录都不早于已有记录），
+    已有内容按字节原样复制，不重新解析
+
+    输出格式与DataFrame.to_json(orient="records", force_ascii=False, indent=2)一致
+
+    参数:
+    df_cleaned: 新清洗的记录
+    path: 清洗后的数据文件
+    """
+    if len(df_cleaned) == 0:
+        return
+    df_cleaned = df_cleaned.sort_values("watch_time", ascending=False, na_position="last", kind="stable")
+    buffer = io.StringIO()
+    df_cleaned.to_json(buffer, orient="records", force_ascii=False, indent=2)
+    text = buffer.getvalue()
+
+    if not os.path.exists(path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return
+
+    # 去掉新数组的结束括号，只保留开始括号和记录部分
+    head = text[:text.rindex("]")].rstrip()
+    tmp_path = path + ".tmp"
+    with open(path, "rb") as source, open(tmp_path, "wb") as target:
+        # 跳过已有数组的开始括号
+        prefix = b""
+        while b"[" not in prefix:
+            block = source.read(4096)
+            if not block:
+                raise ValueError(f"{path} 不是JSON数组")
+            prefix += block
+        rest = prefix[prefix.index(b"[") + 1:]
+        # 判断已有数组是否为空
+        while not rest.strip():
+            block = source.read(4096)
+            if not block:
+                break
+            rest += block
+        separator = b"" if rest.lstrip().startswith(b"]") else b","
+        target.write(head.encode("utf-8") + separator)
+        target.write(rest)
+        shutil.copyfileobj(source, target)
+    os.replace(tmp_path, path)
+
+def ingest(raw_path=DEFAULT_RAW_PATH, cleaned_path=DEFAULT_CLEANED_PATH, store_path=DEFAULT_STORE_PATH,
+           state_path=DEFAULT_STATE_PATH, sheet_name="看过"):
+    """
+    导入导出文件中新增的记录
+
+    参数:
+    raw_path: 豆瓣导出的Excel文件
+    cleaned_path: 清洗后的数据文件
+    store_path: 列式存储目录
+    state_path: 导入状态文件
+    sheet_name: 工作表名称
+
+    返回:
+    统计信息字典（total_rows、new_rows、seconds、high_water_mark）
+    """
+    start = time.perf_counter()
+    state = IngestState.load(state_path, cleaned_path)
+    df = read_export(raw_path, sheet_name)
+    new_rows = state.select_new(df)
+
+    if len(new_rows):
+        df_cleaned = clean_frame(new_rows.reset_index(drop=True))
+        prepend_cleaned(df_cleaned, cleaned_path)
+        if os.path.exists(os.path.join(store_path, "schema.json")):
+            append_store(df_cleaned, store_path)
+        records = json.loads(df_cleaned[["title", "watch_time"]].to_json(orient="records", force_ascii=False))
+        state.add(records)
+    state.save(state_path)
+
+    return {
+        "total_rows": len(df),
+        "new_rows": len(new_rows),
+        "seconds": time.perf_counter() - start,
+        "high_water_mark": state.high_water_mark,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="增量导入豆瓣导出数据")
+    parser.add_argument("--input", default=DEFAULT_RAW_PATH, help="豆瓣导出的Excel文件")
+    parser.add_argument("--sheet", default="看过", help="工作表名称")
+    parser.add_argument("--cleaned", default=DEFAULT_CLEANED_PATH, help="清洗后的数据文件")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="列式存储目录")
+    parser.add_argument("--state", default=DEFAULT_STATE_PATH, help="导入状态文件")
+    args = parser.parse_args()
+
+    stats = ingest(args.input, args.cleaned, args.store, args.state, args.sheet)
+    print(f"导出文件共 {stats['total_rows']} 条记录，新增 {stats['new_rows']} 条，"
+          f"耗时 {stats['seconds']:.2f} 秒")
+    print(f"观看时间高水位: {stats['high_water_mark']}")
+    if stats["new_rows"]:
+        print("如需更新模型，请重新运行 save_models.py")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+分阶段计时
+预测流程中的各个阶段（feature_build、reorder、impute、ridge、dt、rf、aggregate）用命名的span计时，
+记录调用次数、耗时直方图和计数器，可以导出为JSON或Prometheus文本格式。
+默认关闭：关闭时span()直接返回一个共享的空上下文，不读取时钟、不加锁。
+设置环境变量DOUBAN_INSTRUMENTATION=1，或调用enable()开启。
+
+预测过程中的提示信息通过logging输出（logger名称为douban），交互程序显示INFO级别，
+批量预测和HTTP服务默认只显示WARNING及以上级别
+
+用法:
+python src/instrumentation.py --rows 10000              开启计时运行一次批量预测，输出JSON
+python src/instrumentation.py --rows 10000 --prometheus
+"""
+
+import argparse
+import bisect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 所有模块共用的logger
+logger = logging.getLogger("douban")
+
+# 直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+# Prometheus指标名称前缀
+METRIC_PREFIX = "douban"
+
+class Histogram:
+    """累积分桶的耗时直方图"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def to_dict(self):
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            buckets["+Inf" if bound == float("inf") else repr(bound)] = cumulative
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            "buckets": buckets,
+        }
+
+class _Span:
+    """计时上下文：退出时把耗时记录到对应阶段的直方图"""
+
+    __slots__ = ("registry", "name", "start")
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+class _NoopSpan:
+    """关闭计时时使用的空上下文"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+
+class Instrumentation:
+    """
+    计时和计数的注册表，线程安全
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def span(self, name):
+        """
+        阶段计时的上下文管理器
+
+        参数:
+        name: 阶段名称（如ridge、impute）
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, name)
+
+    def observe(self, name, seconds):
+        """记录一次阶段耗时"""
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name, value=1):
+        """计数器加value（关闭时忽略）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def reset(self):
+        """清空已记录的数据"""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def to_dict(self):
+        """
+        导出为字典
+
+        返回:
+        {"enabled": 是否开启, "spans": {阶段: 直方图}, "counters": {名称: 数值}}
+        """
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "spans": {name: histogram.to_dict() for name, histogram in self._histograms.items()},
+                "counters": dict(self._counters),
+            }
+
+    def to_json(self, indent=2):
+        """导出为JSON文本"""
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=indent)
+
+    def to_prometheus(self, prefix=METRIC_PREFIX):
+        """导出为Prometheus文本格式"""
+        data = self.to_dict()
+        lines = [
+            f"# HELP {prefix}_stage_seconds 预测流程各阶段的耗时",
+            f"# TYPE {prefix}_stage_seconds histogram",
+        ]
+        for name, histogram in sorted(data["spans"].items()):
+            for bound, count in histogram["buckets"].items():
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {histogram["sum"]!r}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {histogram["count"]}')
+        lines.append(f"# HELP {prefix}_events_total 预测流程的计数器")
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for name, value in sorted(data["counters"].items()):
+            lines.append(f'{prefix}_events_total{{name="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+# 进程内共享的注册表
+instrumentation = Instrumentation(enabled=os.environ.get("DOUBAN_INSTRUMENTATION", "") not in ("", "0"))
+
+def span(name):
+    """共享注册表的阶段计时上下文（关闭时几乎没有开销）"""
+    if not instrumentation.enabled:
+        return _NOOP_SPAN
+    return _Span(instrumentation, name)
+
+def increment(name, value=1):
+    """共享注册表的计数器加value"""
+    instrumentation.increment(name, value)
+
+def enable():
+    """开启计时"""
+    instrumentation.enabled = True
+
+def disable():
+    """关闭计时（已记录的数据保留）"""
+    instrumentation.enabled = False
+
+def configure_logging(level=logging.WARNING, fmt="%(message)s"):
+    """
+    设置预测提示信息的输出级别
+
+    参数:
+    level: 日志级别，交互程序使用INFO，批量预测和HTTP服务默认为WARNING
+    fmt: 输出格式
+    """
+    if isinstance(level, str):
+        level = getattr(logging, level.upper())
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter(fmt))
+        logger.addHandler(handler)
+        # 不再传给根logger，避免重复输出
+        logger.propagate = False
+    logger.setLevel(level)
+
+def main():
+    parser = argparse.ArgumentParser(description="预测流程的分阶段计时")
+    parser.add_argument("--rows", type=int, default=10000, help="合成记录的数量")
+    parser.add_argument("--batch-size", type=int, default=1000, help="每批的记录数")
+    parser.add_argument("--prometheus", action="store_true", help="输出Prometheus文本格式（默认输出JSON）")
+    args = parser.parse_args()
+
+    from src.benchmark import load_vocabulary, synthetic_records
+    from src.features import get_vectorizer
+    from src.load_models import predict_with_ensemble
+    from src.model_registry import get_models
+    # 以脚本方式运行时从模块路径导入，与预测代码使用同一个注册表
+    from src.instrumentation import enable, instrumentation
+
+    models = get_models()
+    vectorizer = get_vectorizer(models["feature_names"])
+    records = synthetic_records(args.rows, load_vocabulary())
+
+    enable()
+    for start in range(0, len(records), args.batch_size):
+        X = vectorizer.transform(records[start:start + args.batch_size])
+        predict_with_ensemble(X, models)
+    print(instrumentation.to_prometheus() if args.prometheus else instrumentation.to_json())
+
+if __name__ == "__main__":
+    main()
@@ -1,110 +1,211 @@
 import joblib
 import os
+import re
 import numpy as np
 import pandas as pd
+from src.tree_export import FLAT_TREE_MAX_ROWS
+from src.model_bundle import ModelBundle, find_bundle
+from src.instrumentation import increment, logger, span
 
-def load_models(models_dir="models"):
+# 模型名称到文件名的映射（没有模型包ensemble.bundle时使用的分散模型文件）
+MODEL_FILES = {
+    "ridge": "best_ridge.joblib",
+    "dt": "best_dt.joblib",
+    "rf": "best_rf.joblib",
+    "imputer": "imputer.joblib",
+    "feature_names": "feature_names.joblib"  # 添加特征名称文件
+}
+
+# 每个用户的模型目录: <模型目录>/users/<用户ID>/，布局与模型目录相同（ensemble.bundle等）
+USERS_DIR_NAME = "users"
+
+# 用户ID只允许字母、数字、下划线、短横线和点（不能以点开头），避免访问模型目录以外的路径
+USER_ID_PATTERN = re.compile(r"^[A-Za-z0-9_\-][A-Za-z0-9_.\-]{0,127}$")
+
+def user_models_dir(user_id, models_dir="models"):
+    """
+    获取用户的模型目录
+
+    参数:
+    user_id: 用户ID
+    models_dir: 模型根目录
+
+    返回:
+    目录路径
+    """
+    if not isinstance(user_id, str) or not USER_ID_PATTERN.match(user_id):
+        raise ValueError(f"无效的用户ID: {user_id!r}")
+    return os.path.join(models_dir, USERS_DIR_NAME, user_id)
+
+def load_model_file(file_path, mmap_mode=None):
+    """
+    加载单个模型文件
+    
+    参数:
+    file_path: 模型文件路径
+    mmap_mode: 传给joblib.load的内存映射模式（如"r"），None表示完整读入内存
+    
+    返回:
+    反序列化后的对象
+    """
+    return joblib.load(file_path, mmap_mode=mmap_mode)
+
+def load_models(models_dir="models", mmap_mode=None, user_id=None):
     """
     加载保存的模型和预处理器
     
+    优先使用模型包ensemble.bundle：只读取头部，成员在第一次使用时加载；
+    没有模型包时依次加载分散的模型文件
+    
     参数:
     models_dir: 保存模型的目录路径
+    mmap_mode: 内存映射模式（模型包的数组区，或传给joblib.load），None表示完整读入内存
+    user_id: 用户ID，指定时加载该用户的模型（<models_dir>/users/<user_id>/）
     
     返回:
-    模型和预处理器的字典
+    模型和预处理器的字典（使用模型包时为按需加载的LazyModels）
     """
+    if user_id is not None:
+        models_dir = user_models_dir(user_id, models_dir)
+    path = find_bundle(models_dir)
+    if path is not None:
+        return ModelBundle(path, mmap_mode).models()
+    
     models = {}
     
     # 检查模型文件是否存在
-    model_files = {
-        "ridge": "best_ridge.joblib",
-        "dt": "best_dt.joblib",
-        "rf": "best_rf.joblib",
-        "imputer": "imputer.joblib",
-        "feature_names": "feature_names.joblib"  # 添加特征名称文件
-    }
-    
-    for model_name, file_name in model_files.items():
+    for model_name, file_name in MODEL_FILES.items():
         file_path = os.path.join(models_dir, file_name)
         if os.path.exists(file_path):
-            models[model_name] = joblib.load(file_path)
+            models[model_name] = load_model_file(file_path, mmap_mode)
         else:
-            print(f"警告: 模型文件 {file_path} 不存在")
+            logger.warning("警告: 模型文件 %s 不存在", file_path)
     
     return models
 
-def predict_with_ensemble(X, models):
+def predict_with_ensemble(X, models, execution=None):
     """
     使用集成模型进行预测
     
     参数:
-    X: 特征数据
-    models: 从load_models()加载的模型字典
+    X: 特征数据（DataFrame，或已按训练特征顺序排列的NumPy矩阵；
+       也可以是models["sparse_ridge"].transform()生成的稀疏矩阵，此时只使用稀疏成员预测）
+    models: 从load_models()加载的模型字典（可包含dt_flat、rf_flat等扁平化树模型或fused融合模型）
+    execution: parallel_predict.ExecutionConfig，大批量时并行计算；None表示串行
     
     返回:
     预测评分
     """
     try:
+        # 稀疏特征矩阵（save_models.py --sparse训练的sparse_ridge成员）
+        if not isinstance(X, (np.ndarray, pd.DataFrame)):
+            from scipy.sparse import issparse
+            if issparse(X):
+                if "sparse_ridge" not in models:
+                    logger.error("错误: 模型包中没有稀疏模型sparse_ridge（使用save_models.py --sparse训练）")
+                    return None
+                increment("predict_calls")
+                increment("predict_rows", X.shape[0])
+                logger.info("使用稀疏Ridge模型预测...")
+                with span("sparse_ridge"):
+                    ensemble_pred = models["sparse_ridge"].predict(X)
+                logger.info("预测完成，结果: %s", ensemble_pred)
+                return ensemble_pred
+        
         # 如果模型中有特征名称列表，确保特征顺序一致
-        if "feature_names" in models and isinstance(models["feature_names"], list):
-            print(f"确保特征顺序一致...")
-            feature_names = models["feature_names"]
-            
-            # 检查是否所有特征都存在
-            missing_features = [f for f in feature_names if f not in X.columns]
-            if missing_features:
-                print(f"警告: 缺少以下特征: {missing_features[:5]}...")
-                # 添加缺失的特征，填充为0
-                for feature in missing_features:
-                    X[feature] = 0
-            
-            # 检查是否有多余的特征
-            extra_features = [f for f in X.columns if f not in feature_names]
-            if extra_features:
-                print(f"警告: 存在额外特征: {extra_features[:5]}...")
-            
-            # 按照训练时的特征顺序重排特征
-            print(f"重排特征顺序...")
-            X = X[feature_names]
+        if isinstance(X, pd.DataFrame) and "feature_names" in models and isinstance(models["feature_names"], list):
+            with span("reorder"):
+                logger.info("确保特征顺序一致...")
+                feature_names = models["feature_names"]
+                
+                # 检查是否所有特征都存在
+                missing_features = [f for f in feature_names if f not in X.columns]
+                if missing_features:
+                    logger.warning("警告: 缺少以下特征: %s...", missing_features[:5])
+                    # 添加缺失的特征，填充为0
+                    for feature in missing_features:
+                        X[feature] = 0
+                
+                # 检查是否有多余的特征
+                extra_features = [f for f in X.columns if f not in feature_names]
+                if extra_features:
+                    logger.warning("警告: 存在额外特征: %s...", extra_features[:5])
+                
+                # 按照训练时的特征顺序重排特征
+                logger.info("重排特征顺序...")
+                X = X[feature_names]
+        
+        increment("predict_calls")
+        increment("predict_rows", X.shape[0])
+        
+        # 按配置并行计算（小批量会自动走串行路径）
+        if execution is not None:
+            from src.parallel_predict import predict_parallel
+            with span("parallel"):
+                ensemble_pred = predict_parallel(X, models, execution)
+            logger.info("预测完成，结果: %s", ensemble_pred)
+            return ensemble_pred
+        
+        # 融合模型已经包含了缺失值填充，直接对整个矩阵预测（成员计时在FusedEnsemble中记录）
+        if "fused" in models:
+            logger.info("使用融合模型预测...")
+            ensemble_pred = models["fused"].predict(X)
+            logger.info("预测完成，结果: %s", ensemble_pred)
+            return ensemble_pred
         
         # 确保数据已经过预处理
         if "imputer" in models:
-            print(f"应用特征填充...")
-            X = models["imputer"].transform(X)
+            logger.info("应用特征填充...")
+            with span("impute"):
+                # imputer训练时带有特征名称，NumPy矩阵需要包装为DataFrame以避免警告
+                if isinstance(X, np.ndarray) and hasattr(models["imputer"], "feature_names_in_"):
+                    X = pd.DataFrame(X, columns=models["imputer"].feature_names_in_, copy=False)
+                X = models["imputer"].transform(X)
+        
+        # 小批量时优先使用扁平化的树模型
+        n_rows = X.shape[0]
+        def tree_model(name):
+            flat = models.get(f"{name}_flat")
+            if flat is not None and n_rows <= FLAT_TREE_MAX_ROWS:
+                return flat
+            return models[name]
         
         # 获取各个模型的预测结果
         predictions = []
         
         if "ridge" in models:
-            print(f"使用Ridge模型预测...")
-            ridge_pred = models["ridge"].predict(X)
+            logger.info("使用Ridge模型预测...")
+            with span("ridge"):
+                ridge_pred = models["ridge"].predict(X)
             predictions.append(ridge_pred)
         
         if "dt" in models:
-            print(f"使用决策树模型预测...")
-            dt_pred = models["dt"].predict(X)
+            logger.info("使用决策树模型预测...")
+            with span("dt"):
+                dt_pred = tree_model("dt").predict(X)
             predictions.append(dt_pred)
         
         if "rf" in models:
-            print(f"使用随机森林模型预测...")
-            rf_pred = models["rf"].predict(X)
+            logger.info("使用随机森林模型预测...")
+            with span("rf"):
+                rf_pred = tree_model("rf").predict(X)
             predictions.append(rf_pred)
         
         # 如果没有模型可用，返回None
         if not predictions:
-            print(f"错误: 没有可用的预测模型")
+            logger.error("错误: 没有可用的预测模型")
             return None
         
         # 计算集成预测结果（平均值）
-        print(f"计算集成预测结果...")
-        ensemble_pred = np.mean(predictions, axis=0)
-        print(f"预测完成，结果: {ensemble_pred}")
+        logger.info("计算集成预测结果...")
+        with span("aggregate"):
+            ensemble_pred = np.mean(predictions, axis=0)
+        logger.info("预测完成，结果: %s", ensemble_pred)
         return ensemble_pred
     
     except Exception as e:
-        print(f"预测过程中出错: {e}")
-        import traceback
-        traceback.print_exc()
+        increment("predict_errors")
+        logger.exception("预测过程中出错: %s", e)
         return None
 
 if __name__ == "__main__":
@@ -0,0 +1,497 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+版本化的模型包
+把Ridge、决策树、随机森林和imputer保存在同一个文件中，代替分散的best_*.joblib、imputer.joblib和
+feature_names.joblib。文件结构:
+- 文件头: 魔数、格式版本和JSON头部长度
+- JSON头部: 模型包版本、特征名称、特征schema、训练指标、超参数，以及每个成员和数组区的偏移、长度和SHA-256校验和
+- 成员区: 每个成员单独用pickle（协议5）序列化，依次排列；成员中较大的NumPy数组不放在序列化数据中，
+  而是以原始字节单独保存在对齐的数组区，加载时可以用内存映射直接引用（mmap_mode），多个进程共享同一份页缓存
+
+打开模型包时只读取头部，成员在第一次使用时才读取、校验并反序列化；
+成员的特征数量或特征名称与头部记录的特征名称不一致时直接报错。
+注意：sklearn的决策树在反序列化时会把节点数组复制到自己的内存中，决策树和随机森林的节点不会被内存映射
+
+用法:
+python src/model_bundle.py pack     把models/目录下的分散模型文件打包为models/ensemble.bundle
+python src/model_bundle.py info     查看模型包的版本、成员和训练指标
+"""
+
+import argparse
+import datetime
+import hashlib
+import io
+import json
+import os
+import pickle
+import struct
+import sys
+import threading
+import time
+from collections.abc import Mapping
+import joblib
+import numpy as np
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 格式版本，文件结构变化时递增（版本1的成员整体用joblib序列化，没有数组区，仍然可以读取）
+FORMAT_VERSION = 2
+READABLE_VERSIONS = (1, 2)
+
+# 文件开头的魔数，以及魔数 + 格式版本 + 头部长度的结构
+MAGIC = b"DBMODELB"
+PREAMBLE = struct.Struct("<8sII")
+
+# 成员区和数组区按该字节数对齐
+SECTION_ALIGNMENT = 64
+
+# 不小于该字节数的数组单独保存在数组区
+MIN_BUFFER_BYTES = SECTION_ALIGNMENT
+
+# 默认的模型包文件名
+BUNDLE_FILE_NAME = "ensemble.bundle"
+DEFAULT_BUNDLE_PATH = os.path.join("models", BUNDLE_FILE_NAME)
+
+# 成员的保存顺序
+MEMBER_ORDER = ("imputer", "ridge", "dt", "rf")
+
+def bundle_path(models_dir="models"):
+    """模型目录中模型包的路径"""
+    return os.path.join(models_dir, BUNDLE_FILE_NAME)
+
+def find_bundle(models_dir="models"):
+    """
+    查找模型目录中的模型包
+
+    返回:
+    模型包路径，不存在时返回None
+    """
+    path = bundle_path(models_dir)
+    return path if os.path.exists(path) else None
+
+def check_member(name, model, feature_names):
+    """
+    检查成员是否在相同的特征上训练
+
+    参数:
+    name: 成员名称
+    model: 成员对象
+    feature_names: 模型包记录的特征名称
+
+    异常:
+    ValueError: 特征数量或特征名称不一致
+    """
+    n_features = getattr(model, "n_features_in_", None)
+    if n_features is not None and n_features != len(feature_names):
+        raise ValueError(f"成员 {name} 使用 {n_features} 个特征训练，模型包记录了 {len(feature_names)} 个特征")
+    names_in = getattr(model, "feature_names_in_", None)
+    if names_in is not None and list(names_in) != list(feature_names):
+        mismatched = [(a, b) for a, b in zip(names_in, feature_names) if a != b]
+        raise ValueError(f"成员 {name} 的特征名称与模型包不一致: {mismatched[:3]}")
+
+def evaluate_members(members, X_test, y_test):
+    """
+    计算各成员和集成模型在测试集上的指标
+
+    参数:
+    members: 成员字典（包含imputer、ridge、dt、rf）
+    X_test: 测试集特征（未填充缺失值）
+    y_test: 测试集标签
+
+    返回:
+    字典，键为成员名称和ensemble，值包含mae、rmse和r2
+    """
+    from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+
+    X = members["imputer"].transform(X_test) if "imputer" in members else X_test
+    y = np.asarray(y_test, dtype=np.float64)
+    predictions = {name: members[name].predict(X) for name in ("ridge", "dt", "rf") if name in members}
+    if predictions:
+        predictions["ensemble"] = np.mean(list(predictions.values()), axis=0)
+
+    metrics = {}
+    for name, pred in predictions.items():
+        metrics[name] = {
+            "mae": float(mean_absolute_error(y, pred)),
+            "rmse": float(np.sqrt(mean_squared_error(y, pred))),
+            "r2": float(r2_score(y, pred)),
+        }
+    return metrics
+
+def write_bundle(path, members, feature_names, feature_schema=None, metrics=None, params=None):
+    """
+    把成员写入模型包（先写临时文件再替换）
+
+    参数:
+    path: 输出路径
+    members: 成员字典（如imputer、ridge、dt、rf）
+    feature_names: 训练时的特征顺序
+    feature_schema: 特征schema清单（可选）
+    metrics: 训练指标（可选）
+    params: 超参数（可选）
+
+    返回:
+    模型包版本
+    """
+    feature_names = [str(name) for name in feature_names]
+    if feature_schema is not None and list(feature_schema.get("feature_names", feature_names)) != feature_names:
+        raise ValueError("特征schema的特征名称与模型的特征名称不一致")
+
+    names = [name for name in MEMBER_ORDER if name in members] + \
+            sorted(name for name in members if name not in MEMBER_ORDER)
+    sections = []
+    manifest = {}
+    offset = 0
+
+    def add_section(data):
+        nonlocal offset
+        info = {"offset": offset, "length": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+        padding = -len(data) % SECTION_ALIGNMENT
+        sections.append(data + b"\0" * padding)
+        offset += len(data) + padding
+        return info
+
+    for name in names:
+        check_member(name, members[name], feature_names)
+        buffers = []
+        # 回调返回False的数组不写入序列化数据（带外保存），较小的数组保留在序列化数据中
+        data = pickle.dumps(members[name], protocol=5,
+                            buffer_callback=lambda b: b.raw().nbytes < MIN_BUFFER_BYTES or buffers.append(b))
+        model_type = type(members[name])
+        manifest[name] = add_section(data)
+        manifest[name]["type"] = f"{model_type.__module__}.{model_type.__qualname__}"
+        manifest[name]["buffers"] = [add_section(b.raw().tobytes()) for b in buffers]
+
+    # 版本 = 创建时间 + 成员校验和与特征名称的摘要
+    digest = hashlib.sha256()
+    for name in names:
+        digest.update(manifest[name]["sha256"].encode("ascii"))
+    digest.update(json.dumps(feature_names, ensure_ascii=False).encode("utf-8"))
+    created_at = datetime.datetime.now()
+
+    header = {
+        "format_version": FORMAT_VERSION,
+        "version": f"{created_at:%Y%m%d%H%M%S}-{digest.hexdigest()[:12]}",
+        "created_at": created_at.isoformat(timespec="seconds"),
+        "feature_names": feature_names,
+        "feature_schema": feature_schema,
+        "metrics": metrics or {},
+        "params": params or {},
+        "members": manifest,
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    # 头部补齐后成员区从对齐的位置开始
+    header_bytes += b" " * (-(PREAMBLE.size + len(header_bytes)) % SECTION_ALIGNMENT)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for section in sections:
+            f.write(section)
+    os.replace(tmp_path, path)
+    return header["version"]
+
+def read_header(path):
+    """
+    只读取模型包的头部
+
+    返回:
+    (头部字典, 成员区起始位置) 元组
+    """
+    with open(path, "rb") as f:
+        preamble = f.read(PREAMBLE.size)
+        if len(preamble) != PREAMBLE.size:
+            raise ValueError(f"{path} 不是模型包")
+        magic, format_version, header_length = PREAMBLE.unpack(preamble)
+        if magic != MAGIC:
+            raise ValueError(f"{path} 不是模型包")
+        if format_version not in READABLE_VERSIONS:
+            raise ValueError(f"模型包格式版本 {format_version} 与当前版本 {FORMAT_VERSION} 不一致，请重新运行 save_models.py")
+        header = json.loads(f.read(header_length).decode("utf-8"))
+    return header, PREAMBLE.size + header_length
+
+class ModelBundle:
+    """
+    模型包：打开时只读取头部，成员在第一次访问时加载
+    """
+
+    def __init__(self, path=DEFAULT_BUNDLE_PATH, mmap_mode=None):
+        """
+        参数:
+        path: 模型包路径
+        mmap_mode: 数组区的内存映射模式（"r"、"c"或"r+"，与np.memmap相同），None表示完整读入内存
+        """
+        self.path = path
+        self.mmap_mode = mmap_mode
+        self.header, self._data_offset = read_header(path)
+        self._members = {}
+        self._mapped = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        """模型包版本（创建时间 + 内容摘要）"""
+        return self.header["version"]
+
+    @property
+    def feature_names(self):
+        """训练时的特征顺序"""
+        return list(self.header["feature_names"])
+
+    @property
+    def feature_schema(self):
+        """训练时的特征schema清单，未保存时为None"""
+        return self.header.get("feature_schema")
+
+    @property
+    def metrics(self):
+        """训练指标"""
+        return self.header.get("metrics", {})
+
+    @property
+    def params(self):
+        """训练使用的超参数"""
+        return self.header.get("params", {})
+
+    @property
+    def member_names(self):
+        """成员名称列表"""
+        return list(self.header["members"])
+
+    def member_info(self, name):
+        """成员的偏移、长度、校验和和类型"""
+        return dict(self.header["members"][name])
+
+    def member_bytes(self, name):
+        """成员在文件中占用的字节数（序列化数据和数组区）"""
+        info = self.header["members"][name]
+        return info["length"] + sum(buffer["length"] for buffer in info.get("buffers", ()))
+
+    def is_loaded(self, name):
+        """成员是否已经加载"""
+        return name in self._members
+
+    def read_section(self, name):
+        """
+        读取成员的序列化数据并校验
+
+        异常:
+        ValueError: 校验和不一致（文件损坏或被修改）
+        """
+        info = self.header["members"][name]
+        with open(self.path, "rb") as f:
+            f.seek(self._data_offset + info["offset"])
+            data = f.read(info["length"])
+        if len(data) != info["length"] or hashlib.sha256(data).hexdigest() != info["sha256"]:
+            raise ValueError(f"模型包 {self.path} 中的成员 {name} 校验失败")
+        return data
+
+    def _read_buffer(self, name, info):
+        """读取并校验成员的一个数组区：使用内存映射时返回映射的视图，否则读入可写的内存"""
+        start = self._data_offset + info["offset"]
+        if self.mmap_mode is None:
+            with open(self.path, "rb") as f:
+                f.seek(start)
+                data = bytearray(f.read(info["length"]))
+        else:
+            if self._mapped is None:
+                self._mapped = np.memmap(self.path, dtype=np.uint8, mode=self.mmap_mode)
+            data = self._mapped[start:start + info["length"]]
+        if len(data) != info["length"] or hashlib.sha256(data).hexdigest() != info["sha256"]:
+            raise ValueError(f"模型包 {self.path} 中的成员 {name} 校验失败")
+        return data
+
+    def load(self, name):
+        """
+        加载成员（只在第一次调用时读取文件）
+
+        参数:
+        name: 成员名称
+
+        返回:
+        反序列化后的成员
+        """
+        model = self._members.get(name)
+        if model is not None:
+            return model
+        if name not in self.header["members"]:
+            raise KeyError(name)
+
+        with self._lock:
+            if name not in self._members:
+                data = self.read_section(name)
+                buffers = self.header["members"][name].get("buffers")
+                if buffers is None:
+                    # 版本1的模型包
+                    model = joblib.load(io.BytesIO(data))
+                else:
+                    model = pickle.loads(data, buffers=[self._read_buffer(name, info) for info in buffers])
+                check_member(name, model, self.header["feature_names"])
+                self._members[name] = model
+            return self._members[name]
+
+    def models(self, derived=None, on_load=None):
+        """
+        获取按需加载的模型字典
+
+        参数:
+        derived: 派生模型，字典，键为名称，值为(依赖的成员元组, 构建函数)，构建函数的参数为模型字典
+        on_load: 每个成员或派生模型加载完成后的回调，参数为(名称, 对象, 耗时秒数)
+
+        返回:
+        LazyModels实例，可以像load_models()返回的字典一样使用
+        """
+        return LazyModels(self, derived, on_load)
+
+class LazyModels(Mapping):
+    """
+    按需加载的模型字典：feature_names直接来自模型包头部，其他成员和派生模型在第一次访问时加载
+    """
+
+    def __init__(self, bundle, derived=None, on_load=None):
+        self.bundle = bundle
+        self.on_load = on_load
+        self._derived = {}
+        self._values = {}
+        self._lock = threading.RLock()
+        members = set(bundle.member_names)
+        for name, (requires, build) in (derived or {}).items():
+            if all(dep in members for dep in requires):
+                self._derived[name] = build
+        self._keys = bundle.member_names + ["feature_names"] + list(self._derived)
+
+    @property
+    def version(self):
+        """模型包版本"""
+        return self.bundle.version
+
+    def __contains__(self, name):
+        # 判断成员是否存在不需要加载成员
+        return name in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __getitem__(self, name):
+        if name == "feature_names":
+            return self.bundle.feature_names
+        value = self._values.get(name)
+        if value is not None:
+            return value
+        if name not in self._keys:
+            raise KeyError(name)
+
+        with self._lock:
+            if name not in self._values:
+                start = time.perf_counter()
+                if name in self._derived:
+                    value = self._derived[name](self)
+                else:
+                    value = self.bundle.load(name)
+                if self.on_load is not None:
+                    self.on_load(name, value, time.perf_counter() - start)
+                self._values[name] = value
+            return self._values[name]
+
+    def attach(self, name, value):
+        """
+        添加在外部构建的派生模型（如并行预测时融合的模型），之后与其他派生模型一样直接返回
+
+        返回:
+        字典中保存的值（已经存在时返回原有的值）
+        """
+        with self._lock:
+            if name not in self._values:
+                self._values[name] = value
+                if name not in self._keys:
+                    self._keys.append(name)
+            return self._values[name]
+
+    def is_loaded(self, name):
+        """成员或派生模型是否已经加载"""
+        return name == "feature_names" or name in self._values
+
+    def load_all(self):
+        """加载所有成员和派生模型"""
+        for name in self._keys:
+            self[name]
+        return self
+
+def pack_files(models_dir="models", output=None):
+    """
+    把分散的模型文件（best_*.joblib、imputer.joblib、feature_names.joblib）打包为模型包，
+    训练指标在与save_models.py相同划分的测试集上重新计算
+
+    参数:
+    models_dir: 模型目录
+    output: 输出路径，None表示模型目录下的ensemble.bundle
+
+    返回:
+    模型包版本
+    """
+    from src.feature_schema import DEFAULT_SCHEMA_PATH, load_feature_schema
+    from src.train import load_best_params, load_training_split
+
+    files = {"ridge": "best_ridge.joblib", "dt": "best_dt.joblib", "rf": "best_rf.joblib", "imputer": "imputer.joblib"}
+    members = {}
+    for name, file_name in files.items():
+        file_path = os.path.join(models_dir, file_name)
+        if os.path.exists(file_path):
+            members[name] = joblib.load(file_path)
+    if not members:
+        raise ValueError(f"{models_dir} 中没有模型文件")
+
+    names_path = os.path.join(models_dir, "feature_names.joblib")
+    if "imputer" in members and hasattr(members["imputer"], "feature_names_in_"):
+        feature_names = list(members["imputer"].feature_names_in_)
+    elif os.path.exists(names_path):
+        feature_names = list(joblib.load(names_path))
+    else:
+        raise ValueError("无法确定模型的特征名称")
+
+    schema_path = os.path.join(models_dir, os.path.basename(DEFAULT_SCHEMA_PATH))
+    feature_schema = load_feature_schema(schema_path) if os.path.exists(schema_path) else None
+
+    X_train, X_test, y_train, y_test = load_training_split()
+    metrics = {"n_train": len(y_train), "n_test": len(y_test)}
+    if list(X_test.columns) == feature_names:
+        metrics["test"] = evaluate_members(members, X_test, y_test)
+
+    output = output or bundle_path(models_dir)
+    return write_bundle(output, members, feature_names, feature_schema, metrics, load_best_params())
+
+def main():
+    parser = argparse.ArgumentParser(description="版本化的模型包")
+    parser.add_argument("command", choices=["pack", "info"], help="pack: 打包分散的模型文件；info: 查看模型包")
+    parser.add_argument("--models-dir", default="models", help="模型目录")
+    parser.add_argument("--output", default=None, help="模型包路径（默认为模型目录下的ensemble.bundle）")
+    args = parser.parse_args()
+
+    path = args.output or bundle_path(args.models_dir)
+    if args.command == "pack":
+        version = pack_files(args.models_dir, path)
+        print(f"已打包到 {path}，版本 {version}")
+
+    bundle = ModelBundle(path)
+    print(f"模型包: {path}")
+    print(f"版本: {bundle.version}（创建于 {bundle.header['created_at']}）")
+    print(f"特征数量: {len(bundle.feature_names)}")
+    print(f"{'成员':<14}{'类型':<56}{'大小':>12}")
+    for name in bundle.member_names:
+        info = bundle.member_info(name)
+        print(f"{name:<14}{info['type']:<56}{bundle.member_bytes(name) / 1024:>10.1f}KB")
+    for name, values in bundle.metrics.get("test", {}).items():
+        print(f"{name:<14}MAE {values['mae']:.3f}  RMSE {values['rmse']:.3f}  R² {values['r2']:.3f}")
+
+if __name__ == "__main__":
+    main()
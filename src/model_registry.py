@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+模型注册表
+在进程内只加载一次模型，并在所有调用方之间共享，
+同时记录每个模型文件的加载耗时和内存占用。
+使用模型包ensemble.bundle时只读取头部，成员和派生模型在第一次使用时加载
+"""
+
+import os
+import sys
+import threading
+import time
+import numpy as np
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.load_models import MODEL_FILES, load_model_file
+from src.model_bundle import ModelBundle, find_bundle
+from src.tree_export import FlatTreeEnsemble
+from src.fuse import fuse_models
+from src.instrumentation import logger
+
+# 进程内共享的注册表实例，键为(模型目录绝对路径, mmap_mode, flatten_trees)
+_registries = {}
+_registries_lock = threading.Lock()
+
+def _is_mapped(array):
+    """数组的内存是否来自np.memmap（沿base链查找）"""
+    while isinstance(array, np.ndarray):
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+def estimate_size(obj):
+    """
+    估算对象占用的内存大小
+
+    参数:
+    obj: 任意Python对象（模型、列表等）
+
+    返回:
+    (常驻内存字节数, 内存映射字节数) 元组
+    """
+    resident = 0
+    mapped = 0
+    seen = set()
+    # 保留临时对象的引用，避免其id被回收复用导致误判为已统计
+    keep_alive = []
+    stack = [obj]
+
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+
+        if isinstance(item, np.ndarray):
+            # 内存映射的数组（包括从模型包的映射区重建的数组）不计入常驻内存
+            if _is_mapped(item):
+                mapped += item.nbytes
+            else:
+                resident += item.nbytes
+            if item.dtype == object:
+                stack.extend(item.ravel().tolist())
+            continue
+
+        resident += sys.getsizeof(item)
+
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif isinstance(item, (str, bytes, int, float, bool, type(None))):
+            continue
+        elif hasattr(item, "__dict__"):
+            stack.append(item.__dict__)
+        else:
+            # sklearn的Tree等扩展类型没有__dict__，通过__getstate__获取其数组
+            try:
+                state = item.__getstate__()
+            except Exception:
+                state = None
+            if isinstance(state, dict):
+                keep_alive.append(state)
+                stack.extend(state.values())
+
+    return resident, mapped
+
+class ModelRegistry:
+    """
+    模型注册表：一个模型目录对应一个实例，模型只在第一次使用时加载
+    """
+
+    def __init__(self, models_dir="models", mmap_mode=None, flatten_trees=True):
+        """
+        参数:
+        models_dir: 保存模型的目录路径
+        mmap_mode: 内存映射模式（模型包的数组区或传给joblib.load），None表示完整读入内存
+        flatten_trees: 是否额外构建扁平化的决策树和随机森林（dt_flat、rf_flat），
+                       以及合并了imputer的融合模型（fused）
+        """
+        self.models_dir = models_dir
+        self.mmap_mode = mmap_mode
+        self.flatten_trees = flatten_trees
+        self._models = None
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def get_models(self):
+        """
+        获取模型字典，首次调用时加载，之后直接返回缓存
+
+        返回:
+        与load_models()相同格式的模型字典
+        """
+        models = self._models
+        if models is not None:
+            return models
+
+        with self._lock:
+            if self._models is None:
+                self._models = self._load()
+            return self._models
+
+    def _load(self):
+        """有模型包时返回按需加载的模型字典，否则从磁盘加载所有模型文件"""
+        path = find_bundle(self.models_dir)
+        if path is not None:
+            return self._load_bundle(path)
+        return self._load_files()
+
+    def _derived_models(self):
+        """派生模型：名称到(依赖的成员, 构建函数)的映射"""
+        if not self.flatten_trees:
+            return {}
+        return {
+            "dt_flat": (("dt",), lambda models: FlatTreeEnsemble.from_model(models["dt"])),
+            "rf_flat": (("rf",), lambda models: FlatTreeEnsemble.from_model(models["rf"])),
+            "fused": (("imputer",), fuse_models),
+        }
+
+    @staticmethod
+    def _derived_stats(model_name, model, load_time):
+        if model_name == "fused":
+            # 只统计融合模型自身的数组，不重复统计其引用的sklearn模型
+            own_arrays = [model.fill_values, model.coef, model.nan_offset] + [flat for _, _, flat in model.trees]
+            resident = estimate_size(own_arrays)[0]
+        else:
+            resident = estimate_size(model)[0]
+        return {
+            "file": None,
+            "file_bytes": 0,
+            "load_time": load_time,
+            "resident_bytes": resident,
+            "mapped_bytes": 0,
+        }
+
+    def _load_bundle(self, path):
+        """打开模型包，成员和派生模型加载时记录耗时和内存占用"""
+        bundle = ModelBundle(path, self.mmap_mode)
+        stats = {}
+        derived = self._derived_models()
+
+        def record(model_name, model, load_time):
+            if model_name in derived:
+                stats[model_name] = self._derived_stats(model_name, model, load_time)
+                return
+            resident, mapped = estimate_size(model)
+            stats[model_name] = {
+                "file": path,
+                "file_bytes": bundle.member_bytes(model_name),
+                "load_time": load_time,
+                "resident_bytes": resident,
+                "mapped_bytes": mapped,
+            }
+
+        self._stats = stats
+        return bundle.models(derived, record)
+
+    def _load_files(self):
+        """从磁盘加载所有模型文件，并记录耗时和内存占用"""
+        models = {}
+        stats = {}
+
+        for model_name, file_name in MODEL_FILES.items():
+            file_path = os.path.join(self.models_dir, file_name)
+            if not os.path.exists(file_path):
+                logger.warning("警告: 模型文件 %s 不存在", file_path)
+                continue
+
+            start = time.perf_counter()
+            model = load_model_file(file_path, self.mmap_mode)
+            load_time = time.perf_counter() - start
+
+            resident, mapped = estimate_size(model)
+            models[model_name] = model
+            stats[model_name] = {
+                "file": file_path,
+                "file_bytes": os.path.getsize(file_path),
+                "load_time": load_time,
+                "resident_bytes": resident,
+                "mapped_bytes": mapped,
+            }
+
+        for model_name, (requires, build) in self._derived_models().items():
+            if all(name in models for name in requires):
+                start = time.perf_counter()
+                model = build(models)
+                models[model_name] = model
+                stats[model_name] = self._derived_stats(model_name, model, time.perf_counter() - start)
+
+        self._stats = stats
+        return models
+
+    def is_loaded(self):
+        """模型是否已经加载"""
+        return self._models is not None
+
+    def stats(self):
+        """
+        获取每个模型文件的加载统计（使用模型包时会先加载所有成员）
+
+        返回:
+        字典，键为模型名称，值包含file、file_bytes、load_time（秒）、
+        resident_bytes和mapped_bytes
+        """
+        models = self.get_models()
+        if hasattr(models, "load_all"):
+            models.load_all()
+        return {name: dict(info) for name, info in self._stats.items()}
+
+    def reload(self):
+        """丢弃缓存并重新从磁盘加载模型（例如重新训练之后）"""
+        with self._lock:
+            self._models = self._load()
+            return self._models
+
+def get_registry(models_dir="models", mmap_mode=None, flatten_trees=True):
+    """
+    获取进程内共享的模型注册表
+
+    参数:
+    models_dir: 保存模型的目录路径
+    mmap_mode: 内存映射模式（模型包的数组区或传给joblib.load），None表示完整读入内存
+    flatten_trees: 是否额外构建扁平化的树模型和融合模型
+
+    返回:
+    ModelRegistry实例，相同参数总是返回同一个实例
+    """
+    key = (os.path.abspath(models_dir), mmap_mode, flatten_trees)
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = ModelRegistry(models_dir, mmap_mode, flatten_trees)
+            _registries[key] = registry
+        return registry
+
+def get_models(models_dir="models", mmap_mode=None, flatten_trees=True):
+    """
+    获取共享的模型字典，同一进程内只从磁盘加载一次
+
+    参数:
+    models_dir: 保存模型的目录路径
+    mmap_mode: 内存映射模式（模型包的数组区或传给joblib.load），None表示完整读入内存
+    flatten_trees: 是否额外构建扁平化的树模型和融合模型
+
+    返回:
+    与load_models()相同格式的模型字典，flatten_trees为True时还包含dt_flat、rf_flat和fused
+    """
+    return get_registry(models_dir, mmap_mode, flatten_trees).get_models()
+
+def print_stats(registry):
+    """打印每个模型文件的加载耗时和内存占用"""
+    print(f"{'模型':<16}{'文件大小':>12}{'加载耗时':>12}{'常驻内存':>14}{'内存映射':>14}")
+    for model_name, info in registry.stats().items():
+        print(f"{model_name:<16}{info['file_bytes'] / 1024:>10.1f}KB"
+              f"{info['load_time'] * 1000:>10.2f}ms"
+              f"{info['resident_bytes'] / 1024:>12.1f}KB"
+              f"{info['mapped_bytes'] / 1024:>12.1f}KB")
+
+if __name__ == "__main__":
+    mmap_mode = sys.argv[1] if len(sys.argv) > 1 else None
+    registry = get_registry(mmap_mode=mmap_mode)
+    registry.get_models()
+    print_stats(registry)
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+多用户模型托管
+每个用户有自己的模型目录 models/users/<用户ID>/（布局与models/相同，通常只有一个ensemble.bundle）。
+常用用户的模型常驻内存，总内存占用超过预算时淘汰最久未使用的用户；
+不在内存中的用户由后台线程加载，加载期间其他用户的预测不受影响
+
+用法:
+python src/multi_user.py add alice models/ensemble.bundle      把模型包安装为用户alice的模型
+python src/multi_user.py list                                   列出所有用户的模型包
+python src/multi_user.py bench --budget-mb 4 --requests 1000    模拟多用户请求，输出命中率和淘汰次数
+"""
+
+import argparse
+import copy
+import os
+import random
+import shutil
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.load_models import MODEL_FILES, USERS_DIR_NAME, predict_with_ensemble, user_models_dir
+from src.model_bundle import BUNDLE_FILE_NAME, ModelBundle, find_bundle
+from src.model_registry import ModelRegistry
+from src.instrumentation import increment, logger
+
+# 默认的内存预算（字节），当前的集成模型每个用户约1MB
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+
+# 默认的后台加载线程数
+DEFAULT_LOADER_THREADS = 2
+
+def list_users(models_dir="models"):
+    """
+    列出有模型的用户
+
+    返回:
+    用户ID列表（按名称排序）
+    """
+    root = os.path.join(models_dir, USERS_DIR_NAME)
+    if not os.path.isdir(root):
+        return []
+    users = []
+    for name in sorted(os.listdir(root)):
+        if _has_models(os.path.join(root, name)):
+            users.append(name)
+    return users
+
+def _has_models(directory):
+    """目录中是否有模型包或分散的模型文件"""
+    return find_bundle(directory) is not None or os.path.exists(os.path.join(directory, MODEL_FILES["rf"]))
+
+def install_bundle(user_id, bundle_path, models_dir="models"):
+    """
+    把模型包复制为用户的模型（已有的模型包会被替换，正在使用旧模型的进程需要调用MultiUserRegistry.evict()）
+
+    返回:
+    安装后的模型包路径
+    """
+    directory = user_models_dir(user_id, models_dir)
+    os.makedirs(directory, exist_ok=True)
+    target = os.path.join(directory, BUNDLE_FILE_NAME)
+    # 先复制到临时文件再替换，读取中的进程不会看到不完整的文件
+    temp_path = target + ".tmp"
+    shutil.copyfile(bundle_path, temp_path)
+    os.replace(temp_path, target)
+    return target
+
+class MultiUserRegistry:
+    """
+    按用户ID管理模型的注册表：内存预算内的LRU，冷用户在后台线程中加载，线程安全
+    """
+
+    def __init__(self, models_dir="models", memory_budget=DEFAULT_MEMORY_BUDGET,
+                 loader_threads=DEFAULT_LOADER_THREADS, flatten_trees=True):
+        """
+        参数:
+        models_dir: 模型根目录（用户模型位于其下的users/<用户ID>/）
+        memory_budget: 常驻模型的内存预算（字节），超过时淘汰最久未使用的用户
+        loader_threads: 后台加载线程数
+        flatten_trees: 是否构建扁平化的树模型和融合模型（与model_registry相同）
+        """
+        self.models_dir = models_dir
+        self.memory_budget = memory_budget
+        self.flatten_trees = flatten_trees
+        # 用户ID -> (模型字典, 常驻内存字节数)，按最近使用的顺序排列
+        self._entries = OrderedDict()
+        self._resident_bytes = 0
+        # 用户ID -> 正在加载的Future
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=loader_threads, thread_name_prefix="user-loader")
+        self._counters = {"hits": 0, "misses": 0, "loads": 0, "load_errors": 0, "evictions": 0}
+
+    def _load_user(self, user_id):
+        """在后台线程中加载一个用户的全部模型，并放入LRU"""
+        start = time.perf_counter()
+        try:
+            directory = user_models_dir(user_id, self.models_dir)
+            if not _has_models(directory):
+                raise FileNotFoundError(f"用户 {user_id} 没有模型: {directory}")
+            registry = ModelRegistry(directory, flatten_trees=self.flatten_trees)
+            models = registry.get_models()
+            # 加载所有成员和派生模型，预测时不再读取磁盘，同时得到准确的内存占用
+            size = sum(info["resident_bytes"] + info["mapped_bytes"] for info in registry.stats().values())
+        except Exception:
+            with self._lock:
+                self._pending.pop(user_id, None)
+                self._counters["load_errors"] += 1
+            raise
+
+        with self._lock:
+            self._pending.pop(user_id, None)
+            self._counters["loads"] += 1
+            previous = self._entries.pop(user_id, None)
+            if previous is not None:
+                self._resident_bytes -= previous[1]
+            self._entries[user_id] = (models, size)
+            self._resident_bytes += size
+            self._evict()
+        logger.info("已加载用户 %s 的模型: %.1fKB，耗时 %.1fms", user_id, size / 1024,
+                    (time.perf_counter() - start) * 1000)
+        return models
+
+    def _evict(self):
+        """淘汰最久未使用的用户直到满足内存预算（最近加载的用户总是保留）"""
+        while self._resident_bytes > self.memory_budget and len(self._entries) > 1:
+            user_id, (_, size) = self._entries.popitem(last=False)
+            self._resident_bytes -= size
+            self._counters["evictions"] += 1
+            increment("user_evictions")
+            logger.info("内存超出预算，淘汰用户 %s 的模型", user_id)
+
+    def prefetch(self, user_id):
+        """
+        在后台加载用户的模型（已常驻或正在加载时不重复加载）
+
+        返回:
+        concurrent.futures.Future，结果为模型字典
+        """
+        with self._lock:
+            return self._lookup(user_id)[1]
+
+    def _lookup(self, user_id):
+        """查找常驻模型；不存在时提交后台加载。返回(模型字典或None, Future或None)，调用方持有锁"""
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            self._entries.move_to_end(user_id)
+            return entry[0], None
+        future = self._pending.get(user_id)
+        if future is None:
+            # 先检查用户ID，无效的ID直接抛出异常，不提交给后台线程
+            user_models_dir(user_id, self.models_dir)
+            future = self._executor.submit(self._load_user, user_id)
+            self._pending[user_id] = future
+        return None, future
+
+    def get_models(self, user_id, timeout=None):
+        """
+        获取用户的模型字典：常驻时立即返回，否则等待后台加载完成
+        （等待期间不持有锁，其他用户的请求不受影响）
+
+        参数:
+        user_id: 用户ID
+        timeout: 等待加载的最长时间（秒），None表示一直等待
+
+        返回:
+        与load_models()相同格式的模型字典
+        """
+        with self._lock:
+            models, future = self._lookup(user_id)
+            if models is not None:
+                self._counters["hits"] += 1
+                increment("user_cache_hits")
+                return models
+            self._counters["misses"] += 1
+            increment("user_cache_misses")
+        return future.result(timeout)
+
+    def predict(self, user_id, X, execution=None, timeout=None):
+        """
+        使用用户的模型预测
+
+        参数:
+        user_id: 用户ID
+        X: 特征数据（DataFrame，或已按该用户模型的特征顺序排列的NumPy矩阵）
+        execution: predict_with_ensemble的并行配置（使用进程池时工作进程从该用户的模型目录加载模型，
+                   每个用户的进程池单独创建并复用）
+        timeout: 等待加载的最长时间（秒）
+
+        返回:
+        预测评分
+        """
+        models = self.get_models(user_id, timeout)
+        if execution is not None:
+            execution = copy.copy(execution)
+            execution.models_dir = user_models_dir(user_id, self.models_dir)
+        return predict_with_ensemble(X, models, execution)
+
+    def is_resident(self, user_id):
+        """用户的模型是否常驻内存"""
+        with self._lock:
+            return user_id in self._entries
+
+    def evict(self, user_id):
+        """主动淘汰用户的模型（如重新训练之后），下次使用时重新加载"""
+        with self._lock:
+            entry = self._entries.pop(user_id, None)
+            if entry is not None:
+                self._resident_bytes -= entry[1]
+            return entry is not None
+
+    def stats(self):
+        """
+        获取统计信息
+
+        返回:
+        字典，包含hits、misses、loads、load_errors、evictions、hit_rate、resident_users、
+        resident_bytes、memory_budget、loading（正在加载的用户数）和users（按最近使用排列的(用户ID, 字节数)）
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+            stats["resident_users"] = len(self._entries)
+            stats["resident_bytes"] = self._resident_bytes
+            stats["memory_budget"] = self.memory_budget
+            stats["loading"] = len(self._pending)
+            stats["users"] = [[user_id, size] for user_id, (_, size) in reversed(self._entries.items())]
+        return stats
+
+    def close(self):
+        """停止后台加载线程"""
+        self._executor.shutdown(wait=True)
+
+def _bench(args):
+    """模拟多用户请求：少数热门用户占大部分请求（Zipf分布）"""
+    from src.features import DEFAULT_DOUBAN_SCORE, get_vectorizer
+
+    users = list_users(args.models_dir)
+    if not users:
+        print(f"{os.path.join(args.models_dir, USERS_DIR_NAME)} 下没有用户模型，请先运行 add")
+        return
+    registry = MultiUserRegistry(args.models_dir, int(args.budget_mb * 1024 * 1024), args.loader_threads)
+    record = {"title": "测试", "douban_score": 8.0, "year": 2020, "watch_time": "2025-01-01 00:00:00",
+              "region": ["美国"], "genre": ["剧情"], "director": ["某导演"], "cast": []}
+    rng = random.Random(42)
+    weights = [1.0 / (rank + 1) for rank in range(len(users))]
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        user_id = rng.choices(users, weights)[0]
+        models = registry.get_models(user_id)
+        vectorizer = get_vectorizer(models["feature_names"], default_douban_score=DEFAULT_DOUBAN_SCORE)
+        predict_with_ensemble(vectorizer.transform(record), models)
+    seconds = time.perf_counter() - start
+    stats = registry.stats()
+    registry.close()
+    print(f"{args.requests} 次请求，{len(users)} 个用户，耗时 {seconds:.2f} 秒")
+    print(f"命中率 {stats['hit_rate']:.1%}，加载 {stats['loads']} 次，淘汰 {stats['evictions']} 次，"
+          f"常驻 {stats['resident_users']} 个用户 / {stats['resident_bytes'] / 1024 / 1024:.1f}MB"
+          f"（预算 {args.budget_mb}MB）")
+
+def main():
+    parser = argparse.ArgumentParser(description="多用户模型托管")
+    parser.add_argument("--models-dir", default="models", help="模型根目录")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = subparsers.add_parser("add", help="把模型包安装为某个用户的模型")
+    add_parser.add_argument("user_id", help="用户ID")
+    add_parser.add_argument("bundle", help="模型包路径")
+
+    subparsers.add_parser("list", help="列出所有用户的模型包")
+
+    bench_parser = subparsers.add_parser("bench", help="模拟多用户请求")
+    bench_parser.add_argument("--requests", type=int, default=1000, help="请求次数")
+    bench_parser.add_argument("--budget-mb", type=float, default=DEFAULT_MEMORY_BUDGET / 1024 / 1024,
+                              help="内存预算（MB）")
+    bench_parser.add_argument("--loader-threads", type=int, default=DEFAULT_LOADER_THREADS, help="后台加载线程数")
+    args = parser.parse_args()
+
+    if args.command == "add":
+        path = install_bundle(args.user_id, args.bundle, args.models_dir)
+        print(f"已安装用户 {args.user_id} 的模型包: {path}（版本 {ModelBundle(path).version}）")
+    elif args.command == "list":
+        users = list_users(args.models_dir)
+        if not users:
+            print("没有用户模型")
+        for user_id in users:
+            path = find_bundle(user_models_dir(user_id, args.models_dir))
+            if path is None:
+                print(f"{user_id}: 分散的模型文件")
+            else:
+                print(f"{user_id}: {path}（版本 {ModelBundle(path).version}，{os.path.getsize(path) / 1024:.1f}KB）")
+    else:
+        _bench(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+并行预测
+大批量预测时，在线程池中同时计算集成的各个成员以及随机森林的多组树
+（sklearn的树预测会释放GIL），超大批量再按行拆分到进程池中。
+小批量自动走串行路径，单条预测不会承担并行的开销
+"""
+
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.fuse import fuse_models
+from src.tree_export import FLAT_TREE_MAX_ROWS
+
+class ExecutionConfig:
+    """
+    并行执行配置
+    """
+
+    def __init__(self, threads=None, processes=0, min_rows_threads=4096, min_rows_processes=200000,
+                 tree_chunks=None, models_dir="models"):
+        """
+        参数:
+        threads: 线程数，None表示使用CPU核心数，0或1表示不使用线程池
+        processes: 进程数，0表示不使用进程池，None表示使用CPU核心数
+        min_rows_threads: 行数不少于该值时才使用线程池
+        min_rows_processes: 行数不少于该值时才使用进程池
+        tree_chunks: 随机森林拆分的组数，None表示与线程数相同
+        models_dir: 进程池中的工作进程加载模型的目录
+        """
+        cpu_count = os.cpu_count() or 1
+        self.threads = cpu_count if threads is None else threads
+        self.processes = cpu_count if processes is None else processes
+        self.min_rows_threads = min_rows_threads
+        self.min_rows_processes = min_rows_processes
+        self.tree_chunks = tree_chunks
+        self.models_dir = models_dir
+
+    def mode_for(self, n_rows):
+        """根据行数选择执行方式：serial、threads或processes"""
+        if self.processes > 1 and n_rows >= self.min_rows_processes:
+            return "processes"
+        if self.threads > 1 and n_rows >= self.min_rows_threads:
+            return "threads"
+        return "serial"
+
+# 线程池和进程池在进程内复用，避免每次预测都创建
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _get_pool(kind, workers, models_dir=None):
+    key = (kind, workers, models_dir)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            if kind == "threads":
+                pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ensemble")
+            else:
+                pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                           initargs=(models_dir,))
+            _pools[key] = pool
+        return pool
+
+def shutdown_pools():
+    """关闭所有复用的线程池和进程池"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown()
+        _pools.clear()
+
+def _sum_trees(estimators, X32):
+    """计算一组决策树的预测值之和（输入已经是float32，不再逐棵检查）"""
+    total = np.zeros(X32.shape[0], dtype=np.float64)
+    for estimator in estimators:
+        total += estimator.predict(X32, check_input=False)
+    return total
+
+def _forest_tasks(pool, forest, X32, n_chunks):
+    """把随机森林的树分成n_chunks组提交到线程池"""
+    estimators = forest.estimators_
+    bounds = np.linspace(0, len(estimators), min(n_chunks, len(estimators)) + 1).astype(int)
+    return [pool.submit(_sum_trees, estimators[start:stop], X32)
+            for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+def _predict_threaded(X, fused, threads, tree_chunks):
+    """在线程池中同时计算线性成员、决策树和随机森林的各组树"""
+    pool = _get_pool("threads", threads)
+    nan_mask = np.isnan(X)
+    nan_rows = np.flatnonzero(nan_mask.any(axis=1))
+
+    # sklearn的树在填充后的矩阵上只预测一次（只在有缺失值时生成填充后的矩阵）
+    X_filled = np.where(nan_mask, fused.fill_values, X) if nan_rows.size else X
+    X32 = np.ascontiguousarray(X_filled, dtype=np.float32)
+
+    futures = {}
+    if fused.coef is not None:
+        futures["ridge"] = [pool.submit(fused._linear, X, nan_mask, nan_rows)]
+    for name, model, flat in fused.trees:
+        if model is None:
+            futures[name] = [pool.submit(flat.predict, X)]
+            continue
+        estimators = getattr(model, "estimators_", None)
+        if estimators is None:
+            futures[name] = [pool.submit(_sum_trees, [model], X32)]
+        else:
+            futures[name] = _forest_tasks(pool, model, X32, tree_chunks)
+
+    predictions = []
+    if fused.coef is not None:
+        predictions.append(futures["ridge"][0].result())
+    for name, model, flat in fused.trees:
+        pred = sum(f.result() for f in futures[name])
+        if model is not None:
+            pred = pred / len(getattr(model, "estimators_", [model]))
+        predictions.append(pred)
+
+    total = predictions[0].copy()
+    for pred in predictions[1:]:
+        total += pred
+    total /= len(predictions)
+    return total
+
+def _fused_model(models):
+    """
+    获取融合模型：模型字典中没有时（如load_models()返回的字典）融合一次并保存回模型字典，
+    之后的调用直接复用，不再重复构建扁平化树
+
+    参数:
+    models: 模型字典（普通字典或LazyModels）
+
+    返回:
+    FusedEnsemble实例
+    """
+    fused = models.get("fused")
+    if fused is not None:
+        return fused
+    fused = fuse_models(models)
+    if hasattr(models, "attach"):
+        return models.attach("fused", fused)
+    models["fused"] = fused
+    return fused
+
+# 进程池中的工作进程持有自己的融合模型
+_worker_fused = None
+
+def _init_worker(models_dir):
+    global _worker_fused
+    from src.model_registry import get_models
+    _worker_fused = _fused_model(get_models(models_dir))
+
+def _predict_in_worker(X):
+    return _worker_fused.predict(X)
+
+def predict_parallel(X, models, config=None):
+    """
+    按配置选择串行、线程池或进程池进行集成预测
+
+    参数:
+    X: 已按训练特征顺序排列的特征矩阵（可以包含缺失值）
+    models: 模型字典（来自model_registry.get_models()或load_models()；没有融合模型时第一次调用融合并保存回字典）
+    config: ExecutionConfig，None表示使用默认配置
+
+    返回:
+    预测值数组
+    """
+    config = config or ExecutionConfig()
+    X = np.asarray(X, dtype=np.float64)
+    fused = _fused_model(models)
+    mode = config.mode_for(X.shape[0])
+
+    if mode == "processes":
+        pool = _get_pool("processes", config.processes, config.models_dir)
+        parts = np.array_split(X, config.processes)
+        return np.concatenate(list(pool.map(_predict_in_worker, parts)))
+
+    if mode == "threads" and X.shape[0] > FLAT_TREE_MAX_ROWS:
+        return _predict_threaded(X, fused, config.threads, config.tree_chunks or config.threads)
+
+    return fused.predict(X)
@@ -1,4 +1,4 @@
-import pandas as pd
+import argparse
 import numpy as np
 import os
 import sys
@@ -9,6 +9,8 @@ from colorama import init, Fore, Back, Style
 # 添加项目根目录到路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from src.load_models import load_models, predict_with_ensemble
+from src.columnar_store import load_encoded_frame
+from src.features import add_engineered_features
 
 # 初始化colorama
 init()
@@ -20,23 +22,18 @@ if sys.platform == 'win32':
     # 尝试设置控制台代码页
     os.system('chcp 65001 > nul')
 
-def main():
+def show_examples():
+    """显示编码数据集前10条记录的预测结果"""
     print(f"{Fore.CYAN}加载模型...{Style.RESET_ALL}")
     models = load_models()
     
     print(f"{Fore.CYAN}加载测试数据...{Style.RESET_ALL}")
     try:
         # 加载 One-Hot 编码后的数据
-        encoded_df = pd.read_json("data/onehot_encoded_data.json", orient="records", encoding="utf-8")
+        encoded_df = load_encoded_frame()
         
         # 创建特征
-        encoded_df['director_count'] = encoded_df['director'].apply(lambda x: len(eval(x)) if isinstance(x, str) else len(x) if isinstance(x, list) else 0)
-        encoded_df['cast_count'] = encoded_df['cast'].apply(lambda x: len(eval(x)) if isinstance(x, str) else len(x) if isinstance(x, list) else 0)
-        encoded_df['douban_score'] = encoded_df['douban_score'].fillna(encoded_df['douban_score'].mean())
-        encoded_df['watch_time'] = pd.to_datetime(encoded_df['watch_time'])
-        encoded_df['watch_year'] = encoded_df['watch_time'].dt.year
-        encoded_df['watch_quarter'] = encoded_df['watch_time'].dt.quarter
-        encoded_df['title_length'] = encoded_df['title'].str.split().str.len()
+        add_engineered_features(encoded_df)
         
         # 选择前5个样本作为示例
         sample_df = encoded_df.head(10)
@@ -75,11 +72,36 @@ def main():
         # 计算平均绝对误差
         mae = np.mean(np.abs(y_true - y_pred))
         print(f"\n{Fore.CYAN}平均绝对误差 (MAE): {Fore.WHITE}{mae:.2f}{Style.RESET_ALL}")
+        print(f"{Fore.CYAN}示例记录可能来自训练数据，在测试集上评估请使用 --evaluate（留出文件使用 --input）{Style.RESET_ALL}")
         
     except Exception as e:
         print(f"{Fore.RED}发生错误: {e}{Style.RESET_ALL}")
         import traceback
         traceback.print_exc()
         
+def main():
+    parser = argparse.ArgumentParser(description="预测示例：显示前10条记录的预测结果，或流式评估编码数据集")
+    parser.add_argument("--evaluate", action="store_true",
+                        help="流式评估编码数据集（默认只评估save_models.py划分的测试集），输出各成员和集成模型的指标")
+    parser.add_argument("--split", choices=["holdout", "full"], default=None,
+                        help="--evaluate的评估范围：holdout为测试集（默认），full为完整数据集（样本内）")
+    parser.add_argument("--input", default=None, help="流式评估带user_score的留出文件（JSONL、CSV或JSON数组）")
+    parser.add_argument("--chunk-size", type=int, default=None, help="流式评估时每块的记录数")
+    parser.add_argument("--min-count", type=int, default=None, help="按类型、地区拆分时只显示样本数不少于该值的标签")
+    parser.add_argument("--output", default=None, help="把评估结果保存为JSON")
+    args = parser.parse_args()
+
+    if not (args.evaluate or args.input):
+        show_examples()
+        return
+
+    from src import evaluate
+    argv = [args.input] if args.input else []
+    for flag, value in (("--split", args.split), ("--chunk-size", args.chunk_size), ("--min-count", args.min_count),
+                        ("--output", args.output)):
+        if value is not None:
+            argv += [flag, str(value)]
+    evaluate.main(argv)
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
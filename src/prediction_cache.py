@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+预测结果缓存
+以规范化的特征向量和模型包版本的哈希为键缓存预测评分，重复预测同一部作品时不再调用模型：
+- 内存层: LRU，限制条目数量和存活时间（TTL）
+- 磁盘层（可选）: SQLite文件，进程重启后仍然有效
+缓存键包含模型包版本，模型包版本变化（重新训练或增量更新）后旧版本的条目不会再命中；
+多个版本可以同时使用同一个缓存（例如不同用户的模型），旧版本的内存条目按LRU淘汰，
+磁盘条目可以用--keep-version清除
+
+用法:
+python src/prediction_cache.py --db models/prediction_cache.sqlite    查看磁盘缓存的统计
+python src/prediction_cache.py --db models/prediction_cache.sqlite --clear
+python src/prediction_cache.py --db models/prediction_cache.sqlite --keep-version <版本>    删除其他版本的条目
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 默认的磁盘缓存路径
+DEFAULT_CACHE_DB = "models/prediction_cache.sqlite"
+
+def model_version(models):
+    """
+    获取模型字典对应的模型包版本
+
+    参数:
+    models: load_models()或model_registry.get_models()返回的模型字典
+
+    返回:
+    版本字符串；分散保存的旧模型文件没有版本，返回None（此时不使用缓存）
+    """
+    return getattr(models, "version", None)
+
+def canonical_features(X, feature_names=None):
+    """
+    把特征矩阵转换为规范形式：按训练时的特征顺序排列的C连续float64矩阵，
+    所有NaN统一为同一个位模式，-0.0统一为0.0
+
+    参数:
+    X: DataFrame或NumPy矩阵（NumPy矩阵应已按训练特征顺序排列）
+    feature_names: 训练时的特征顺序，X为DataFrame时用于重排列（缺失的特征填0，与predict_with_ensemble一致）
+
+    返回:
+    规范化的二维NumPy矩阵
+    """
+    if hasattr(X, "columns"):
+        if feature_names is not None:
+            X = X.reindex(columns=feature_names, fill_value=0)
+        X = X.to_numpy(dtype=np.float64)
+    X = np.array(X, dtype=np.float64, order="C", ndmin=2)
+    X += 0.0
+    X[np.isnan(X)] = np.nan
+    return X
+
+def feature_keys(X, version):
+    """
+    计算每行特征向量的缓存键
+
+    参数:
+    X: canonical_features()返回的矩阵
+    version: 模型包版本
+
+    返回:
+    十六进制字符串列表
+    """
+    prefix = hashlib.blake2b(str(version).encode("utf-8"), digest_size=16)
+    keys = []
+    for row in X:
+        digest = prefix.copy()
+        digest.update(row.tobytes())
+        keys.append(digest.hexdigest())
+    return keys
+
+class PredictionCache:
+    """
+    两层预测缓存：内存LRU + 可选的SQLite磁盘层，线程安全
+    """
+
+    def __init__(self, max_size=100000, ttl=None, db_path=None):
+        """
+        参数:
+        max_size: 内存层最多保存的条目数
+        ttl: 条目的存活时间（秒），None表示不过期
+        db_path: 磁盘层的SQLite文件路径，None表示只使用内存层
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.db_path = db_path
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        self._db = None
+        if db_path is not None:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS predictions ("
+                             "key TEXT PRIMARY KEY, version TEXT NOT NULL, "
+                             "value REAL NOT NULL, created_at REAL NOT NULL)")
+            self._db.commit()
+
+    def _get_disk(self, keys, now, expired=()):
+        if self._db is None or not keys:
+            return {}
+        found = {}
+        # SQLite对参数数量有限制，分批查询
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._db.execute(f"SELECT key, value, created_at FROM predictions WHERE key IN ({placeholders})",
+                                    batch).fetchall()
+            for key, value, created_at in rows:
+                if self.ttl is not None and now - created_at > self.ttl:
+                    # 内存层已经记过一次过期的条目不重复计数
+                    if key not in expired:
+                        self._counters["expirations"] += 1
+                    continue
+                found[key] = (value, created_at)
+        return found
+
+    def _put_memory(self, key, value, created_at):
+        self._entries[key] = (value, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def get_many(self, keys, version):
+        """
+        查找缓存
+
+        参数:
+        keys: feature_keys()计算的缓存键
+        version: 模型包版本
+
+        返回:
+        字典，键为命中的缓存键，值为预测评分
+        """
+        now = time.time()
+        result = {}
+        with self._lock:
+            self.version = version
+            missing = []
+            expired = set()
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and self.ttl is not None and now - entry[1] > self.ttl:
+                    del self._entries[key]
+                    self._counters["expirations"] += 1
+                    expired.add(key)
+                    entry = None
+                if entry is None:
+                    missing.append(key)
+                    continue
+                self._entries.move_to_end(key)
+                result[key] = entry[0]
+                self._counters["hits"] += 1
+
+            for key, (value, created_at) in self._get_disk(list(dict.fromkeys(missing)), now, expired).items():
+                # 磁盘层命中的条目放回内存层
+                self._put_memory(key, value, created_at)
+                result[key] = value
+            for key in missing:
+                if key in result:
+                    self._counters["disk_hits"] += 1
+                else:
+                    self._counters["misses"] += 1
+        return result
+
+    def put_many(self, items, version):
+        """
+        保存预测结果
+
+        参数:
+        items: (缓存键, 预测评分) 的列表
+        version: 模型包版本
+        """
+        now = time.time()
+        with self._lock:
+            self.version = version
+            for key, value in items:
+                self._put_memory(key, float(value), now)
+            if self._db is not None and items:
+                self._db.executemany("INSERT OR REPLACE INTO predictions (key, version, value, created_at) "
+                                     "VALUES (?, ?, ?, ?)",
+                                     [(key, version, float(value), now) for key, value in items])
+                self._db.commit()
+
+    def predict(self, X, models, predict_fn=None, execution=None):
+        """
+        带缓存的预测：只有未命中的行才调用模型
+
+        参数:
+        X: 特征数据（DataFrame，或已按训练特征顺序排列的NumPy矩阵）
+        models: 模型字典（来自load_models()或model_registry.get_models()）
+        predict_fn: 接收未命中行的NumPy矩阵、返回预测数组的函数，None表示使用predict_with_ensemble
+        execution: predict_with_ensemble的并行配置
+
+        返回:
+        预测值数组；predict_fn返回None（模型预测失败）时返回None，不写入缓存
+        """
+        if predict_fn is None:
+            from src.load_models import predict_with_ensemble
+            predict_fn = lambda X_miss: predict_with_ensemble(X_miss, models, execution)
+
+        version = model_version(models)
+        X = canonical_features(X, models.get("feature_names"))
+        if version is None:
+            values = predict_fn(X)
+            return None if values is None else np.asarray(values, dtype=np.float64)
+
+        keys = feature_keys(X, version)
+        cached = self.get_many(keys, version)
+        predictions = np.empty(len(keys), dtype=np.float64)
+        miss_rows = []
+        first_row = {}
+        for i, key in enumerate(keys):
+            if key in cached:
+                predictions[i] = cached[key]
+            elif key in first_row:
+                # 同一批中重复的行只预测一次
+                miss_rows.append(i)
+            else:
+                first_row[key] = i
+                miss_rows.append(i)
+
+        if miss_rows:
+            unique_rows = list(first_row.values())
+            values = predict_fn(X[unique_rows])
+            if values is None:
+                return None
+            values = np.asarray(values, dtype=np.float64).reshape(-1)
+            self.put_many(list(zip(first_row, values)), version)
+            computed = dict(zip(first_row, values))
+            for i in miss_rows:
+                predictions[i] = computed[keys[i]]
+        return predictions
+
+    def stats(self):
+        """
+        获取缓存统计
+
+        返回:
+        字典，包含hits（内存层命中）、disk_hits、misses、evictions、expirations、
+        hit_rate、size（内存层条目数）、disk_size和version（最近一次使用的模型包版本）
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+            stats["hit_rate"] = (stats["hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+            stats["size"] = len(self._entries)
+            stats["disk_size"] = (self._db.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+                                  if self._db is not None else 0)
+            stats["version"] = self.version
+        return stats
+
+    def clear(self):
+        """清空内存层和磁盘层"""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM predictions")
+                self._db.commit()
+
+    def keep_version(self, version):
+        """
+        删除磁盘层中其他模型包版本的条目（内存层的旧条目按LRU淘汰）
+
+        返回:
+        删除的条目数量
+        """
+        with self._lock:
+            if self._db is None:
+                return 0
+            deleted = self._db.execute("DELETE FROM predictions WHERE version != ?", (version,)).rowcount
+            self._db.commit()
+            return deleted
+
+    def close(self):
+        """关闭磁盘层"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+def main():
+    parser = argparse.ArgumentParser(description="预测结果缓存")
+    parser.add_argument("--db", default=DEFAULT_CACHE_DB, help="磁盘缓存文件")
+    parser.add_argument("--clear", action="store_true", help="清空缓存")
+    parser.add_argument("--keep-version", help="只保留该模型包版本的条目")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"缓存文件 {args.db} 不存在")
+        return
+    cache = PredictionCache(db_path=args.db)
+    if args.clear:
+        cache.clear()
+        print(f"已清空 {args.db}")
+    elif args.keep_version:
+        print(f"已删除 {cache.keep_version(args.keep_version)} 条其他版本的条目")
+    else:
+        rows = cache._db.execute("SELECT version, COUNT(*) FROM predictions GROUP BY version").fetchall()
+        print(f"缓存文件: {args.db}，共 {sum(count for _, count in rows)} 条")
+        for version, count in rows:
+            print(f"  模型包版本 {version}: {count} 条")
+    cache.close()
+
+if __name__ == "__main__":
+    main()
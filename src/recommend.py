@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+作品推荐
+对候选作品目录（格式与cleaned_data.json相同，支持JSONL、CSV或JSON数组）打分，返回预测评分最高的K部作品。
+候选作品按块构建按位压缩的特征（地区、类型每个标志1位），只在交给模型时逐块展开为float64矩阵，
+每块只用np.argpartition保留当前的前K名，内存占用与目录大小无关；
+可以按类型、地区筛选，默认排除cleaned_data.json中已经看过的作品
+
+用法:
+python src/recommend.py catalog.jsonl -k 20
+python src/recommend.py catalog.jsonl -k 10 --genre 科幻 --genre 动作 --region 美国
+python src/recommend.py catalog.jsonl -k 50 -o recommendations.jsonl --chunk-size 100000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.batch_predict import iter_chunks, iter_records
+from src.features import DEFAULT_DOUBAN_SCORE, get_vectorizer, parse_list
+from src.load_models import predict_with_ensemble
+from src.model_registry import get_models
+from src.parallel_predict import ExecutionConfig
+from src.instrumentation import configure_logging, span
+
+# 已看过的作品
+DEFAULT_SEEN_PATH = "data/cleaned_data.json"
+
+# 默认每块的候选作品数
+DEFAULT_CHUNK_SIZE = 100000
+
+# 每次展开为float64矩阵交给模型的行数（小于该值时树模型逐次调用的开销明显增加）
+DEFAULT_BLOCK_SIZE = 16384
+
+def load_seen_titles(path=DEFAULT_SEEN_PATH):
+    """
+    读取已看过的作品标题
+
+    参数:
+    path: 清洗后的数据文件路径
+
+    返回:
+    标题集合，文件不存在时为空集合
+    """
+    if not os.path.exists(path):
+        return set()
+    return {record.get('title') for record in iter_records(path) if record.get('title')}
+
+def _matches(record, field, wanted):
+    """记录的地区或类型列表中是否包含wanted中的任意一项"""
+    return not wanted.isdisjoint(parse_list(record.get(field)))
+
+def filter_candidates(records, genres=None, regions=None, exclude_titles=None):
+    """
+    按类型、地区和已看过的标题筛选候选作品
+
+    参数:
+    records: 候选作品字典的可迭代对象
+    genres: 类型列表，作品包含其中任意一个类型即保留，None表示不筛选
+    regions: 地区列表，作品属于其中任意一个地区即保留，None表示不筛选
+    exclude_titles: 需要排除的标题集合
+
+    返回:
+    符合条件的记录的生成器
+    """
+    genres = set(genres) if genres else None
+    regions = set(regions) if regions else None
+    for record in records:
+        if exclude_titles and record.get('title') in exclude_titles:
+            continue
+        if genres is not None and not _matches(record, 'genre', genres):
+            continue
+        if regions is not None and not _matches(record, 'region', regions):
+            continue
+        yield record
+
+def top_k_indices(scores, k):
+    """
+    预测评分最高的k个位置，按评分从高到低排列（评分相同时位置靠前的优先）
+
+    参数:
+    scores: 一维评分数组
+    k: 返回的数量
+
+    返回:
+    下标数组
+    """
+    if k <= 0 or len(scores) == 0:
+        return np.empty(0, dtype=np.intp)
+    if k < len(scores):
+        # 部分排序：只找出前k名，不对整个数组排序
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order]
+
+def recommend(candidates, k=10, genres=None, regions=None, exclude_titles=None,
+              chunk_size=DEFAULT_CHUNK_SIZE, models_dir="models", models=None, execution=None, cache=None,
+              block_size=DEFAULT_BLOCK_SIZE):
+    """
+    从候选作品中推荐预测评分最高的k部作品
+
+    参数:
+    candidates: 候选作品字典的可迭代对象（可以是iter_records()返回的生成器）
+    k: 推荐数量
+    genres: 类型筛选，None表示不筛选
+    regions: 地区筛选，None表示不筛选
+    exclude_titles: 需要排除的标题集合（如已看过的作品）
+    chunk_size: 每块的候选作品数
+    models_dir: 保存模型的目录路径
+    models: 模型字典，None表示从模型注册表获取
+    execution: ExecutionConfig并行配置，None表示串行
+    cache: PredictionCache实例，None表示不缓存
+    block_size: 每次展开为float64矩阵交给模型的行数
+
+    返回:
+    (推荐列表, 统计信息) 元组。推荐列表按预测评分从高到低排列，每一项是候选作品字典的副本，
+    增加了predicted_score和rank字段；统计信息包含candidates（筛选后打分的作品数）和seconds
+    """
+    if models is None:
+        models = get_models(models_dir)
+    feature_names = models.get("feature_names")
+    if not feature_names:
+        raise ValueError("缺少特征名称文件，请先运行 save_feature_names.py")
+    # 豆瓣评分缺失时的填充值与交互式预测和批量预测一致
+    vectorizer = get_vectorizer(feature_names, default_douban_score=DEFAULT_DOUBAN_SCORE)
+
+    best_scores = np.empty(0, dtype=np.float64)
+    best_records = []
+    scored = 0
+    start = time.perf_counter()
+    for chunk in iter_chunks(filter_candidates(candidates, genres, regions, exclude_titles), chunk_size):
+        # 整块只保存压缩后的特征，逐块展开为float64矩阵交给模型
+        packed = vectorizer.transform_packed(chunk)
+        predictions = np.empty(len(chunk), dtype=np.float64)
+        for offset, X in packed.iter_dense(block_size):
+            if cache is not None:
+                block = cache.predict(X, models, execution=execution)
+            else:
+                block = predict_with_ensemble(X, models, execution)
+            if block is None:
+                raise RuntimeError("预测失败")
+            block = np.asarray(block, dtype=np.float64).reshape(-1)
+            # NaN无法参与比较，会使前K名的选择结果错误，直接报错
+            if not np.all(np.isfinite(block)):
+                raise RuntimeError(f"预测结果中有 {int(np.sum(~np.isfinite(block)))} 个非有限值")
+            predictions[offset:offset + len(X)] = block
+        scored += len(chunk)
+
+        with span("top_k"):
+            # 当前的前k名排在新一块之前，评分相同时先出现的作品优先
+            scores = np.concatenate([best_scores, predictions])
+            keep = top_k_indices(scores, k)
+            n_best = len(best_records)
+            best_records = [best_records[i] if i < n_best else chunk[i - n_best] for i in keep]
+            best_scores = scores[keep]
+    seconds = time.perf_counter() - start
+
+    recommendations = []
+    for rank, (record, score) in enumerate(zip(best_records, best_scores), 1):
+        item = dict(record)
+        item['predicted_score'] = round(float(score), 4)
+        item['rank'] = rank
+        recommendations.append(item)
+    return recommendations, {'candidates': scored, 'seconds': seconds}
+
+def main():
+    parser = argparse.ArgumentParser(description="从候选作品目录中推荐预测评分最高的作品")
+    parser.add_argument("catalog", help="候选作品文件（JSONL、CSV或JSON数组，格式与cleaned_data.json相同）")
+    parser.add_argument("-k", "--top-k", type=int, default=10, help="推荐数量")
+    parser.add_argument("--genre", action="append", help="只推荐包含该类型的作品（可重复，满足任意一个即可）")
+    parser.add_argument("--region", action="append", help="只推荐该地区的作品（可重复，满足任意一个即可）")
+    parser.add_argument("--include-seen", action="store_true", help=f"不排除{DEFAULT_SEEN_PATH}中已看过的作品")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="每块的候选作品数")
+    parser.add_argument("--input-format", choices=['jsonl', 'csv', 'json'], help="输入格式，默认根据扩展名判断")
+    parser.add_argument("-o", "--output", default=None, help="把推荐结果保存为JSONL文件")
+    parser.add_argument("--models-dir", default="models", help="模型目录")
+    parser.add_argument("--threads", type=int, default=1, help="线程数，0表示CPU核心数")
+    parser.add_argument("--log-level", default="WARNING", help="预测过程提示信息的日志级别（如INFO、WARNING）")
+    args = parser.parse_args()
+
+    configure_logging(args.log_level)
+    execution = None
+    if args.threads != 1:
+        execution = ExecutionConfig(threads=args.threads or None, models_dir=args.models_dir)
+
+    exclude_titles = None if args.include_seen else load_seen_titles()
+    recommendations, stats = recommend(iter_records(args.catalog, args.input_format), args.top_k,
+                                       args.genre, args.region, exclude_titles, args.chunk_size,
+                                       args.models_dir, execution=execution)
+
+    print(f"共对 {stats['candidates']} 部候选作品打分，耗时 {stats['seconds']:.2f} 秒")
+    for item in recommendations:
+        genre = "/".join(parse_list(item.get('genre')))
+        region = "/".join(parse_list(item.get('region')))
+        print(f"{item['rank']:>3}. {item.get('title')}  预测评分 {item['predicted_score']:.2f}  "
+              f"[{region}] {genre}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for item in recommendations:
+                f.write(json.dumps(item, ensure_ascii=False, default=str) + '\n')
+        print(f"推荐结果已保存到 {args.output}")
+
+if __name__ == "__main__":
+    main()
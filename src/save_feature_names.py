@@ -4,6 +4,7 @@
 """
 保存特征名称顺序
 这个脚本从训练数据和模型中提取特征名称顺序，并保存到feature_names.joblib文件中
+（只用于分散保存的旧模型文件；模型包ensemble.bundle的头部已经记录了特征名称）
 """
 
 import os
@@ -14,11 +15,24 @@ import pandas as pd
 import numpy as np
 from colorama import init, Fore, Style
 
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.feature_schema import load_feature_schema
+from src.model_bundle import ModelBundle, find_bundle
+
 # 初始化colorama
 init(autoreset=True)
 
 def main():
     """主函数，保存特征名称顺序"""
+    bundle_path = find_bundle("models")
+    if bundle_path is not None:
+        # 模型包的特征名称与模型一起保存，不再需要单独的feature_names.joblib
+        bundle = ModelBundle(bundle_path)
+        print(f"{Fore.GREEN}模型包 {bundle_path}（版本 {bundle.version}）已记录特征名称，"
+              f"共{len(bundle.feature_names)}个特征，无需单独保存{Style.RESET_ALL}")
+        return
+    
     print(f"{Fore.CYAN}正在从模型和训练数据中提取特征名称顺序...{Style.RESET_ALL}")
     
     try:
@@ -39,20 +53,13 @@ def main():
         
         # 如果无法从imputer模型中获取特征名称，则从训练数据中获取
         if feature_names is None:
-            print(f"{Fore.CYAN}尝试从训练数据中获取特征名称...{Style.RESET_ALL}")
-            # 加载训练数据
-            with open("data/onehot_encoded_data.json", "r", encoding="utf-8") as f:
-                train_data = json.load(f)
-                if not train_data or len(train_data) == 0:
-                    print(f"{Fore.RED}错误：训练数据为空{Style.RESET_ALL}")
-                    return
-                
-                # 获取第一行数据的所有特征名
-                first_item = train_data[0]
-                
-                # 获取所有可能的特征列名（排除非特征列）
-                feature_names = [col for col in first_item.keys() if col not in ['title', 'watch_time', 'director', 'cast', 'user_score']]
-                print(f"{Fore.GREEN}成功从训练数据中获取特征名称，共{len(feature_names)}个特征{Style.RESET_ALL}")
+            print(f"{Fore.CYAN}尝试从特征schema中获取特征名称...{Style.RESET_ALL}")
+            # 读取训练时保存的特征schema清单
+            feature_names = list(load_feature_schema()["feature_names"])
+            if not feature_names:
+                print(f"{Fore.RED}错误：训练数据为空{Style.RESET_ALL}")
+                return
+            print(f"{Fore.GREEN}成功从特征schema中获取特征名称，共{len(feature_names)}个特征{Style.RESET_ALL}")
         
         # 确保包含必要的特征
         essential_features = ['douban_score', 'year', 'watch_year', 'watch_quarter', 
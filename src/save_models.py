@@ -1,78 +1,82 @@
+import argparse
 import os
-import joblib
 import sys
-import pandas as pd
-from sklearn.linear_model import Ridge
-from sklearn.tree import DecisionTreeRegressor
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import train_test_split
-from sklearn.impute import SimpleImputer
-import numpy as np
 
 # 添加项目根目录到路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.fold_store import open_fold_store
+from src.feature_schema import DEFAULT_SCHEMA_PATH, build_feature_schema, save_feature_schema
+from src.model_bundle import BUNDLE_FILE_NAME, evaluate_members, write_bundle
+from src.train import DEFAULT_PARAMS_PATH, load_best_params, make_estimator
 
-def main():
-    # 创建models目录（如果不存在）
-    os.makedirs("models", exist_ok=True)
+def main(models_dir="models", sparse=False):
+    """
+    参数:
+    models_dir: 模型目录（模型包、特征schema清单和搜索得到的参数都在该目录中）
+    sparse: 是否同时在稀疏特征（包括导演和演员）上训练Ridge，保存为模型包成员sparse_ridge
+    """
+    bundle_path = os.path.join(models_dir, BUNDLE_FILE_NAME)
+    schema_path = os.path.join(models_dir, os.path.basename(DEFAULT_SCHEMA_PATH))
+    # 创建模型目录（如果不存在）
+    os.makedirs(models_dir, exist_ok=True)
     
     print("加载数据...")
-    # 加载 One-Hot 编码后的数据
-    encoded_df = pd.read_json("data/onehot_encoded_data.json", orient="records", encoding="utf-8")
+    # 从折存储读取划分好的数据集（训练数据没有变化时不重新加载和构建特征）
+    store = open_fold_store(test_size=0.2, random_state=42)
+    X_train, X_test, y_train, y_test = store.split()
+    feature_columns = store.feature_names
     
-    # 创建特征
-    encoded_df['director_count'] = encoded_df['director'].apply(lambda x: len(eval(x)) if isinstance(x, str) else len(x) if isinstance(x, list) else 0)
-    encoded_df['cast_count'] = encoded_df['cast'].apply(lambda x: len(eval(x)) if isinstance(x, str) else len(x) if isinstance(x, list) else 0)
-    encoded_df['douban_score'] = encoded_df['douban_score'].fillna(encoded_df['douban_score'].mean())
-    encoded_df['watch_time'] = pd.to_datetime(encoded_df['watch_time'])
-    encoded_df['watch_year'] = encoded_df['watch_time'].dt.year
-    encoded_df['watch_quarter'] = encoded_df['watch_time'].dt.quarter
-    encoded_df['title_length'] = encoded_df['title'].str.split().str.len()
+    # 保存特征schema清单（使用填充前的训练集统计量）
+    feature_schema = build_feature_schema(X_train)
+    save_feature_schema(feature_schema, schema_path)
     
-    # 确定特征列
-    feature_columns = [col for col in encoded_df.columns if col not in ['title', 'watch_time', 'director', 'cast', 'user_score']]
-    
-    # 创建特征矩阵 X 和标签向量 y
-    X = encoded_df[feature_columns]
-    y = encoded_df['user_score']
-    
-    # 划分数据集
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    
-    # 处理缺失值
-    imputer = SimpleImputer(strategy='mean')
-    X_train = imputer.fit_transform(X_train)
-    X_test = imputer.transform(X_test)
+    # 处理缺失值（测试集在评估时由imputer填充）：imputer和用它填充后的训练矩阵都保存在折存储中
+    imputer = store.imputer()
+    X_train = store.imputed_train()
     
     print("训练模型...")
+    # 使用train.py搜索得到的参数（没有搜索结果时使用默认参数）
+    params = load_best_params(os.path.join(models_dir, os.path.basename(DEFAULT_PARAMS_PATH)))
+    
     # 训练岭回归模型
-    best_ridge = Ridge(alpha=10.0)
+    best_ridge = make_estimator("ridge", params["ridge"])
     best_ridge.fit(X_train, y_train)
     
     # 训练决策树模型
-    best_dt = DecisionTreeRegressor(max_depth=5, min_samples_leaf=5, min_samples_split=2, random_state=42)
+    best_dt = make_estimator("dt", params["dt"])
     best_dt.fit(X_train, y_train)
     
     # 训练随机森林模型
-    best_rf = RandomForestRegressor(n_estimators=200, max_depth=5, min_samples_leaf=5, 
-                                    min_samples_split=2, random_state=42)
+    best_rf = make_estimator("rf", params["rf"])
     best_rf.fit(X_train, y_train)
     
-    print("保存模型...")
-    # 保存模型
-    joblib.dump(best_ridge, "models/best_ridge.joblib")
-    joblib.dump(best_dt, "models/best_dt.joblib")
-    joblib.dump(best_rf, "models/best_rf.joblib")
+    members = {"imputer": imputer, "ridge": best_ridge, "dt": best_dt, "rf": best_rf}
+    metrics = {
+        "n_train": len(y_train),
+        "n_test": len(y_test),
+        "test": evaluate_members(members, X_test, y_test),
+    }
+    
+    if sparse:
+        # 稀疏Ridge直接在列式存储的CSR矩阵上训练，不使用imputer，不参与稠密特征的集成平均
+        from src.sparse_encoding import MEMBER_NAME, train_sparse_ridge
+        print("训练稀疏Ridge模型...")
+        members[MEMBER_NAME], metrics["test"][MEMBER_NAME] = train_sparse_ridge(store, params["ridge"])
     
-    # 保存特征处理器
-    joblib.dump(imputer, "models/imputer.joblib")
+    print("保存模型...")
+    # 模型、特征处理器、特征名称和训练指标保存到同一个模型包中
+    version = write_bundle(bundle_path, members, feature_columns, feature_schema, metrics, params)
     
     print("模型保存完成！")
+    print(f"模型包版本: {version}，集成模型测试集MAE: {metrics['test']['ensemble']['mae']:.3f}")
     print("保存的模型文件:")
-    print("- models/best_ridge.joblib")
-    print("- models/best_dt.joblib")
-    print("- models/best_rf.joblib")
-    print("- models/imputer.joblib")
+    print(f"- {bundle_path}")
+    print(f"- {schema_path}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="训练并保存模型包")
+    parser.add_argument("--models-dir", default="models", help="模型目录")
+    parser.add_argument("--sparse", action="store_true",
+                        help="同时在稀疏特征（地区、类型、导演、演员）上训练Ridge，保存为成员sparse_ridge")
+    args = parser.parse_args()
+    main(args.models_dir, args.sparse)
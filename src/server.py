@@ -0,0 +1,388 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+本地HTTP预测服务
+常驻进程保持模型在内存中，短时间窗口内到达的并发请求会合并为一次矩阵预测
+
+用法:
+python src/server.py --port 8000 --window-ms 5
+python src/server.py --cache-db models/prediction_cache.sqlite    预测结果缓存保存到磁盘，重启后仍然有效
+python src/server.py --multi-user --memory-budget-mb 256          按用户ID使用models/users/<用户ID>/中的模型
+
+接口:
+POST /predict        请求体为单个影视作品（与app.get_user_input()格式相同）
+POST /predict/batch  请求体为影视作品列表，或{"movies": [...]}
+                     两个接口都可以加上?user=<用户ID>使用该用户的模型（需要--multi-user）
+GET  /health         服务状态、批处理统计、缓存命中统计和多用户模型统计
+GET  /metrics        各阶段耗时直方图和计数器（Prometheus文本格式，需要--instrument开启计时）
+"""
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.load_models import predict_with_ensemble
+from src.model_registry import get_models
+from src.features import DEFAULT_DOUBAN_SCORE, get_vectorizer
+from src.prediction_cache import PredictionCache
+from src.multi_user import DEFAULT_LOADER_THREADS, DEFAULT_MEMORY_BUDGET, MultiUserRegistry
+from src.instrumentation import configure_logging, instrumentation
+
+class MicroBatcher:
+    """
+    微批处理器：收集一个时间窗口内提交的特征矩阵，
+    合并后只调用一次预测函数，再把结果按行拆分给各个请求；
+    提交时指定了分组（如用户ID）的请求按分组分别合并，每组调用一次predict_fn(X, 分组)
+    """
+
+    def __init__(self, predict_fn, window_ms=5.0, max_batch_size=4096):
+        """
+        参数:
+        predict_fn: 接收特征矩阵（和分组）、返回预测数组的函数
+        window_ms: 第一个请求到达后等待更多请求的时间（毫秒）
+        max_batch_size: 每批最多合并的行数
+        """
+        self.predict_fn = predict_fn
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "batches": 0, "rows": 0, "max_batch_rows": 0}
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, X, group=None):
+        """
+        提交一个特征矩阵
+
+        参数:
+        X: 形状为(行数, 特征数)的特征矩阵
+        group: 分组，None表示不分组（调用predict_fn(X)）
+
+        返回:
+        concurrent.futures.Future，结果为这些行的预测数组
+        """
+        future = Future()
+        self._queue.put((X, future, group))
+        return future
+
+    def predict(self, X, timeout=None, group=None):
+        """提交特征矩阵并等待预测结果"""
+        return self.submit(X, group).result(timeout)
+
+    def _collect(self, first):
+        """从队列中收集一个批次，直到时间窗口结束或达到最大行数"""
+        batch = [first]
+        rows = len(first[0])
+        deadline = time.monotonic() + self.window
+        while rows < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # 把关闭信号放回队列，处理完当前批次后退出
+                self._queue.put(None)
+                break
+            batch.append(item)
+            rows += len(item[0])
+        return batch, rows
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+
+            batch, _ = self._collect(first)
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[2], []).append(item)
+            for group, items in groups.items():
+                self._predict_batch(items, group)
+
+    def _predict_batch(self, batch, group):
+        """合并同一分组的请求，调用一次预测函数并把结果按行拆分给各个请求"""
+        try:
+            X = np.vstack([X for X, _, _ in batch]) if len(batch) > 1 else batch[0][0]
+            predictions = self.predict_fn(X) if group is None else self.predict_fn(X, group)
+            if predictions is None:
+                raise RuntimeError("预测失败")
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        # 按各请求的行数拆分结果
+        offset = 0
+        for X, future, _ in batch:
+            future.set_result(predictions[offset:offset + len(X)])
+            offset += len(X)
+
+        with self._stats_lock:
+            self.stats["requests"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["rows"] += offset
+            self.stats["max_batch_rows"] = max(self.stats["max_batch_rows"], offset)
+
+    def snapshot(self):
+        """获取批处理统计"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["mean_batch_rows"] = stats["rows"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def close(self):
+        """处理完已提交的请求后停止后台线程"""
+        self._queue.put(None)
+        self._thread.join()
+
+class PredictionService:
+    """预测服务：持有常驻模型、特征构建器、微批处理器和预测结果缓存"""
+
+    def __init__(self, models_dir="models", window_ms=5.0, max_batch_size=4096, cache=None, users=None):
+        """
+        参数:
+        models_dir: 保存模型的目录路径
+        window_ms: 微批处理的等待窗口（毫秒）
+        max_batch_size: 每批最多合并的行数
+        cache: PredictionCache实例，None表示不缓存
+        users: MultiUserRegistry实例，None表示不支持按用户预测
+        """
+        self.models = get_models(models_dir)
+        feature_names = self.models.get("feature_names")
+        if not feature_names:
+            raise ValueError("缺少特征名称文件，请先运行 save_feature_names.py")
+        # 缺失豆瓣评分的处理与app.prepare_features保持一致
+        self.vectorizer = get_vectorizer(feature_names, default_douban_score=DEFAULT_DOUBAN_SCORE)
+        self.batcher = MicroBatcher(self._predict, window_ms, max_batch_size)
+        self.cache = cache
+        self.users = users
+        # 按用户ID分组的微批处理器：同一用户在时间窗口内的请求合并为一次预测
+        self.user_batcher = MicroBatcher(self._predict_for_user, window_ms, max_batch_size) if users is not None else None
+
+    def _predict(self, X):
+        return predict_with_ensemble(X, self.models)
+
+    def _predict_for_user(self, X, user_id):
+        return self.users.predict(user_id, X)
+
+    def predict(self, movies, user_id=None):
+        """
+        预测一组影视作品的评分
+
+        参数:
+        movies: 影视作品字典列表
+        user_id: 用户ID，None表示使用默认模型
+
+        返回:
+        预测评分列表
+        """
+        if not movies:
+            return []
+        if user_id is not None:
+            return self._predict_user(movies, user_id)
+        X = self.vectorizer.transform(movies)
+        if self.cache is not None:
+            # 命中缓存的行直接返回，只有未命中的行进入微批处理
+            return [float(score) for score in self.cache.predict(X, self.models, self.batcher.predict)]
+        return [float(score) for score in self.batcher.predict(X)]
+
+    def _predict_user(self, movies, user_id):
+        """
+        使用用户自己的模型预测：经过按用户分组的微批处理；缓存键包含模型包版本，
+        与默认模型共用同一个预测结果缓存
+        """
+        if self.users is None:
+            raise ValueError("服务没有开启多用户模式（--multi-user）")
+        models = self.users.get_models(user_id)
+        vectorizer = get_vectorizer(models["feature_names"], default_douban_score=DEFAULT_DOUBAN_SCORE)
+        X = vectorizer.transform(movies)
+        predict_fn = lambda X_miss: self.user_batcher.predict(X_miss, group=user_id)
+        if self.cache is not None:
+            predictions = self.cache.predict(X, models, predict_fn)
+        else:
+            predictions = predict_fn(X)
+        if predictions is None:
+            raise RuntimeError("预测失败")
+        return [float(score) for score in predictions]
+
+    def snapshot(self):
+        """服务统计：批处理统计、缓存统计和多用户模型统计"""
+        stats = {"batching": self.batcher.snapshot()}
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        if self.users is not None:
+            stats["users"] = self.users.stats()
+            stats["user_batching"] = self.user_batcher.snapshot()
+        return stats
+
+    def close(self):
+        self.batcher.close()
+        if self.users is not None:
+            self.user_batcher.close()
+            self.users.close()
+        if self.cache is not None:
+            self.cache.close()
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """处理预测请求的HTTP处理器"""
+
+    service = None
+    verbose = False
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length).decode("utf-8"))
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", **self.service.snapshot()})
+        elif self.path == "/metrics":
+            body = instrumentation.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {"error": f"未知路径: {self.path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        path = url.path
+        if path not in ("/predict", "/predict/batch"):
+            self._send_json(404, {"error": f"未知路径: {self.path}"})
+            return
+        user_id = parse_qs(url.query).get("user", [None])[0]
+
+        try:
+            payload = self._read_json()
+        except (ValueError, UnicodeDecodeError) as e:
+            self._send_json(400, {"error": f"无效的JSON: {e}"})
+            return
+
+        if path == "/predict":
+            if not isinstance(payload, dict):
+                self._send_json(400, {"error": "请求体必须是影视作品对象"})
+                return
+            movies = [payload]
+        else:
+            movies = payload.get("movies") if isinstance(payload, dict) else payload
+            if not isinstance(movies, list) or not all(isinstance(m, dict) for m in movies):
+                self._send_json(400, {"error": "请求体必须是影视作品列表"})
+                return
+
+        try:
+            scores = self.service.predict(movies, user_id)
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except FileNotFoundError as e:
+            self._send_json(404, {"error": str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {"error": f"预测过程中出错: {e}"})
+            return
+
+        if path == "/predict":
+            self._send_json(200, {"predicted_score": scores[0]})
+        else:
+            self._send_json(200, {"predicted_scores": scores})
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+class PredictionServer(ThreadingHTTPServer):
+    """多线程HTTP服务器，加大连接队列以承受突发的并发请求"""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+def create_server(host="127.0.0.1", port=8000, models_dir="models", window_ms=5.0,
+                  max_batch_size=4096, verbose=False, cache=None, users=None):
+    """
+    创建预测服务（模型在创建时加载）
+
+    参数:
+    host: 监听地址
+    port: 监听端口（0表示随机端口）
+    models_dir: 保存模型的目录路径
+    window_ms: 微批处理的等待窗口（毫秒）
+    max_batch_size: 每批最多合并的行数
+    verbose: 是否输出访问日志
+    cache: PredictionCache实例，None表示不缓存
+    users: MultiUserRegistry实例，None表示不支持按用户预测
+
+    返回:
+    PredictionServer实例，其service属性为PredictionService
+    """
+    service = PredictionService(models_dir, window_ms, max_batch_size, cache, users)
+    handler = type("BoundPredictionHandler", (PredictionHandler,),
+                   {"service": service, "verbose": verbose})
+    server = PredictionServer((host, port), handler)
+    server.service = service
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="豆瓣评分预测HTTP服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8000, help="监听端口")
+    parser.add_argument("--models-dir", default="models", help="模型目录")
+    parser.add_argument("--window-ms", type=float, default=5.0, help="微批处理的等待窗口（毫秒）")
+    parser.add_argument("--max-batch-size", type=int, default=4096, help="每批最多合并的行数")
+    parser.add_argument("--verbose", action="store_true", help="输出访问日志")
+    parser.add_argument("--cache-size", type=int, default=100000, help="内存缓存的最大条目数，0表示不缓存")
+    parser.add_argument("--cache-ttl", type=float, default=None, help="缓存条目的存活时间（秒），默认不过期")
+    parser.add_argument("--cache-db", default=None, help="磁盘缓存文件（SQLite），默认只使用内存缓存")
+    parser.add_argument("--multi-user", action="store_true", help="支持?user=<用户ID>，使用models/users/<用户ID>/中的模型")
+    parser.add_argument("--memory-budget-mb", type=float, default=DEFAULT_MEMORY_BUDGET / 1024 / 1024,
+                        help="常驻内存的用户模型的内存预算（MB），超过时淘汰最久未使用的用户")
+    parser.add_argument("--loader-threads", type=int, default=DEFAULT_LOADER_THREADS, help="加载用户模型的后台线程数")
+    parser.add_argument("--instrument", action="store_true", help="开启分阶段计时，通过/metrics导出")
+    parser.add_argument("--log-level", default="WARNING", help="预测过程提示信息的日志级别（如INFO、WARNING）")
+    args = parser.parse_args()
+
+    configure_logging(args.log_level)
+    instrumentation.enabled = args.instrument
+
+    cache = PredictionCache(args.cache_size, args.cache_ttl, args.cache_db) if args.cache_size > 0 else None
+    users = None
+    if args.multi_user:
+        users = MultiUserRegistry(args.models_dir, int(args.memory_budget_mb * 1024 * 1024), args.loader_threads)
+    server = create_server(args.host, args.port, args.models_dir, args.window_ms,
+                           args.max_batch_size, args.verbose, cache, users)
+    print(f"预测服务已启动: http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n服务被用户中断")
+    finally:
+        server.server_close()
+        server.service.close()
+
+if __name__ == "__main__":
+    main()
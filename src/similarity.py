@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+相似作品检索
+根据cleaned_data.json中看过的作品建立倒排索引（类型、地区、导演、演员 -> 作品编号），
+对一部作品只累加它的标签对应的倒排表，按IDF加权的Jaccard相似度返回最相似的N部作品及其user_score。
+可以作为预测结果的解释（“你看过的相似作品”），也可以作为kNN特征（相似作品评分的加权平均）
+
+相似度: sim(q, d) = Σ w(t) / (W(q) + W(d) - Σ w(t))，求和范围是q和d共有的标签t，
+w(t) = 字段权重 × BM25形式的IDF，W(x)为x所有标签的权重之和
+
+用法:
+python src/similarity.py --title "肖申克的救赎"             查询数据中某部作品的相似作品
+python src/similarity.py --genre 科幻 --director 诺兰 -n 10
+python src/similarity.py --evaluate                         留一法评估kNN评分的平均绝对误差
+"""
+
+import argparse
+import ast
+import functools
+import json
+import math
+import os
+import sys
+import numpy as np
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 看过的作品
+DEFAULT_DATA_PATH = "data/cleaned_data.json"
+
+# 参与检索的字段及其权重：同一位导演比同一地区更能说明两部作品相似
+FIELD_WEIGHTS = {
+    "director": 3.0,
+    "cast": 2.0,
+    "genre": 1.0,
+    "region": 0.5,
+}
+
+def _tokens(value):
+    """把列表字段（列表或字符串形式的列表）转换为去重后的标签元组"""
+    if isinstance(value, str):
+        # 与features.parse_list一致，兼容字符串形式的列表（不导入numpy、pandas）
+        try:
+            value = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return ()
+    if not isinstance(value, (list, tuple, set)):
+        return ()
+    return tuple(dict.fromkeys(str(token).strip() for token in value if token is not None and str(token).strip()))
+
+class SimilarityIndex:
+    """
+    看过的作品的倒排索引
+    """
+
+    def __init__(self, records, field_weights=None):
+        """
+        参数:
+        records: 看过的作品字典列表（格式与cleaned_data.json相同）
+        field_weights: {字段: 权重}，None表示使用FIELD_WEIGHTS
+        """
+        self.field_weights = dict(FIELD_WEIGHTS if field_weights is None else field_weights)
+        self.records = list(records)
+        # 倒排表: {(字段, 标签): 作品编号数组}
+        postings = {}
+        # 标题 -> 作品编号，用于排除查询作品本身
+        self.title_ids = {}
+        for doc_id, record in enumerate(self.records):
+            self.title_ids.setdefault(record.get("title"), []).append(doc_id)
+            for field in self.field_weights:
+                for token in _tokens(record.get(field)):
+                    postings.setdefault((field, token), []).append(doc_id)
+        self.postings = {key: np.array(docs, dtype=np.int32) for key, docs in postings.items()}
+
+        # 标签权重 = 字段权重 × IDF（出现在越少作品中的标签权重越高）
+        n_docs = len(self.records)
+        self.weights = {
+            key: self.field_weights[key[0]] * math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for key, docs in self.postings.items()
+        }
+        self.doc_weights = np.array([self._total_weight(self._keys(record)) for record in self.records],
+                                    dtype=np.float64)
+
+    def __len__(self):
+        return len(self.records)
+
+    def _keys(self, movie):
+        """作品的(字段, 标签)集合"""
+        return {(field, token) for field in self.field_weights for token in _tokens(movie.get(field))}
+
+    def _total_weight(self, keys):
+        return sum(self.weights.get(key, 0.0) for key in keys)
+
+    def query(self, movie, n=5, exclude_titles=None, min_similarity=0.0):
+        """
+        查找最相似的看过的作品
+
+        参数:
+        movie: 作品字典（格式与get_user_input()或cleaned_data.json相同）
+        n: 返回的数量
+        exclude_titles: 需要排除的标题集合（如查询作品本身）
+        min_similarity: 相似度下限
+
+        返回:
+        按相似度从高到低排列的列表，每一项为字典，包含title、user_score、douban_score、
+        similarity和shared（{字段: 共同的标签列表}）
+        """
+        keys = self._keys(movie)
+        # 只累加查询作品的标签对应的倒排表，耗时与命中的倒排表长度有关，与看过的作品总数无关
+        touched = []
+        weights = []
+        for key in keys:
+            docs = self.postings.get(key)
+            if docs is None:
+                continue
+            touched.append(docs)
+            weights.append(np.full(len(docs), self.weights[key]))
+        if not touched:
+            return []
+
+        # 命中的作品编号去重后，按编号在候选列表中的位置累加共同标签的权重
+        candidates, position = np.unique(np.concatenate(touched), return_inverse=True)
+        common = np.bincount(position, weights=np.concatenate(weights), minlength=len(candidates))
+        similarity = common / (self._total_weight(keys) + self.doc_weights[candidates] - common)
+        excluded = [doc_id for title in (exclude_titles or ()) for doc_id in self.title_ids.get(title, ())]
+        if excluded:
+            keep = ~np.isin(candidates, excluded)
+            candidates, similarity = candidates[keep], similarity[keep]
+        keep = similarity > min_similarity
+        candidates, similarity = candidates[keep], similarity[keep]
+
+        # 部分排序取前n名，相似度相同时编号小的优先：argpartition在第n名的边界上任取相同的相似度，
+        # 所以先取严格大于第n名的候选，再按编号（candidates已排序）补上与第n名相同的候选
+        if n < len(similarity):
+            if n > 0:
+                kth = -np.partition(-similarity, n - 1)[n - 1]
+                above = np.flatnonzero(similarity > kth)
+                ties = np.flatnonzero(similarity == kth)[:n - len(above)]
+                top = np.concatenate([above, ties])
+            else:
+                top = np.empty(0, dtype=np.intp)
+            candidates, similarity = candidates[top], similarity[top]
+        order = np.lexsort((candidates, -similarity))
+
+        results = []
+        for doc_id, score in zip(candidates[order], similarity[order]):
+            record = self.records[doc_id]
+            shared = {}
+            for field in self.field_weights:
+                tokens = [token for token in _tokens(record.get(field)) if (field, token) in keys]
+                if tokens:
+                    shared[field] = tokens
+            results.append({
+                "title": record.get("title"),
+                "user_score": record.get("user_score"),
+                "douban_score": record.get("douban_score"),
+                "similarity": float(score),
+                "shared": shared,
+            })
+        return results
+
+    def knn_score(self, movie, n=10, exclude_titles=None):
+        """
+        kNN评分：最相似的n部作品的user_score按相似度加权平均
+
+        参数:
+        movie: 作品字典
+        n: 参与平均的作品数
+        exclude_titles: 需要排除的标题集合
+
+        返回:
+        加权平均评分，没有相似作品时返回None
+        """
+        total = 0.0
+        weight = 0.0
+        for item in self.query(movie, n, exclude_titles):
+            if item["user_score"] is None:
+                continue
+            total += item["similarity"] * float(item["user_score"])
+            weight += item["similarity"]
+        return total / weight if weight > 0 else None
+
+def load_records(path=DEFAULT_DATA_PATH):
+    """读取看过的作品"""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+@functools.lru_cache(maxsize=4)
+def _cached_index(path, mtime):
+    return SimilarityIndex(load_records(path))
+
+def get_similarity_index(path=DEFAULT_DATA_PATH):
+    """
+    获取相似作品索引，同一个数据文件在进程内只建立一次（文件更新后重新建立）
+
+    参数:
+    path: 看过的作品的数据文件
+
+    返回:
+    SimilarityIndex实例
+    """
+    path = os.path.abspath(path)
+    return _cached_index(path, os.path.getmtime(path))
+
+def evaluate(index, n=10):
+    """
+    留一法评估：每部作品用其余作品的kNN评分预测user_score
+
+    返回:
+    字典，包含knn_mae、mean_mae（用平均评分预测的误差）、covered（有相似作品的数量）和total
+    """
+    scores = [float(r["user_score"]) for r in index.records if r.get("user_score") is not None]
+    mean_score = sum(scores) / len(scores)
+    knn_errors = []
+    mean_errors = []
+    for record in index.records:
+        if record.get("user_score") is None:
+            continue
+        knn = index.knn_score(record, n, exclude_titles={record.get("title")})
+        if knn is None:
+            continue
+        knn_errors.append(abs(knn - float(record["user_score"])))
+        mean_errors.append(abs(mean_score - float(record["user_score"])))
+    return {
+        "knn_mae": sum(knn_errors) / len(knn_errors) if knn_errors else float("nan"),
+        "mean_mae": sum(mean_errors) / len(mean_errors) if mean_errors else float("nan"),
+        "covered": len(knn_errors),
+        "total": len(scores),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="查找看过的作品中最相似的作品")
+    parser.add_argument("--data", default=DEFAULT_DATA_PATH, help="看过的作品的数据文件")
+    parser.add_argument("--title", help="数据中某部作品的标题")
+    for field in FIELD_WEIGHTS:
+        parser.add_argument(f"--{field}", action="append", default=[], help=f"{field}标签（可重复）")
+    parser.add_argument("-n", type=int, default=5, help="返回的数量")
+    parser.add_argument("--evaluate", action="store_true", help="留一法评估kNN评分")
+    args = parser.parse_args()
+
+    index = get_similarity_index(args.data)
+    print(f"索引: {len(index)} 部作品，{len(index.postings)} 个标签")
+
+    if args.evaluate:
+        result = evaluate(index, args.n)
+        print(f"kNN评分（k={args.n}）平均绝对误差: {result['knn_mae']:.3f}，"
+              f"平均评分的平均绝对误差: {result['mean_mae']:.3f}（覆盖 {result['covered']}/{result['total']} 部）")
+        return
+
+    if args.title:
+        matches = [r for r in index.records if r.get("title") == args.title]
+        if not matches:
+            print(f"数据中没有标题为 {args.title} 的作品")
+            return
+        movie = matches[0]
+        exclude = {args.title}
+    else:
+        movie = {field: getattr(args, field) for field in FIELD_WEIGHTS}
+        exclude = None
+
+    for item in index.query(movie, args.n, exclude):
+        shared = "; ".join(f"{field}: {'/'.join(tokens)}" for field, tokens in item["shared"].items())
+        print(f"{item['similarity']:.3f}  {item['title']}  你的评分 {item['user_score']}  ({shared})")
+    knn = index.knn_score(movie, exclude_titles=exclude)
+    if knn is not None:
+        print(f"kNN评分: {knn:.2f}")
+
+if __name__ == "__main__":
+    main()
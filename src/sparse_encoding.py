@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+稀疏特征上的Ridge
+把基础数值特征和地区、类型、导演、演员的多标签编码拼接为scipy.sparse CSR矩阵，
+导演和演员的词表再大，内存也只与非零元素数量成正比:
+- 训练: 直接读取列式存储（data/onehot_encoded/）中按CSR保存的多标签矩阵，不展开为稠密列；
+  数值特征的缺失值用训练集均值填充，不需要对整个矩阵使用imputer
+- 保存: 作为模型包成员sparse_ridge保存（python src/save_models.py --sparse，默认不训练）
+- 预测: SparseRidge.transform()把影视作品转换为CSR矩阵，predict_with_ensemble()遇到稀疏矩阵时
+  使用sparse_ridge成员；训练时没有出现过的导演、演员等类别被忽略
+
+用法:
+python src/sparse_encoding.py    在save_models.py的训练集上训练，显示测试集误差和特征矩阵的内存占用
+"""
+
+import argparse
+import os
+import sys
+import numpy as np
+import scipy.sparse as sp
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.columnar_store import DEFAULT_STORE_PATH, EncodedStore
+from src.features import BASIC_FEATURES, FeatureVectorizer
+
+# 多标签字段（按该顺序排列在数值特征之后）
+MULTIHOT_FIELDS = ("region", "genre", "director", "cast")
+
+# 模型包中的成员名称
+MEMBER_NAME = "sparse_ridge"
+
+def _remap(matrix, columns, width):
+    """
+    把多标签矩阵的列号映射到模型词表中的列号，映射为-1的类别被丢弃，同一行内重复的类别只记一次
+
+    参数:
+    matrix: CSR矩阵
+    columns: 原列号到新列号的数组
+    width: 新的列数
+
+    返回:
+    float64的CSR矩阵，取值为0/1
+    """
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    cols = columns[matrix.indices]
+    known = cols >= 0
+    result = sp.csr_matrix((np.ones(int(known.sum()), dtype=np.float64), (rows[known], cols[known])),
+                           shape=(matrix.shape[0], width))
+    result.sum_duplicates()
+    result.data[:] = 1.0
+    return result
+
+class SparseRidge:
+    """
+    在稀疏特征矩阵上训练的Ridge（数值列在前，多标签列按MULTIHOT_FIELDS依次排列）
+    """
+
+    def __init__(self, numeric_features=BASIC_FEATURES, fields=MULTIHOT_FIELDS):
+        """
+        参数:
+        numeric_features: 数值特征（计算方式与FeatureVectorizer相同）
+        fields: 多标签字段
+        """
+        self.numeric_features = list(numeric_features)
+        self.fields = tuple(fields)
+        self.vocab = {field: {} for field in self.fields}
+        self.fill_values = None
+        self.ridge = None
+
+    @property
+    def n_features(self):
+        """特征矩阵的列数"""
+        return len(self.numeric_features) + sum(len(self.vocab[field]) for field in self.fields)
+
+    def feature_names(self):
+        """特征矩阵的列名（如douban_score、director_张艺谋）"""
+        names = list(self.numeric_features)
+        for field in self.fields:
+            vocab = self.vocab[field]
+            names.extend(f"{field}_{token}" for token in sorted(vocab, key=vocab.get))
+        return names
+
+    def _stack(self, numeric, blocks):
+        """填充数值列的缺失值，与多标签矩阵拼接为CSR矩阵"""
+        numeric = np.asarray(numeric, dtype=np.float64)
+        if self.fill_values is not None:
+            numeric = np.where(np.isnan(numeric), self.fill_values, numeric)
+        return sp.hstack([sp.csr_matrix(numeric)] + list(blocks), format="csr", dtype=np.float64)
+
+    def transform(self, records):
+        """
+        把影视作品转换为稀疏特征矩阵
+
+        参数:
+        records: 影视作品字典的列表（格式与get_user_input()或cleaned_data.json相同）
+
+        返回:
+        形状为(记录数, n_features)的CSR矩阵
+        """
+        if isinstance(records, dict):
+            records = [records]
+        elif not isinstance(records, list):
+            records = list(records)
+        numeric = FeatureVectorizer(self.numeric_features).transform(records)
+        blocks = []
+        for field in self.fields:
+            vocab = self.vocab[field]
+            rows = []
+            cols = []
+            for row, record in enumerate(records):
+                hits = {vocab[token] for token in FeatureVectorizer._tokens(record, field) if token in vocab}
+                rows.extend([row] * len(hits))
+                cols.extend(hits)
+            blocks.append(sp.csr_matrix((np.ones(len(cols), dtype=np.float64), (rows, cols)),
+                                        shape=(len(records), len(vocab))))
+        return self._stack(numeric, blocks)
+
+    def _encode_store(self, store, rows=None):
+        """
+        直接用列式存储的数组构建数值列和各字段的多标签矩阵（按模型词表映射列号）
+
+        返回:
+        (数值矩阵, 多标签CSR矩阵列表) 元组，rows指定时只包含这些行（按rows的顺序）
+        """
+        vectorizer = FeatureVectorizer(self.numeric_features)
+        columns = {}
+        for field in self.fields:
+            vocab = self.vocab[field]
+            columns[field] = np.array([vocab.get(token, -1) for token in store.vocab(field)], dtype=np.intp)
+        numeric_parts = []
+        block_parts = {field: [] for field in self.fields}
+        for data in store.iter_chunks():
+            multihot = {field: (data[field], store.vocab(field)) for field in store.schema["multihot"]}
+            watch_time = np.asarray(data["watch_time"]).astype("datetime64[ms]")
+            numeric_parts.append(vectorizer.transform_encoded(np.asarray(data["numeric"]), store.numeric_columns,
+                                                              watch_time, data["title"], multihot))
+            for field in self.fields:
+                block_parts[field].append(_remap(data[field], columns[field], len(self.vocab[field])))
+        numeric = (np.vstack(numeric_parts) if numeric_parts
+                   else np.empty((0, len(self.numeric_features)), dtype=np.float64))
+        blocks = [sp.vstack(block_parts[field], format="csr") if block_parts[field]
+                  else sp.csr_matrix((0, len(self.vocab[field]))) for field in self.fields]
+        if rows is not None:
+            rows = np.asarray(rows, dtype=np.intp)
+            numeric = numeric[rows]
+            blocks = [block[rows] for block in blocks]
+        return numeric, blocks
+
+    def transform_store(self, store, rows=None):
+        """
+        把列式存储中的记录转换为稀疏特征矩阵（结果与transform(store.iter_records())一致）
+
+        参数:
+        store: EncodedStore实例
+        rows: 行号（如折存储的train_index、test_index），None表示全部行
+
+        返回:
+        CSR矩阵
+        """
+        return self._stack(*self._encode_store(store, rows))
+
+    def fit_store(self, store, rows, y, params=None):
+        """
+        在列式存储的指定行上训练（词表只包含这些行中出现过的类别）
+
+        参数:
+        store: EncodedStore实例
+        rows: 训练集的行号
+        y: 对应的用户评分
+        params: Ridge的参数（如load_best_params()["ridge"]），None表示默认参数
+        """
+        from src.train import make_estimator
+
+        self.vocab = {field: {token: i for i, token in enumerate(store.vocab(field))} for field in self.fields}
+        self.fill_values = None
+        numeric, blocks = self._encode_store(store, rows)
+        for i, field in enumerate(self.fields):
+            used = np.flatnonzero(blocks[i].getnnz(axis=0))
+            tokens = store.vocab(field)
+            self.vocab[field] = {tokens[j]: k for k, j in enumerate(used)}
+            blocks[i] = blocks[i][:, used]
+        with np.errstate(invalid="ignore"):
+            self.fill_values = np.nan_to_num(np.nanmean(numeric, axis=0)) if len(numeric) else None
+        X = self._stack(numeric, blocks)
+        self.ridge = make_estimator("ridge", params or {})
+        self.ridge.fit(X, np.asarray(y, dtype=np.float64))
+        return self
+
+    def predict(self, X):
+        """
+        预测评分
+
+        参数:
+        X: transform()或transform_store()生成的CSR矩阵，或影视作品字典的列表
+
+        返回:
+        预测值数组
+        """
+        if self.ridge is None:
+            raise ValueError("模型尚未训练")
+        if not sp.issparse(X):
+            X = self.transform(X)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"特征矩阵有 {X.shape[1]} 列，模型使用 {self.n_features} 列训练")
+        return self.ridge.predict(X.tocsr())
+
+def open_training_store(store_path=DEFAULT_STORE_PATH):
+    """
+    打开稀疏训练使用的列式存储（行号与折存储的train_index、test_index一致）
+
+    异常:
+    FileNotFoundError: 列式存储不存在
+    """
+    if not os.path.exists(os.path.join(store_path, "schema.json")):
+        raise FileNotFoundError(f"稀疏训练需要列式存储 {store_path}，请先运行 python src/columnar_store.py")
+    return EncodedStore(store_path)
+
+def train_sparse_ridge(fold_store, params=None, store_path=DEFAULT_STORE_PATH):
+    """
+    在save_models.py的训练集上训练SparseRidge，并在测试集上评估
+
+    参数:
+    fold_store: open_fold_store()返回的折存储（提供训练集和测试集的行号和标签）
+    params: Ridge的参数
+    store_path: 列式存储目录
+
+    返回:
+    (SparseRidge, 测试集指标字典) 元组，指标包含mae、rmse和r2
+    """
+    from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+
+    store = open_training_store(store_path)
+    model = SparseRidge().fit_store(store, fold_store.array("train_index"), fold_store.array("y_train"), params)
+    y_test = np.asarray(fold_store.array("y_test"), dtype=np.float64)
+    pred = model.predict(model.transform_store(store, fold_store.array("test_index")))
+    metrics = {
+        "mae": float(mean_absolute_error(y_test, pred)),
+        "rmse": float(np.sqrt(mean_squared_error(y_test, pred))),
+        "r2": float(r2_score(y_test, pred)),
+    }
+    return model, metrics
+
+def main():
+    parser = argparse.ArgumentParser(description="在稀疏特征上训练Ridge并评估")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="列式存储目录")
+    parser.add_argument("--models-dir", default="models", help="模型目录（读取搜索得到的参数）")
+    args = parser.parse_args()
+
+    from src.fold_store import open_fold_store
+    from src.train import DEFAULT_PARAMS_PATH, load_best_params
+
+    params = load_best_params(os.path.join(args.models_dir, os.path.basename(DEFAULT_PARAMS_PATH)))
+    fold_store = open_fold_store(test_size=0.2, random_state=42)
+    model, metrics = train_sparse_ridge(fold_store, params["ridge"], args.store)
+
+    X = model.transform_store(open_training_store(args.store))
+    sparse_bytes = X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+    dense_bytes = X.shape[0] * X.shape[1] * 8
+    print(f"特征数量: {model.n_features}（其中导演 {len(model.vocab['director'])} 个，演员 {len(model.vocab['cast'])} 个）")
+    print(f"特征矩阵: {X.shape[0]} 行，非零元素 {X.nnz} 个")
+    print(f"内存占用: 稀疏 {sparse_bytes / 1024:.1f} KB，稠密 {dense_bytes / 1024:.1f} KB")
+    print(f"测试集 MAE: {metrics['mae']:.3f}，RMSE: {metrics['rmse']:.3f}，R²: {metrics['r2']:.3f}")
+
+if __name__ == "__main__":
+    main()
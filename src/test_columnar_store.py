@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试列式存储
+检查列式存储还原的DataFrame与pd.read_json(onehot_encoded_data.json)的结果一致，
+包括重新写入、分块追加之后的读取
+
+用法:
+python -m pytest src/test_columnar_store.py
+"""
+
+import os
+import sys
+import pandas as pd
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.columnar_store import (DEFAULT_JSON_PATH, DEFAULT_STORE_PATH, EncodedStore, append_store,
+                                compact_onehot, load_encoded_frame, write_store)
+
+def read_json_frame():
+    """直接读取JSON（与没有列式存储时load_encoded_frame()的结果相同）"""
+    return compact_onehot(pd.read_json(DEFAULT_JSON_PATH, orient="records", encoding="utf-8"))
+
+def assert_same_frame(actual, expected):
+    assert list(actual.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(actual, expected)
+
+def test_store_matches_json(tmp_path):
+    expected = read_json_frame()
+    if os.path.exists(os.path.join(DEFAULT_STORE_PATH, "schema.json")):
+        assert_same_frame(load_encoded_frame(), expected)
+    # 没有列式存储时读取JSON
+    assert_same_frame(load_encoded_frame(store_path=str(tmp_path / "missing")), expected)
+
+def test_write_round_trip(tmp_path):
+    frame = pd.read_json(DEFAULT_JSON_PATH, orient="records", encoding="utf-8")
+    store = write_store(frame, str(tmp_path / "store"))
+    assert store.n_rows == len(frame)
+    assert store.column_names() == list(frame.columns)
+    assert_same_frame(store.to_frame(), compact_onehot(frame.copy()))
+
+def test_append_round_trip(tmp_path):
+    frame = pd.read_json(DEFAULT_JSON_PATH, orient="records", encoding="utf-8")
+    half = len(frame) // 2
+    path = str(tmp_path / "store")
+    write_store(frame.iloc[:half].reset_index(drop=True), path)
+    store = append_store(frame.iloc[half:].reset_index(drop=True), path)
+    assert len(store.schema["chunks"]) == 2
+    assert store.n_rows == len(frame)
+    # 追加后词表可能变长，按列名比较内容
+    restored = EncodedStore(path).to_frame()
+    expected = compact_onehot(frame.copy())
+    assert set(restored.columns) == set(expected.columns)
+    assert_same_frame(restored[list(expected.columns)], expected)
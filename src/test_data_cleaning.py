@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试简介解析
+检查向量化的parse_summaries()与逐行调用parse_summary()（列表字段再经过list_or_nan()）的结果一致，
+包括EDGE_CASE_SUMMARIES中的缺失、段数不足、多余的"/"、空段和全角空格
+
+用法:
+python -m pytest src/test_data_cleaning.py
+"""
+
+import os
+import sys
+import pandas as pd
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.data_cleaning import (EDGE_CASE_SUMMARIES, LIST_FIELDS, SUMMARY_FIELDS, clean_frame,
+                               clean_frame_rowwise, list_or_nan, make_synthetic_export, parse_summaries,
+                               parse_summary)
+
+def _normalize(value):
+    """缺失值统一为None，便于比较"""
+    if isinstance(value, list):
+        return value
+    return None if value is None or value != value else value
+
+def test_edge_cases_match_rowwise():
+    actual = parse_summaries(pd.Series(EDGE_CASE_SUMMARIES, dtype=object))
+    assert list(actual.columns) == SUMMARY_FIELDS
+    for i, summary in enumerate(EDGE_CASE_SUMMARIES):
+        expected = parse_summary(summary)
+        for field in SUMMARY_FIELDS:
+            value = list_or_nan(expected[field]) if field in LIST_FIELDS else expected[field]
+            assert _normalize(actual.loc[i, field]) == _normalize(value), f"简介{summary!r}的{field}不一致"
+
+def test_clean_frame_matches_rowwise():
+    # 用一条普通简介和EDGE_CASE_SUMMARIES生成数据，不读取data/raw.xlsx
+    df = make_synthetic_export(2000, base=pd.DataFrame({"summary": ["2010 / 美国 英国 / 剧情 / 导演 / 演员甲 演员乙"]}))
+    expected = clean_frame_rowwise(df)
+    actual = clean_frame(df)
+    assert list(actual.columns) == list(expected.columns)
+    assert (actual.to_json(orient="records", force_ascii=False, date_format="iso") ==
+            expected.to_json(orient="records", force_ascii=False, date_format="iso"))
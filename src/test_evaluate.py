@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试流式评估
+检查直接用列式存储数组构建的特征与逐条记录构建的特征一致（包括缺失的观看时间和豆瓣评分），
+以及默认只评估save_models.py划分的测试集
+
+用法:
+python -m pytest src/test_evaluate.py
+"""
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.columnar_store import DEFAULT_JSON_PATH, write_store
+from src.evaluate import evaluate_dataset, holdout_rows, iter_labeled, iter_store_batches
+from src.features import get_vectorizer
+from src.load_models import load_models
+
+@pytest.mark.parametrize("default_douban_score", [None, 7.5])
+def test_store_batches_match_records(tmp_path, default_douban_score):
+    frame = pd.read_json(DEFAULT_JSON_PATH, orient="records", encoding="utf-8")
+    # 加入缺失的观看时间、豆瓣评分和评分，以及1970年之前的观看时间
+    frame.loc[0, "watch_time"] = pd.NaT
+    frame.loc[1, "douban_score"] = np.nan
+    frame.loc[2, "user_score"] = np.nan
+    frame.loc[3, "watch_time"] = pd.Timestamp("1969-11-30 12:00:00")
+    store = write_store(frame, str(tmp_path / "store"))
+
+    vectorizer = get_vectorizer(load_models()["feature_names"], default_douban_score=default_douban_score)
+    expected = vectorizer.transform(list(iter_labeled(store.iter_records())))
+    batches = list(iter_store_batches(store, vectorizer, chunk_size=50))
+    assert np.array_equal(np.vstack([X for X, _ in batches]), expected, equal_nan=True)
+    labels = np.concatenate([y for _, y in batches])
+    assert len(labels) == len(frame) - 1 and not np.isnan(labels).any()
+
+    rows = np.array([0, 5, 7, len(frame) - 1])
+    X = np.vstack([X for X, _ in iter_store_batches(store, vectorizer, rows)])
+    assert np.array_equal(X, vectorizer.transform([store.to_frame().iloc[i].to_dict() for i in rows]),
+                          equal_nan=True)
+
+def test_default_split_is_holdout():
+    rows = holdout_rows()
+    holdout = evaluate_dataset()
+    assert holdout["split"] == "holdout"
+    assert holdout["rows"] == len(rows)
+    assert evaluate_dataset("full")["rows"] > holdout["rows"]
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试特征构建
+检查parse_watch_time()的快速路径与pd.to_datetime的解析结果一致，不符合"YYYY-MM"格式的字符串不走快速路径
+
+用法:
+python -m pytest src/test_features.py
+"""
+
+import os
+import sys
+import pandas as pd
+import pytest
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.features import parse_watch_time
+
+@pytest.mark.parametrize("value", ["2025-05-16 13:26:29", "2024-12-31", "2024-07", "2024-01-01T08:00:00",
+                                   "20240101", "20241001", "2024/10/01", "2024-1-05", "2024-13-01", "", "abc"])
+def test_parse_watch_time_matches_pandas(value):
+    parsed = pd.to_datetime(value, errors="coerce")
+    year, quarter = parse_watch_time(value)
+    if parsed is pd.NaT:
+        assert year != year and quarter != quarter
+    else:
+        assert (year, quarter) == (parsed.year, parsed.quarter)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试融合模型
+用模型包中的成员检查FusedEnsemble与原始流程（imputer填充后分别预测再取平均）一致，
+包括含缺失值的行，以及小批量（扁平化遍历）和大批量（sklearn预测填充后的矩阵）两条路径
+
+用法:
+python -m pytest src/test_fuse.py
+"""
+
+import os
+import sys
+import numpy as np
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.fuse import MEMBER_ORDER, fuse_models
+from src.load_models import load_models
+from src.test_tree_export import TOLERANCE, make_inputs
+from src.tree_export import FLAT_TREE_MAX_ROWS
+
+def test_fused_members_match_sklearn():
+    models = load_models()
+    fused = fuse_models(models)
+    dense, with_nan = make_inputs(models)
+    assert len(with_nan) > FLAT_TREE_MAX_ROWS
+    for batch_size in (1, 100, len(with_nan)):
+        predictions = fused.predict_members(with_nan[:batch_size])
+        assert list(predictions) == [name for name in MEMBER_ORDER if name in models]
+        for name, pred in predictions.items():
+            diff = np.max(np.abs(pred - models[name].predict(dense[:batch_size])))
+            assert diff <= TOLERANCE, f"{name} 批大小{batch_size}的最大误差为{diff}"
+
+def test_fused_ensemble_matches_average():
+    models = load_models()
+    fused = fuse_models(models)
+    dense, with_nan = make_inputs(models)
+    expected = np.mean([models[name].predict(dense) for name in MEMBER_ORDER if name in models], axis=0)
+    assert np.max(np.abs(fused.predict(with_nan) - expected)) <= TOLERANCE
+    # 输入中没有缺失值时结果相同
+    assert np.max(np.abs(fused.predict(dense) - expected)) <= TOLERANCE
+
+def test_parallel_fuses_once():
+    from src.parallel_predict import ExecutionConfig, predict_parallel
+
+    models = load_models()
+    assert "fused" not in models
+    dense, with_nan = make_inputs(models)
+    expected = np.mean([models[name].predict(dense) for name in MEMBER_ORDER if name in models], axis=0)
+    config = ExecutionConfig(threads=2, min_rows_threads=1)
+    assert np.max(np.abs(predict_parallel(with_nan, models, config) - expected)) <= TOLERANCE
+    fused = models["fused"]
+    # 第二次调用复用同一个融合模型
+    assert np.max(np.abs(predict_parallel(with_nan, models, config) - expected)) <= TOLERANCE
+    assert models["fused"] is fused
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试启动耗时
+用python -X importtime检查启动脚本和交互程序导入了哪些模块：显示菜单之前不能导入numpy、pandas、
+sklearn、joblib等重量级模块（只检查导入的模块，不检查耗时，结果不受机器负载影响）
+
+用法:
+python -m pytest src/test_import_time.py
+python src/test_import_time.py    打印导入耗时最多的模块
+"""
+
+import os
+import subprocess
+import sys
+
+# 项目根目录
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 显示菜单之前不允许导入的模块（由后台线程加载）
+HEAVY_MODULES = ("numpy", "pandas", "scipy", "sklearn", "joblib")
+
+def measure_import(module):
+    """
+    在新的解释器中导入模块，并解析-X importtime的输出
+
+    参数:
+    module: 模块名称（如src.app）
+
+    返回:
+    字典，键为被导入的模块名称，值为(自身耗时, 累计耗时)，单位为微秒
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=PROJECT_ROOT, capture_output=True, text=True, check=True)
+    timings = {}
+    for line in result.stderr.splitlines():
+        # 格式: "import time:   self [us] |  cumulative | imported package"
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        timings[name] = (int(parts[0]), int(parts[1]))
+    return timings
+
+def heavy_imports(timings):
+    """导入的模块中属于HEAVY_MODULES（或其子模块）的部分"""
+    return sorted(name for name in timings if name.split(".")[0] in HEAVY_MODULES)
+
+def check_module(module):
+    timings = measure_import(module)
+    heavy = heavy_imports(timings)
+    assert module in timings, f"-X importtime的输出中没有{module}"
+    assert not heavy, f"导入{module}时加载了重量级模块: {heavy[:5]}"
+
+def test_app_imports():
+    """交互程序在显示菜单之前只导入轻量模块"""
+    check_module("src.app")
+
+def test_run_app_imports():
+    """启动脚本在显示菜单之前只导入轻量模块"""
+    check_module("run_app")
+
+if __name__ == "__main__":
+    for module in ("run_app", "src.app"):
+        timings = measure_import(module)
+        print(f"{module}: 累计 {timings[module][1] / 1000:.1f}ms")
+        slowest = sorted(timings.items(), key=lambda item: item[1][0], reverse=True)[:5]
+        for name, (self_us, cumulative_us) in slowest:
+            print(f"  {name:<30}自身 {self_us / 1000:>7.1f}ms  累计 {cumulative_us / 1000:>7.1f}ms")
+        heavy = heavy_imports(timings)
+        if heavy:
+            print(f"  重量级模块: {', '.join(heavy[:5])}")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试增量训练
+在临时目录中复制列式存储和模型包，追加新的评分记录后检查：增量更新替换随机森林的树并生成新的模型包版本，
+没有新记录时不更新，新记录少于min_error_rows条时不因误差回退为完整重新训练，达到该数量后回退
+
+用法:
+python -m pytest src/test_incremental.py
+"""
+
+import os
+import shutil
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.columnar_store import DEFAULT_STORE_PATH, EncodedStore, append_store
+from src.incremental import IncrementalTrainer
+from src.model_bundle import ModelBundle, find_bundle
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """只包含列式存储、模型包和参数文件的工作目录（折存储在其中重新构建）"""
+    shutil.copytree(os.path.join(ROOT, DEFAULT_STORE_PATH), tmp_path / DEFAULT_STORE_PATH)
+    os.makedirs(tmp_path / "models")
+    for name in ("ensemble.bundle", "best_params.json"):
+        shutil.copy(os.path.join(ROOT, "models", name), tmp_path / "models" / name)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def append_rows(n, offset, user_score=None):
+    """把已有的前n条记录改名后作为新的评分记录追加（观看时间晚于所有已有记录）"""
+    frame = EncodedStore().to_frame()
+    rows = frame.iloc[:n].copy()
+    rows["title"] = [f"新记录{offset + i}" for i in range(n)]
+    rows["watch_time"] = frame["watch_time"].max() + pd.Timedelta(days=1 + offset)
+    if user_score is not None:
+        rows["user_score"] = user_score
+    append_store(rows)
+
+def trainer():
+    # 不检查特征漂移，只检查误差
+    return IncrementalTrainer("models", "models/incremental_state.joblib", drift_threshold=np.inf)
+
+def test_incremental_update(workdir):
+    trainer().initialize()
+    version = ModelBundle(find_bundle("models")).version
+    assert trainer().update()["mode"] == "noop"
+
+    append_rows(30, 0)
+    report = trainer().update()
+    assert report["mode"] == "incremental" and report["new_rows"] == 30
+    assert report["trees_replaced"] >= 1
+    bundle = ModelBundle(find_bundle("models"))
+    assert report["version"] == bundle.version != version
+    assert len(bundle.load("rf").estimators_) == 200
+    assert bundle.metrics["incremental_rows"] == 30
+
+    # 已处理的记录不会再次加入
+    assert trainer().update()["mode"] == "noop"
+
+def test_error_check_needs_min_rows(workdir):
+    trainer().initialize()
+
+    # 少量误差很大的记录：不足min_error_rows条，只做增量更新
+    append_rows(5, 0, user_score=1.0)
+    report = trainer().update()
+    assert report["new_mae"] > report["baseline_mae"] * 1.25
+    assert report["mode"] == "incremental"
+
+    append_rows(25, 10, user_score=1.0)
+    report = trainer().update()
+    assert report["mode"] == "full"
+    assert report["reason"] == "新数据上的误差超过阈值"
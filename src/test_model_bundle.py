@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试模型包
+检查重新写入的模型包与原模型的预测一致、内存映射模式下数组区被映射，
+以及成员区或数组区被修改、文件头无效时拒绝加载
+
+用法:
+python -m pytest src/test_model_bundle.py
+"""
+
+import os
+import sys
+import numpy as np
+import pytest
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.model_bundle import DEFAULT_BUNDLE_PATH, ModelBundle, write_bundle
+from src.model_registry import ModelRegistry
+from src.test_tree_export import make_inputs
+
+def copy_bundle(path):
+    """把默认模型包的成员重新写入path，返回原模型包"""
+    source = ModelBundle(DEFAULT_BUNDLE_PATH)
+    members = {name: source.load(name) for name in source.member_names}
+    write_bundle(path, members, source.feature_names, source.feature_schema, source.metrics, source.params)
+    return source
+
+def corrupt(path, position):
+    """把文件中某个位置的字节取反"""
+    with open(path, "r+b") as f:
+        f.seek(position)
+        value = f.read(1)
+        f.seek(position)
+        f.write(bytes([value[0] ^ 0xFF]))
+
+@pytest.mark.parametrize("mmap_mode", [None, "r"])
+def test_round_trip(tmp_path, mmap_mode):
+    path = str(tmp_path / "ensemble.bundle")
+    source = copy_bundle(path)
+    bundle = ModelBundle(path, mmap_mode)
+    dense, _ = make_inputs(source.models(), n_rows=500)
+    for name in ("ridge", "dt", "rf"):
+        assert np.array_equal(bundle.load(name).predict(dense), source.load(name).predict(dense))
+
+def test_mmap_mode_maps_arrays(tmp_path):
+    models_dir = str(tmp_path)
+    copy_bundle(os.path.join(models_dir, "ensemble.bundle"))
+    stats = ModelRegistry(models_dir, "r", flatten_trees=False).stats()
+    assert stats["imputer"]["mapped_bytes"] > 0
+    assert stats["ridge"]["mapped_bytes"] > 0
+    assert all(info["mapped_bytes"] == 0 for info in ModelRegistry(models_dir, flatten_trees=False).stats().values())
+
+@pytest.mark.parametrize("mmap_mode", [None, "r"])
+def test_rejects_modified_sections(tmp_path, mmap_mode):
+    path = str(tmp_path / "ensemble.bundle")
+    copy_bundle(path)
+    bundle = ModelBundle(path)
+    ridge = bundle.member_info("ridge")
+    assert ridge["buffers"], "Ridge的系数应保存在数组区"
+    corrupt(path, bundle._data_offset + ridge["offset"] + ridge["length"] // 2)
+    corrupt(path, bundle._data_offset + ridge["buffers"][0]["offset"])
+
+    bundle = ModelBundle(path, mmap_mode)
+    with pytest.raises(ValueError):
+        bundle.load("ridge")
+    # 其他成员不受影响
+    bundle.load("imputer")
+
+    # 恢复序列化数据（再取反一次），只有数组区被修改时同样拒绝加载
+    corrupt(path, bundle._data_offset + ridge["offset"] + ridge["length"] // 2)
+    with pytest.raises(ValueError):
+        ModelBundle(path, mmap_mode).load("ridge")
+
+def test_rejects_invalid_header(tmp_path):
+    path = str(tmp_path / "ensemble.bundle")
+    copy_bundle(path)
+    corrupt(path, 0)
+    with pytest.raises(ValueError):
+        ModelBundle(path)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试多用户模型托管
+检查超过内存预算时淘汰最久未使用的用户、命中和未命中计数、加载失败后不会留下正在加载的记录
+（之后可以重新加载），以及无效的用户ID直接被拒绝
+
+用法:
+python -m pytest src/test_multi_user.py
+"""
+
+import os
+import sys
+import pytest
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.model_bundle import DEFAULT_BUNDLE_PATH
+from src.multi_user import MultiUserRegistry, install_bundle
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUNDLE_PATH = os.path.join(ROOT, DEFAULT_BUNDLE_PATH)
+
+@pytest.fixture
+def models_dir(tmp_path):
+    for user_id in ("alice", "bob", "carol"):
+        install_bundle(user_id, BUNDLE_PATH, str(tmp_path))
+    return str(tmp_path)
+
+def user_bytes(models_dir):
+    """一个用户的模型常驻内存的字节数（所有用户使用同一个模型包，各用户的字节数只有很小的差别）"""
+    registry = MultiUserRegistry(models_dir)
+    try:
+        registry.get_models("alice")
+        return registry.stats()["resident_bytes"]
+    finally:
+        registry.close()
+
+def test_lru_eviction_under_budget(models_dir):
+    size = user_bytes(models_dir)
+    registry = MultiUserRegistry(models_dir, memory_budget=int(size * 2.5))
+    try:
+        registry.get_models("alice")
+        registry.get_models("bob")
+        # 再次使用alice，bob成为最久未使用的用户
+        registry.get_models("alice")
+        registry.get_models("carol")
+        stats = registry.stats()
+        assert stats["evictions"] == 1
+        assert [user_id for user_id, _ in stats["users"]] == ["carol", "alice"]
+        assert stats["resident_bytes"] == sum(size for _, size in stats["users"]) <= stats["memory_budget"]
+        assert not registry.is_resident("bob")
+
+        # 被淘汰的用户重新加载，同时淘汰alice
+        registry.get_models("bob")
+        assert [user_id for user_id, _ in registry.stats()["users"]] == ["bob", "carol"]
+    finally:
+        registry.close()
+
+def test_hit_and_miss_counters(models_dir):
+    registry = MultiUserRegistry(models_dir)
+    try:
+        first = registry.get_models("alice")
+        assert registry.get_models("alice") is first
+        registry.get_models("alice")
+        registry.prefetch("bob").result()
+        registry.get_models("bob")
+        stats = registry.stats()
+        assert (stats["hits"], stats["misses"], stats["loads"]) == (3, 1, 2)
+        assert stats["hit_rate"] == pytest.approx(0.75)
+        assert stats["loading"] == 0
+    finally:
+        registry.close()
+
+def test_load_error_clears_pending(models_dir):
+    registry = MultiUserRegistry(models_dir)
+    try:
+        with pytest.raises(FileNotFoundError):
+            registry.get_models("dave")
+        stats = registry.stats()
+        assert stats["load_errors"] == 1 and stats["loading"] == 0
+        assert "dave" not in registry._pending
+
+        # 安装模型后重新加载，不会拿到失败的Future
+        install_bundle("dave", BUNDLE_PATH, models_dir)
+        assert "rf" in registry.get_models("dave")
+        assert registry.stats()["loads"] == 1
+    finally:
+        registry.close()
+
+@pytest.mark.parametrize("user_id", ["", "../alice", ".hidden", "a/b", "x" * 200, None])
+def test_invalid_user_id(models_dir, user_id):
+    registry = MultiUserRegistry(models_dir)
+    try:
+        with pytest.raises(ValueError):
+            registry.get_models(user_id)
+        with pytest.raises(ValueError):
+            registry.prefetch(user_id)
+        stats = registry.stats()
+        assert (stats["misses"], stats["loading"], stats["load_errors"]) == (0, 0, 0)
+    finally:
+        registry.close()
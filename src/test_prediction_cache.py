@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试预测结果缓存
+检查模型预测失败（返回None）时不写入缓存，以及不同模型包版本的条目互不影响
+
+用法:
+python -m pytest src/test_prediction_cache.py
+"""
+
+import os
+import sys
+import numpy as np
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.prediction_cache import PredictionCache
+
+class VersionedModels(dict):
+    """带模型包版本的模型字典（与load_models()返回的LazyModels一样有version属性）"""
+
+    def __init__(self, version):
+        super().__init__()
+        self.version = version
+
+def counting_predict(values):
+    """返回固定预测值的predict_fn，并记录被调用的行数"""
+    calls = []
+    def predict_fn(X):
+        calls.append(len(X))
+        return None if values is None else np.full(len(X), values)
+    return predict_fn, calls
+
+def test_failed_prediction_is_not_cached(tmp_path):
+    cache = PredictionCache(db_path=str(tmp_path / "cache.sqlite"))
+    models = VersionedModels("v1")
+    X = np.array([[1.0, 2.0], [3.0, np.nan]])
+
+    failing, _ = counting_predict(None)
+    assert cache.predict(X, models, failing) is None
+    assert cache.stats()["size"] == 0
+    assert cache.stats()["disk_size"] == 0
+
+    # 之后的预测重新调用模型，而不是命中失败的结果
+    predict_fn, calls = counting_predict(7.0)
+    assert np.array_equal(cache.predict(X, models, predict_fn), [7.0, 7.0])
+    assert calls == [2]
+
+    # 没有模型包版本（不使用缓存）时同样返回None
+    assert cache.predict(X, VersionedModels(None), failing) is None
+
+def test_versions_are_kept_apart(tmp_path):
+    cache = PredictionCache(db_path=str(tmp_path / "cache.sqlite"))
+    X = np.array([[1.0, 2.0]])
+    first, first_calls = counting_predict(6.0)
+    second, second_calls = counting_predict(8.0)
+
+    assert cache.predict(X, VersionedModels("v1"), first)[0] == 6.0
+    assert cache.predict(X, VersionedModels("v2"), second)[0] == 8.0
+    # 切换回v1时原有条目仍然命中
+    assert cache.predict(X, VersionedModels("v1"), first)[0] == 6.0
+    assert cache.predict(X, VersionedModels("v2"), second)[0] == 8.0
+    assert first_calls == [1]
+    assert second_calls == [1]
+    assert cache.stats()["disk_size"] == 2
+
+    assert cache.keep_version("v2") == 1
+    assert cache.stats()["disk_size"] == 1
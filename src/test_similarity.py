@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试相似作品检索
+把倒排索引的查询结果与逐部作品计算IDF加权Jaccard相似度的暴力实现对比（cleaned_data.json中的作品），
+包括排除查询作品本身、相似度相同时编号小的优先（前n名的边界上也是如此），以及kNN评分
+
+用法:
+python -m pytest src/test_similarity.py
+"""
+
+import math
+import os
+import sys
+import numpy as np
+import pytest
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.similarity import FIELD_WEIGHTS, SimilarityIndex, _tokens, load_records
+
+def brute_force(records, movie, n, exclude_titles=(), min_similarity=0.0):
+    """逐部作品计算相似度，返回按(相似度降序, 编号升序)排列的前n个(编号, 相似度)"""
+    counts = {}
+    for record in records:
+        for field in FIELD_WEIGHTS:
+            for token in _tokens(record.get(field)):
+                counts[(field, token)] = counts.get((field, token), 0) + 1
+    n_docs = len(records)
+    def weight(key):
+        if key not in counts:
+            return 0.0
+        return FIELD_WEIGHTS[key[0]] * math.log(1 + (n_docs - counts[key] + 0.5) / (counts[key] + 0.5))
+    def keys(record):
+        return {(field, token) for field in FIELD_WEIGHTS for token in _tokens(record.get(field))}
+
+    query_keys = keys(movie)
+    query_weight = sum(weight(key) for key in query_keys)
+    scored = []
+    for doc_id, record in enumerate(records):
+        if record.get("title") in exclude_titles:
+            continue
+        doc_keys = keys(record)
+        common = sum(weight(key) for key in query_keys & doc_keys)
+        if common == 0:
+            continue
+        similarity = common / (query_weight + sum(weight(key) for key in doc_keys) - common)
+        if similarity > min_similarity:
+            scored.append((doc_id, similarity))
+    # 浮点数的累加顺序不同，按12位有效数字判断相同的相似度
+    scored.sort(key=lambda item: (-round(item[1], 12), item[0]))
+    return scored[:n]
+
+def ranked(index, results):
+    """把query()的结果还原为(编号, 相似度)，同一标题有多部作品时按顺序对应"""
+    used = set()
+    pairs = []
+    for item in results:
+        doc_id = next(i for i in index.title_ids[item["title"]] if i not in used)
+        used.add(doc_id)
+        pairs.append((doc_id, item["similarity"]))
+    return pairs
+
+def assert_same(actual, expected):
+    assert [doc_id for doc_id, _ in actual] == [doc_id for doc_id, _ in expected]
+    assert np.allclose([s for _, s in actual], [s for _, s in expected], rtol=1e-12)
+
+@pytest.fixture(scope="module")
+def records():
+    return load_records()
+
+@pytest.mark.parametrize("n", [1, 5, 20])
+def test_query_matches_brute_force(records, n):
+    index = SimilarityIndex(records)
+    for record in records[:60]:
+        exclude = {record.get("title")}
+        expected = brute_force(records, record, n, exclude)
+        assert_same(ranked(index, index.query(record, n, exclude)), expected)
+        assert record.get("title") not in {item["title"] for item in index.query(record, n, exclude)}
+
+def test_knn_score_matches_brute_force(records):
+    index = SimilarityIndex(records)
+    for record in records[:60]:
+        exclude = {record.get("title")}
+        neighbours = [(doc_id, s) for doc_id, s in brute_force(records, record, 10, exclude)
+                      if records[doc_id].get("user_score") is not None]
+        knn = index.knn_score(record, 10, exclude)
+        if not neighbours:
+            assert knn is None
+            continue
+        expected = (sum(s * float(records[doc_id]["user_score"]) for doc_id, s in neighbours) /
+                    sum(s for _, s in neighbours))
+        assert knn == pytest.approx(expected, rel=1e-12)
+
+@pytest.mark.parametrize("n", [1, 2, 3, 7, 12])
+def test_ties_prefer_smaller_ids(n):
+    # 多部作品的标签完全相同，相似度相同，前n名（包括边界上）按编号从小到大
+    records = [{"title": "其他", "genre": ["动画"]}]
+    for i in range(30):
+        records.append({"title": f"作品{i}", "genre": ["剧情", "爱情"] if i % 3 else ["剧情"],
+                        "region": ["美国"]})
+    records.append({"title": "作品0", "genre": ["剧情", "爱情"], "region": ["美国"]})
+    index = SimilarityIndex(records)
+    movie = {"genre": ["剧情", "爱情"], "region": ["美国"]}
+    for exclude in (None, {"作品0", "作品1"}):
+        expected = brute_force(records, movie, n, exclude or ())
+        assert_same(ranked(index, index.query(movie, n, exclude)), expected)
+    # 排除标题时同名的作品全部排除
+    titles = [item["title"] for item in index.query(movie, 40, {"作品0"})]
+    assert "作品0" not in titles and len(titles) == 29
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试稀疏特征上的Ridge
+检查直接用列式存储构建的稀疏矩阵与逐条记录构建的一致，稀疏训练与在同一矩阵的稠密形式上训练的结果一致，
+以及保存为模型包成员后predict_with_ensemble()对稀疏矩阵使用该成员预测
+
+用法:
+python -m pytest src/test_sparse_encoding.py
+"""
+
+import os
+import sys
+import numpy as np
+import scipy.sparse as sp
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.columnar_store import EncodedStore
+from src.load_models import predict_with_ensemble
+from src.model_bundle import ModelBundle, write_bundle
+from src.sparse_encoding import MEMBER_NAME, SparseRidge, open_training_store
+from src.train import make_estimator
+
+def fitted_model():
+    """在列式存储的偶数行上训练的模型，以及存储、训练行和标签"""
+    store = open_training_store()
+    labels = np.asarray(store.numeric())[:, store.numeric_columns.index("user_score")]
+    rows = np.flatnonzero(~np.isnan(labels))[::2]
+    return SparseRidge().fit_store(store, rows, labels[rows], {"alpha": 10.0}), store, rows, labels[rows]
+
+def test_store_matches_records():
+    model, store, _, _ = fitted_model()
+    X = model.transform_store(store)
+    assert sp.isspmatrix_csr(X) and X.shape == (store.n_rows, model.n_features)
+    expected = model.transform(list(store.iter_records()))
+    assert abs(X - expected).max() == 0
+    assert not np.isnan(X.data).any()
+    # 训练时没有出现过的类别被忽略
+    record = {"title": "新片", "year": 2024, "douban_score": None, "watch_time": "2024-05",
+              "region": ["美国"], "genre": ["剧情"], "director": ["不存在的导演"], "cast": []}
+    assert model.transform(record).shape == (1, model.n_features)
+
+def test_sparse_fit_matches_dense():
+    model, store, rows, y = fitted_model()
+    X = model.transform_store(store, rows)
+    dense = make_estimator("ridge", {"alpha": 10.0}).fit(X.toarray(), y)
+    # 稀疏矩阵上Ridge使用迭代求解器（默认容差1e-4），与稠密的闭式解只在容差范围内一致
+    assert np.allclose(model.predict(X), dense.predict(X.toarray()), atol=1e-3)
+    assert model.n_features == len(model.feature_names())
+
+def test_bundle_member_predicts_sparse(tmp_path):
+    model, store, _, _ = fitted_model()
+    path = str(tmp_path / "ensemble.bundle")
+    write_bundle(path, {MEMBER_NAME: model}, ["douban_score"])
+    models = ModelBundle(path).models()
+    X = model.transform_store(store)
+    assert np.array_equal(predict_with_ensemble(X, models), model.predict(X))
+
+    # 没有稀疏成员的模型包不能预测稀疏矩阵
+    write_bundle(path, {"ridge": make_estimator("ridge", {})}, ["douban_score"])
+    assert predict_with_ensemble(X, ModelBundle(path).models()) is None
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试扁平化树模型
+用模型包中的决策树和随机森林检查FlatTreeEnsemble与sklearn的预测结果一致（包括含缺失值的行），
+以及导出为数组后恢复的结果不变
+
+用法:
+python -m pytest src/test_tree_export.py
+"""
+
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.features import get_vectorizer
+from src.load_models import load_models
+from src.tree_export import FlatTreeEnsemble
+
+# 扁平化遍历与sklearn的最大允许误差
+TOLERANCE = 1e-12
+
+def make_inputs(models, n_rows=3000, nan_rate=0.1, seed=42):
+    """
+    测试输入：数据集中的真实作品（豆瓣评分缺失时保留为nan），加上以训练集均值为中心的随机行，
+    随机行中按nan_rate的比例设置缺失值
+
+    返回:
+    (imputer填充后的矩阵, 含缺失值的矩阵) 元组
+    """
+    with open("data/cleaned_data.json", "r", encoding="utf-8") as f:
+        records = json.load(f)
+    real = get_vectorizer(models["feature_names"]).transform(records)
+
+    imputer = models["imputer"]
+    rng = np.random.default_rng(seed)
+    center = np.asarray(imputer.statistics_, dtype=np.float64)
+    random_rows = rng.normal(center, np.abs(center) * 0.1 + 0.5, size=(n_rows, len(center)))
+    random_rows[rng.random(random_rows.shape) < nan_rate] = np.nan
+
+    with_nan = np.vstack([real, random_rows])
+    dense = imputer.transform(pd.DataFrame(with_nan, columns=imputer.feature_names_in_))
+    return dense, with_nan
+
+def test_flat_trees_match_sklearn():
+    models = load_models()
+    dense, with_nan = make_inputs(models)
+    for name in ("dt", "rf"):
+        model = models[name]
+        flat = FlatTreeEnsemble.from_model(model)
+        for X in (dense, with_nan):
+            for batch_size in (1, 100, len(X)):
+                diff = np.max(np.abs(flat.predict(X[:batch_size]) - model.predict(X[:batch_size])))
+                assert diff <= TOLERANCE, f"{name} 批大小{batch_size}的最大误差为{diff}"
+
+def test_array_round_trip():
+    models = load_models()
+    _, with_nan = make_inputs(models, n_rows=500)
+    for name in ("dt", "rf"):
+        flat = FlatTreeEnsemble.from_model(models[name])
+        restored = FlatTreeEnsemble.from_arrays(flat.to_arrays())
+        assert restored.n_trees == flat.n_trees
+        assert np.array_equal(restored.predict(with_nan), flat.predict(with_nan))
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+超参数搜索
+在进程池中对Ridge、决策树、随机森林和K近邻进行网格搜索（与03-model_training中的参数网格相同）：
+- 每一折的训练/验证矩阵（在该折训练部分上拟合imputer后填充）只构建一次，
+  保存在折存储（fold_store.py）中，工作进程以内存映射方式共享；训练数据没有变化时直接复用
+- 每个(模型, 参数, 折)的得分缓存在磁盘上，按该折数据的内容哈希区分，
+  重新运行时只计算新的参数组合或数据发生变化的折
+- 选出的参数写入models/best_params.json，save_models.py训练时自动读取
+
+用法:
+python src/train.py                         搜索ridge、dt、rf的参数
+python src/train.py --models knn --jobs 4
+python src/train.py --fit                   搜索后用最佳参数重新训练并保存模型
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.fold_store import DEFAULT_FOLD_STORE_DIR, open_fold_store
+
+# 参数网格（与notebooks/03-model_training.ipynb一致，Ridge补充了alpha的候选值）
+PARAM_GRIDS = {
+    "ridge": {
+        "alpha": [0.01, 0.1, 1.0, 10.0, 100.0],
+    },
+    "knn": {
+        "n_neighbors": [3, 5, 7, 9, 11, 13, 15],
+        "weights": ["uniform", "distance"],
+        "p": [1, 1.5, 2],
+    },
+    "dt": {
+        "max_depth": [None, 5, 10, 15, 20],
+        "min_samples_split": [2, 5, 10],
+        "min_samples_leaf": [1, 3, 5],
+    },
+    "rf": {
+        "n_estimators": [50, 100, 200],
+        "max_depth": [None, 5, 10, 15],
+        "min_samples_split": [2, 5, 10],
+        "min_samples_leaf": [1, 3, 5],
+    },
+}
+
+# 集成中使用的模型及save_models.py原先使用的参数（没有搜索结果时使用）
+DEFAULT_PARAMS = {
+    "ridge": {"alpha": 10.0},
+    "dt": {"max_depth": 5, "min_samples_leaf": 5, "min_samples_split": 2},
+    "rf": {"n_estimators": 200, "max_depth": 5, "min_samples_leaf": 5, "min_samples_split": 2},
+}
+
+# 默认路径
+DEFAULT_PARAMS_PATH = "models/best_params.json"
+# 得分缓存的目录（折矩阵在折存储中）
+DEFAULT_CACHE_DIR = "models/search_cache"
+
+def make_estimator(name, params):
+    """
+    根据名称和参数创建模型（树模型固定random_state=42，保证结果可复现）
+
+    参数:
+    name: ridge、knn、dt或rf
+    params: 参数字典
+    """
+    if name == "ridge":
+        from sklearn.linear_model import Ridge
+        return Ridge(**params)
+    if name == "knn":
+        from sklearn.neighbors import KNeighborsRegressor
+        return KNeighborsRegressor(**params)
+    if name == "dt":
+        from sklearn.tree import DecisionTreeRegressor
+        return DecisionTreeRegressor(random_state=42, **params)
+    if name == "rf":
+        from sklearn.ensemble import RandomForestRegressor
+        return RandomForestRegressor(random_state=42, **params)
+    raise ValueError(f"未知的模型: {name}")
+
+def expand_grid(grid):
+    """把参数网格展开为参数字典列表（顺序与GridSearchCV一致，按参数名排序后做笛卡尔积）"""
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+def load_training_split(test_size=0.2, random_state=42):
+    """
+    按save_models.py的方式划分训练集和测试集（从折存储读取，训练数据没有变化时不重新加载和构建特征）
+
+    返回:
+    (X_train, X_test, y_train, y_test) 元组，X为DataFrame
+    """
+    return open_fold_store(test_size, random_state).split()
+
+def _score_key(name, params, fold_key):
+    return f"{name}|{json.dumps(params, sort_keys=True)}|{fold_key}"
+
+class ScoreCache:
+    """
+    (模型, 参数, 折) 得分的磁盘缓存，以追加方式写入JSON Lines文件
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.scores = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 中断时可能留下不完整的最后一行
+                        continue
+                    self.scores[entry["key"]] = entry["score"]
+
+    def get(self, key):
+        return self.scores.get(key)
+
+    def add(self, key, score):
+        self.scores[key] = score
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"key": key, "score": score}) + "\n")
+
+def _evaluate(name, params, fold):
+    """在工作进程中训练并计算验证集的负均方误差（与GridSearchCV的scoring一致）"""
+    X_train = np.load(fold["X_train"], mmap_mode="r")
+    y_train = np.load(fold["y_train"], mmap_mode="r")
+    X_valid = np.load(fold["X_valid"], mmap_mode="r")
+    y_valid = np.load(fold["y_valid"], mmap_mode="r")
+    model = make_estimator(name, params)
+    model.fit(X_train, y_train)
+    error = model.predict(X_valid) - y_valid
+    return -float(np.mean(error * error))
+
+def search_folds(folds, model_names=("ridge", "dt", "rf"), jobs=None, cache_dir=DEFAULT_CACHE_DIR,
+                 param_grids=None, verbose=True):
+    """
+    在已经构建好的折上并行网格搜索（FoldStore.folds()的结果）
+
+    参数:
+    folds: 折信息列表，每项包含key和X_train、y_train、X_valid、y_valid的.npy文件路径
+    model_names: 需要搜索的模型
+    jobs: 进程数，None或0表示使用CPU核心数
+    cache_dir: 得分缓存的目录
+    param_grids: 参数网格，None表示使用PARAM_GRIDS
+    verbose: 是否输出进度
+
+    返回:
+    {模型名称: {"params": 最佳参数, "cv_mse": 平均均方误差, "evaluated": 新计算的数量, "cached": 命中缓存的数量}}
+    """
+    param_grids = param_grids or PARAM_GRIDS
+    cache = ScoreCache(os.path.join(cache_dir, "scores.jsonl"))
+
+    candidates = {name: expand_grid(param_grids[name]) for name in model_names}
+    pending = [(name, params, fold) for name in model_names for params in candidates[name]
+               for fold in folds if cache.get(_score_key(name, params, fold["key"])) is None]
+
+    if verbose:
+        total = sum(len(c) for c in candidates.values()) * len(folds)
+        print(f"共 {total} 次训练，其中 {total - len(pending)} 次命中缓存，需要计算 {len(pending)} 次")
+
+    evaluated = {name: 0 for name in model_names}
+    if pending:
+        workers = jobs or os.cpu_count() or 1
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(task, pool.submit(_evaluate, *task)) for task in pending]
+            for done, ((name, params, fold), future) in enumerate(futures, start=1):
+                # 每完成一次就写入缓存，中断后重新运行可以继续
+                cache.add(_score_key(name, params, fold["key"]), future.result())
+                evaluated[name] += 1
+                if verbose and (done % 50 == 0 or done == len(futures)):
+                    print(f"已完成 {done}/{len(futures)}，耗时 {time.perf_counter() - start:.1f} 秒")
+
+    results = {}
+    for name in model_names:
+        best = None
+        for params in candidates[name]:
+            mean_score = float(np.mean([cache.get(_score_key(name, params, fold["key"])) for fold in folds]))
+            # 得分相同时保留网格中靠前的参数（与GridSearchCV的排名一致）
+            if best is None or mean_score > best[1]:
+                best = (params, mean_score)
+        results[name] = {
+            "params": best[0],
+            "cv_mse": -best[1],
+            "evaluated": evaluated[name],
+            "cached": len(candidates[name]) * len(folds) - evaluated[name],
+        }
+    return results
+
+def save_best_params(results, path=DEFAULT_PARAMS_PATH, n_splits=5):
+    """
+    把搜索结果合并写入最佳参数文件（未参与本次搜索的模型保留原有结果）
+
+    参数:
+    results: search_folds()的返回值
+    path: 输出文件路径
+    n_splits: 交叉验证折数
+    """
+    data = {"models": {}}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    for name, result in results.items():
+        data["models"][name] = {"params": result["params"], "cv_mse": result["cv_mse"], "cv": n_splits}
+    data["updated_at"] = datetime.datetime.now().isoformat(timespec="seconds")
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def load_best_params(path=DEFAULT_PARAMS_PATH):
+    """
+    读取集成模型各成员的参数，没有搜索结果的成员使用DEFAULT_PARAMS
+
+    返回:
+    {模型名称: 参数字典}
+    """
+    params = {name: dict(values) for name, values in DEFAULT_PARAMS.items()}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for name, result in data.get("models", {}).items():
+            params[name] = dict(result["params"])
+    return params
+
+def main():
+    parser = argparse.ArgumentParser(description="并行超参数搜索")
+    parser.add_argument("--models", nargs="+", default=["ridge", "dt", "rf"], choices=sorted(PARAM_GRIDS),
+                        help="需要搜索的模型")
+    parser.add_argument("--cv", type=int, default=5, help="交叉验证折数")
+    parser.add_argument("--jobs", type=int, default=0, help="进程数，0表示使用全部CPU核心")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="得分缓存的目录")
+    parser.add_argument("--fold-store", default=DEFAULT_FOLD_STORE_DIR, help="折存储的根目录")
+    parser.add_argument("--output", default=DEFAULT_PARAMS_PATH, help="最佳参数文件")
+    parser.add_argument("--fit", action="store_true", help="搜索后用最佳参数重新训练并保存模型")
+    args = parser.parse_args()
+
+    # 折矩阵由折存储构建一次，之后的运行直接以内存映射方式读取
+    folds = open_fold_store(root=args.fold_store).folds(args.cv)
+    results = search_folds(folds, args.models, args.jobs, args.cache_dir)
+
+    for name, result in results.items():
+        print(f"- {name}: 均方误差 {result['cv_mse']:.4f}，参数 {result['params']} "
+              f"(新计算 {result['evaluated']}，缓存 {result['cached']})")
+    save_best_params(results, args.output, args.cv)
+    print(f"最佳参数已保存到 {args.output}")
+
+    if args.fit:
+        from src import save_models
+        save_models.main()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+树模型扁平化
+把随机森林和决策树导出为连续的NumPy数组（特征、阈值、左右子节点、叶子值），
+并用一次向量化遍历同时计算所有树的预测结果，避免sklearn逐棵树调用的开销
+
+用法:
+python src/tree_export.py export      导出models/flat_trees.npz
+python src/tree_export.py benchmark   与sklearn的预测结果和速度进行对比
+"""
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+# 添加项目根目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 每次遍历的最大(行数 × 树数)，限制中间数组的内存占用
+MAX_CELLS_PER_PASS = 1 << 16
+
+# 扁平化遍历在小批量时远快于sklearn，批量较大时sklearn的Cython实现更快，
+# predict_with_ensemble只在行数不超过该值时使用扁平化模型
+FLAT_TREE_MAX_ROWS = 1024
+
+class FlatTreeEnsemble:
+    """
+    扁平化的树集成：所有树的节点保存在同一组连续数组中，
+    predict()的结果与sklearn的predict()一致（平均所有树的叶子值）
+    """
+
+    def __init__(self, feature, threshold, left, right, value, missing_left, roots, max_depth, n_features):
+        """
+        参数:
+        feature: 每个节点的分裂特征（叶子节点为0）
+        threshold: 每个节点的分裂阈值
+        left, right: 左右子节点的全局下标（叶子节点指向自身）
+        value: 每个节点的预测值
+        missing_left: 特征缺失(nan)时是否走左子节点
+        roots: 每棵树根节点的全局下标
+        max_depth: 所有树的最大深度
+        n_features: 输入特征数量
+        """
+        self.feature = np.ascontiguousarray(feature, dtype=np.intp)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.left = np.ascontiguousarray(left, dtype=np.intp)
+        self.right = np.ascontiguousarray(right, dtype=np.intp)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.missing_left = np.ascontiguousarray(missing_left, dtype=bool)
+        self.roots = np.ascontiguousarray(roots, dtype=np.intp)
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+        self.n_features_in_ = self.n_features
+
+        # 遍历时使用的紧凑数组：children[2 * node + 是否走左子节点]即下一个节点
+        self._feature32 = self.feature.astype(np.int32)
+        self._children = np.stack([self.right, self.left], axis=1).ravel().astype(np.int32)
+        self._roots32 = self.roots.astype(np.int32)
+
+    @property
+    def n_trees(self):
+        """树的数量"""
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        """所有树的节点总数"""
+        return len(self.feature)
+
+    @classmethod
+    def from_estimators(cls, estimators, n_features):
+        """
+        从sklearn的决策树列表构建
+
+        参数:
+        estimators: DecisionTreeRegressor列表（如随机森林的estimators_）
+        n_features: 输入特征数量
+        """
+        features, thresholds, lefts, rights, values, missing, roots = [], [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+
+        for estimator in estimators:
+            tree = estimator.tree_
+            n = tree.node_count
+            left = tree.children_left.astype(np.intp)
+            right = tree.children_right.astype(np.intp)
+            is_leaf = left == -1
+            own = np.arange(n, dtype=np.intp)
+
+            # 叶子节点指向自身，遍历到叶子后保持不动
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+            lefts.append(np.where(is_leaf, own, left) + offset)
+            rights.append(np.where(is_leaf, own, right) + offset)
+            values.append(tree.value.reshape(n, -1)[:, 0])
+            if hasattr(tree, "missing_go_to_left"):
+                missing.append(tree.missing_go_to_left.astype(bool))
+            else:
+                missing.append(np.zeros(n, dtype=bool))
+            roots.append(offset)
+
+            offset += n
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(np.concatenate(features), np.concatenate(thresholds), np.concatenate(lefts),
+                   np.concatenate(rights), np.concatenate(values), np.concatenate(missing),
+                   np.array(roots), max_depth, n_features)
+
+    @classmethod
+    def from_model(cls, model):
+        """从随机森林或单棵决策树构建"""
+        estimators = getattr(model, "estimators_", None)
+        if estimators is None:
+            estimators = [model]
+        return cls.from_estimators(estimators, model.n_features_in_)
+
+    def apply(self, X, tree_slice=None):
+        """
+        计算每一行在每棵树中到达的叶子节点
+
+        参数:
+        X: 形状为(行数, 特征数)的特征矩阵
+        tree_slice: 只遍历部分树时传入的slice
+
+        返回:
+        形状为(行数, 树数)的叶子节点下标
+        """
+        # 与sklearn一致：比较前把输入转换为float32
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        roots = self._roots32 if tree_slice is None else self._roots32[tree_slice]
+        has_nan = bool(np.isnan(X).any())
+
+        # 第一层：根节点的特征和阈值对所有行相同，直接按列取值
+        x = X[:, self._feature32[roots]]
+        go_left = x <= self.threshold[roots]
+        if has_nan:
+            go_left |= np.isnan(x) & self.missing_left[roots]
+        nodes = self._children[2 * roots + go_left]
+
+        flat_X = X.ravel()
+        row_offset = (np.arange(X.shape[0], dtype=np.int32) * self.n_features)[:, None]
+        for _ in range(self.max_depth - 1):
+            x = flat_X[row_offset + self._feature32[nodes]]
+            go_left = x <= self.threshold[nodes]
+            if has_nan:
+                go_left |= np.isnan(x) & self.missing_left[nodes]
+            nodes = self._children[2 * nodes + go_left]
+
+        return nodes
+
+    def predict_trees(self, X, tree_slice=None):
+        """
+        计算每棵树的预测值
+
+        返回:
+        形状为(行数, 树数)的预测值矩阵
+        """
+        return self.value[self.apply(X, tree_slice)]
+
+    def predict_sum(self, X, tree_slice=None):
+        """计算部分或全部树的预测值之和（用于并行时合并结果）"""
+        X = np.asarray(X)
+        n_trees = len(self.roots if tree_slice is None else self.roots[tree_slice])
+        rows_per_pass = max(1, MAX_CELLS_PER_PASS // max(n_trees, 1))
+        total = np.empty(X.shape[0], dtype=np.float64)
+        for start in range(0, X.shape[0], rows_per_pass):
+            stop = start + rows_per_pass
+            total[start:stop] = self.predict_trees(X[start:stop], tree_slice).sum(axis=1)
+        return total
+
+    def predict(self, X):
+        """
+        预测（所有树的平均值），与sklearn的predict()结果一致
+
+        参数:
+        X: 形状为(行数, 特征数)的特征矩阵
+
+        返回:
+        预测值数组
+        """
+        return self.predict_sum(X) / self.n_trees
+
+    def to_arrays(self):
+        """导出为数组字典，便于保存为.npz"""
+        return {
+            "feature": self.feature, "threshold": self.threshold,
+            "left": self.left, "right": self.right, "value": self.value,
+            "missing_left": self.missing_left, "roots": self.roots,
+            "max_depth": np.array(self.max_depth), "n_features": np.array(self.n_features),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix=""):
+        """从to_arrays()导出的数组字典恢复"""
+        return cls(*(arrays[prefix + name] for name in
+                     ("feature", "threshold", "left", "right", "value", "missing_left", "roots")),
+                   int(arrays[prefix + "max_depth"]), int(arrays[prefix + "n_features"]))
+
+def flatten_models(models):
+    """
+    把模型字典中的随机森林和决策树替换为扁平化版本
+
+    参数:
+    models: 从load_models()加载的模型字典
+
+    返回:
+    新的模型字典（原字典不变）
+    """
+    flat = dict(models)
+    for name in ("dt", "rf"):
+        if name in flat and not isinstance(flat[name], FlatTreeEnsemble):
+            flat[name] = FlatTreeEnsemble.from_model(flat[name])
+    return flat
+
+def export_flat_models(models, path="models/flat_trees.npz"):
+    """
+    把随机森林和决策树导出为一个.npz文件
+
+    参数:
+    models: 从load_models()加载的模型字典
+    path: 输出文件路径
+    """
+    arrays = {}
+    for name in ("dt", "rf"):
+        if name in models:
+            flat = models[name]
+            if not isinstance(flat, FlatTreeEnsemble):
+                flat = FlatTreeEnsemble.from_model(flat)
+            arrays.update({f"{name}_{key}": value for key, value in flat.to_arrays().items()})
+    np.savez(path, **arrays)
+
+def load_flat_models(path="models/flat_trees.npz"):
+    """
+    加载export_flat_models()导出的文件
+
+    返回:
+    {"dt": FlatTreeEnsemble, "rf": FlatTreeEnsemble} 字典（只包含文件中存在的模型）
+    """
+    flat = {}
+    with np.load(path) as arrays:
+        for name in ("dt", "rf"):
+            if f"{name}_roots" in arrays:
+                flat[name] = FlatTreeEnsemble.from_arrays(arrays, f"{name}_")
+    return flat
+
+def benchmark(models, batch_sizes=(1, 100, 100000), repeat=5):
+    """
+    对比扁平化遍历与sklearn的预测结果和耗时
+
+    参数:
+    models: 从load_models()加载的模型字典
+    batch_sizes: 测试的批大小
+    repeat: 每个批大小重复的次数（取最快的一次）
+
+    返回:
+    结果列表，每项包含model、batch_size、sklearn_ms、flat_ms和max_abs_diff
+    """
+    rng = np.random.default_rng(42)
+    imputer = models.get("imputer")
+    results = []
+
+    for name in ("dt", "rf"):
+        if name not in models:
+            continue
+        model = models[name]
+        flat = FlatTreeEnsemble.from_model(model)
+
+        for batch_size in batch_sizes:
+            # 以训练集均值为中心生成随机输入，地区和类型特征为0/1
+            center = imputer.statistics_ if imputer is not None else np.zeros(model.n_features_in_)
+            X = rng.normal(center, np.abs(center) * 0.1 + 0.5, size=(batch_size, model.n_features_in_))
+            X[:, (center >= 0) & (center <= 1)] = rng.random((batch_size, int(((center >= 0) & (center <= 1)).sum()))) < 0.1
+
+            timings = {}
+            for label, fn in (("sklearn", model.predict), ("flat", flat.predict)):
+                best = float("inf")
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    pred = fn(X)
+                    best = min(best, time.perf_counter() - start)
+                timings[label] = (best * 1000, pred)
+
+            results.append({
+                "model": name,
+                "batch_size": batch_size,
+                "sklearn_ms": timings["sklearn"][0],
+                "flat_ms": timings["flat"][0],
+                "max_abs_diff": float(np.max(np.abs(timings["sklearn"][1] - timings["flat"][1]))),
+            })
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="树模型扁平化导出与基准测试")
+    parser.add_argument("command", choices=["export", "benchmark"], help="export: 导出扁平化模型；benchmark: 与sklearn对比")
+    parser.add_argument("--models-dir", default="models", help="模型目录")
+    parser.add_argument("--output", default=None, help="导出文件路径，默认为<models-dir>/flat_trees.npz")
+    args = parser.parse_args()
+
+    from src.load_models import load_models
+    models = load_models(args.models_dir)
+
+    if args.command == "export":
+        output = args.output or os.path.join(args.models_dir, "flat_trees.npz")
+        export_flat_models(models, output)
+        for name, flat in load_flat_models(output).items():
+            print(f"- {name}: {flat.n_trees} 棵树，{flat.n_nodes} 个节点，最大深度 {flat.max_depth}")
+        print(f"已导出到 {output}")
+    else:
+        print(f"{'模型':<6}{'批大小':>10}{'sklearn(ms)':>14}{'扁平化(ms)':>14}{'加速比':>10}{'最大误差':>12}")
+        for r in benchmark(models):
+            print(f"{r['model']:<6}{r['batch_size']:>10}{r['sklearn_ms']:>14.3f}{r['flat_ms']:>14.3f}"
+                  f"{r['sklearn_ms'] / r['flat_ms']:>10.1f}{r['max_abs_diff']:>12.2e}")
+
+if __name__ == "__main__":
+    main()